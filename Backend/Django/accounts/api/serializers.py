@@ -4,7 +4,9 @@ from django.forms import ValidationError
 from rest_framework import serializers, exceptions
 
 from accounts.models import UserProfile
-from friendships.models import Friendship
+from accounts.services import UserService
+from friendships.services import FriendshipService
+from utils.serializers import PrefetchListSerializer
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -26,12 +28,22 @@ class UserSerializerWithProfile(UserSerializer):
 
     def get_is_following(self, obj):
         request = self.context.get('request')
-        if request and hasattr(request, 'user'):
-            return Friendship.objects.filter(from_user=request.user, to_user=obj).exists()
-        return False
+        if request is None or request.user.is_anonymous:
+            return False
+        # read once per request and shared by all the nested user serializers
+        if 'following_user_id_set' not in self.context:
+            self.context['following_user_id_set'] = \
+                FriendshipService.get_following_user_id_set(request.user.id)
+        return obj.id in self.context['following_user_id_set']
+
+    def prefetch(self, users):
+        users = [user for user in users if user is not None]
+        UserService.prefetch_profiles(users)
+
     class Meta:
         model = User
         fields = ('id', 'username', 'nickname', 'avatar', 'is_following')
+        list_serializer_class = PrefetchListSerializer
 
 
 class UserSerializerForTweet(UserSerializerWithProfile):
@@ -136,6 +148,15 @@ class UserProfileSerializerForUpdate(serializers.ModelSerializer):
         model = UserProfile
         fields = ('nickname', 'avatar', 'dob', 'gender')
 
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # followers_count and followings_count are updated in place by the
+        # friendship listeners, saving the whole instance would overwrite them
+        # with the values loaded before
+        instance.save(update_fields=list(validated_data) + ['updated_at'])
+        return instance
+
 
 class UserProfileSerializerForPushTokenUpdate(serializers.ModelSerializer):
 
@@ -146,5 +167,6 @@ class UserProfileSerializerForPushTokenUpdate(serializers.ModelSerializer):
     def update(self, obj, validated_data):
         # Again, ensure the field name is consistent
         obj.expo_push_token = validated_data.get('expo_push_token', obj.expo_push_token)
-        obj.save()
+        # the counters might have changed since the profile was loaded
+        obj.save(update_fields=['expo_push_token', 'updated_at'])
         return obj
@@ -1,5 +1,10 @@
+from accounts.api.serializers import (
+    UserProfileSerializerForPushTokenUpdate,
+    UserProfileSerializerForUpdate,
+)
 from accounts.models import UserProfile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from friendships.models import Friendship
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 
@@ -9,6 +14,7 @@ LOGOUT_URL = '/api/accounts/logout/'
 SIGNUP_URL = '/api/accounts/signup/'
 LOGIN_STATUS_URL = '/api/accounts/login_status/'
 USER_PROFILE_DETAIL_URL = '/api/profiles/{}/'
+RECOMMENDED_USERS_URL = '/api/users/recommended_users/'
 
 
 class AccountApiTests(TestCase):
@@ -163,3 +169,67 @@ class UserProfileAPITests(TestCase):
         self.assertEqual('my-avatar' in response.data['avatar'], True)
         p.refresh_from_db()
         self.assertIsNotNone(p.avatar)
+
+    def test_update_keeps_counters(self):
+        linghu = self.create_user('linghu')
+        dongxie = self.create_user('dongxie')
+        profile = UserProfile.objects.get(id=linghu.profile.id)
+
+        # linghu is followed after the profile is loaded
+        Friendship.objects.create(from_user=dongxie, to_user=linghu)
+        serializer = UserProfileSerializerForUpdate(
+            profile,
+            data={'nickname': 'linghu'},
+            partial=True,
+        )
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.nickname, 'linghu')
+        self.assertEqual(profile.followers_count, 1)
+
+        profile = UserProfile.objects.get(user=linghu)
+        Friendship.objects.create(from_user=self.create_user('meimei'), to_user=linghu)
+        serializer = UserProfileSerializerForPushTokenUpdate(
+            profile,
+            data={'expo_push_token': 'token'},
+        )
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.expo_push_token, 'token')
+        self.assertEqual(profile.followers_count, 2)
+
+
+class UserApiTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+
+    def test_recommended_users(self):
+        linghu, linghu_client = self.create_user_and_client('linghu')
+        friends = [self.create_user('friend{}'.format(i)) for i in range(2)]
+        dongxie = self.create_user('dongxie')
+        user1 = self.create_user('user1')
+        for friend in friends:
+            Friendship.objects.create(from_user=friend, to_user=dongxie)
+        Friendship.objects.create(from_user=friends[0], to_user=user1)
+        Friendship.objects.create(from_user=friends[0], to_user=linghu)
+
+        response = self.anonymous_client.get(RECOMMENDED_USERS_URL)
+        self.assertEqual(response.status_code, 401)
+
+        # computed when the followings of linghu change
+        for friend in friends:
+            Friendship.objects.create(from_user=linghu, to_user=friend)
+        response = linghu_client.get(RECOMMENDED_USERS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [user['id'] for user in response.data],
+            [dongxie.id, user1.id],
+        )
+
+        # followed users are not recommended anymore
+        Friendship.objects.create(from_user=linghu, to_user=dongxie)
+        response = linghu_client.get(RECOMMENDED_USERS_URL)
+        self.assertEqual([user['id'] for user in response.data], [user1.id])
@@ -1,4 +1,3 @@
-import random
 from django.contrib.auth.models import User
 from rest_framework import viewsets, status
 from rest_framework import permissions
@@ -20,7 +19,11 @@ from django.contrib.auth import (
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from accounts.constants import SUGGESTED_USERS_COUNT
 from accounts.models import UserProfile
+from accounts.services import UserService
+from friendships.services import FriendshipService
+from utils.memcached_helper import MemcachedHelper
 from utils.permissions import IsObjectOwner
 
 
@@ -34,21 +37,16 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(methods=['GET'], detail=False)
     def random_users(self, request):
-        current_user = User.objects.get(id=request.user.id)
-        Users = User.objects.filter(
-                userprofile__nickname__isnull=False,
-            ).exclude(
-                id=current_user.id,
-            ).exclude(
-                id__in=current_user.following_friendship_set.values_list('to_user_id')
-            )
-        total_users = Users.count()
-        if total_users <= 3:
-            users = Users
-        else:
-            random_indices = random.sample(range(total_users), 3)
-            users = [Users[index] for index in random_indices]
+        user_ids = UserService.get_suggested_user_ids(request.user.id, SUGGESTED_USERS_COUNT)
+        users = MemcachedHelper.get_objects_through_cache(User, user_ids)
+        serializer = UserSerializerWithProfile(users, many=True)
+        return Response(serializer.data)
 
+    @action(methods=['GET'], detail=False)
+    def recommended_users(self, request):
+        # "people you may know", precomputed by compute_recommended_users_task
+        user_ids = FriendshipService.get_recommended_user_ids(request.user.id)
+        users = MemcachedHelper.get_objects_through_cache(User, user_ids)
         serializer = UserSerializerWithProfile(users, many=True)
         return Response(serializer.data)
 
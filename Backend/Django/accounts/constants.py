@@ -0,0 +1,8 @@
+from django.conf import settings
+
+# how many candidate user ids the random user suggestions are sampled from
+SUGGESTION_POOL_SIZE = 5 if settings.TESTING else 1000
+# the pool is read from this many random ranges of the user_id index
+SUGGESTION_POOL_RANGES = 10
+# how many users are suggested by one request
+SUGGESTED_USERS_COUNT = 3
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_friendship_counts(apps, schema_editor):
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    Friendship = apps.get_model('friendships', 'Friendship')
+
+    followers_counts = dict(Friendship.objects.values('to_user_id').annotate(
+        count=Count('id'),
+    ).values_list('to_user_id', 'count'))
+    followings_counts = dict(Friendship.objects.values('from_user_id').annotate(
+        count=Count('id'),
+    ).values_list('from_user_id', 'count'))
+
+    profiles = []
+    for profile in UserProfile.objects.filter(user_id__isnull=False).iterator():
+        profile.followers_count = followers_counts.get(profile.user_id, 0)
+        profile.followings_count = followings_counts.get(profile.user_id, 0)
+        profiles.append(profile)
+    UserProfile.objects.bulk_update(
+        profiles,
+        ['followers_count', 'followings_count'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_userprofile_gender'),
+        ('friendships', '0002_auto_20220225_1532'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='followings_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_friendship_counts, migrations.RunPython.noop),
+    ]
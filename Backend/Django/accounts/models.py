@@ -1,9 +1,9 @@
-# from accounts.listeners import profile_changed
+from accounts.listeners import profile_changed
 from datetime import date
 from django.contrib.auth.models import User
 from django.db import models
-# from django.db.models.signals import post_save, pre_delete
-# from utils.listeners import invalidate_object_cache
+from django.db.models.signals import post_save, pre_delete
+from utils.listeners import invalidate_object_cache
 
 
 class UserProfile(models.Model):
@@ -22,6 +22,9 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     expo_push_token = models.CharField(max_length=200, null=True, blank=True)
+    # denormalized from Friendship, maintained by the friendship listeners
+    followers_count = models.IntegerField(default=0)
+    followings_count = models.IntegerField(default=0)
     dob = models.DateField(verbose_name="Date of Birth", default=date(1995, 2, 14))
     gender = models.CharField(
         max_length=6,
@@ -42,21 +45,21 @@ class UserProfile(models.Model):
 def get_profile(user):
     from accounts.services import UserService
 
-    # if hasattr(user, '_cached_user_profile'):
-    #     return getattr(user, '_cached_user_profile')
+    if hasattr(user, '_cached_user_profile'):
+        return getattr(user, '_cached_user_profile')
     profile = UserService.get_profile_through_cache(user.id)
-    # # 使用 user 对象的属性进行缓存(cache)，避免多次调用同一个 user 的 profile 时
-    # # 重复的对数据库进行查询
-    # setattr(user, '_cached_user_profile', profile)
+    # 使用 user 对象的属性进行缓存(cache)，避免多次调用同一个 user 的 profile 时
+    # 重复的对数据库进行查询
+    setattr(user, '_cached_user_profile', profile)
     return profile
 
 
 # Add a property in django default User model
 User.profile = property(get_profile)
 
-# # hook up with listeners to invalidate cache
-# pre_delete.connect(invalidate_object_cache, sender=User)
-# post_save.connect(invalidate_object_cache, sender=User)
+# hook up with listeners to invalidate cache
+pre_delete.connect(invalidate_object_cache, sender=User)
+post_save.connect(invalidate_object_cache, sender=User)
 
-# pre_delete.connect(profile_changed, sender=UserProfile)
-# post_save.connect(profile_changed, sender=UserProfile)
\ No newline at end of file
+pre_delete.connect(profile_changed, sender=UserProfile)
+post_save.connect(profile_changed, sender=UserProfile)
\ No newline at end of file
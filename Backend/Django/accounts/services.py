@@ -1,9 +1,13 @@
+import random
+from accounts.constants import SUGGESTION_POOL_RANGES, SUGGESTION_POOL_SIZE
 from accounts.models import UserProfile
 from django.conf import settings
 from django.core.cache import caches
-from twitter.cache import USER_PROFILE_PATTERN
+from django.db.models import Max, Min
+from twitter.cache import SUGGESTION_POOL_KEY, USER_PROFILE_PATTERN
+from utils.local_cache import TwoLevelCache
 
-cache = caches['testing'] if settings.TESTING else caches['default']
+cache = TwoLevelCache(caches['testing'] if settings.TESTING else caches['default'])
 
 
 class UserService:
@@ -19,11 +23,137 @@ class UserService:
             return profile
 
         # cache miss, read from db
-        profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
+        profile = cls.get_or_create_profile(user_id)
         cache.set(key, profile)
         return profile
 
+    @classmethod
+    def get_or_create_profile(cls, user_id):
+        # import here to avoid circular dependency
+        from friendships.models import Friendship
+
+        profile = UserProfile.objects.filter(user_id=user_id).first()
+        if profile is not None:
+            return profile
+        # the counters of a profile created after the friendships are
+        # initialized from the friendships, except the ones of deleted users
+        profile, _ = UserProfile.objects.get_or_create(user_id=user_id, defaults={
+            'followers_count': Friendship.objects.filter(
+                to_user_id=user_id,
+                from_user_id__isnull=False,
+            ).count(),
+            'followings_count': Friendship.objects.filter(
+                from_user_id=user_id,
+                to_user_id__isnull=False,
+            ).count(),
+        })
+        return profile
+
+    @classmethod
+    def get_profiles_through_cache(cls, user_ids):
+        """
+        batch version of get_profile_through_cache, returns {user_id: profile}
+        """
+        user_ids = list(set(user_ids))
+        keys = [USER_PROFILE_PATTERN.format(user_id=user_id) for user_id in user_ids]
+        key_to_profile = cache.get_many(keys)
+        user_id_to_profile = {
+            user_id: key_to_profile[key]
+            for user_id, key in zip(user_ids, keys)
+            if key in key_to_profile
+        }
+
+        # cache miss, read all of them from db in one query
+        missed_user_ids = [
+            user_id for user_id in user_ids if user_id not in user_id_to_profile
+        ]
+        if not missed_user_ids:
+            return user_id_to_profile
+        missed_profiles = {
+            profile.user_id: profile
+            for profile in UserProfile.objects.filter(user_id__in=missed_user_ids)
+        }
+        for user_id in missed_user_ids:
+            if user_id not in missed_profiles:
+                missed_profiles[user_id] = cls.get_or_create_profile(user_id)
+        cache.set_many({
+            USER_PROFILE_PATTERN.format(user_id=user_id): profile
+            for user_id, profile in missed_profiles.items()
+        })
+        user_id_to_profile.update(missed_profiles)
+        return user_id_to_profile
+
+    @classmethod
+    def prefetch_profiles(cls, users):
+        user_id_to_profile = cls.get_profiles_through_cache([user.id for user in users])
+        for user in users:
+            # read by User.profile, see accounts.models.get_profile
+            user._cached_user_profile = user_id_to_profile[user.id]
+
     @classmethod
     def invalidate_profile(cls, user_id):
         key = USER_PROFILE_PATTERN.format(user_id=user_id)
         cache.delete(key)
+
+    @classmethod
+    def sample_user_ids(cls, count, exclude_user_ids=()):
+        """
+        sample up to count users with a nickname, read from random ranges of
+        the unique user_id index so every user can be sampled and each read
+        stays cheap however big the user table grows
+        """
+        queryset = UserProfile.objects.filter(
+            nickname__isnull=False,
+        ).exclude(user_id__in=exclude_user_ids).order_by('user_id')
+        bounds = UserProfile.objects.aggregate(Min('user_id'), Max('user_id'))
+        if bounds['user_id__min'] is None:
+            return []
+
+        user_ids = []
+        range_size = max(count // SUGGESTION_POOL_RANGES, 1)
+        for _ in range(SUGGESTION_POOL_RANGES):
+            if len(user_ids) >= count:
+                break
+            start = random.randint(bounds['user_id__min'], bounds['user_id__max'])
+            user_ids += queryset.filter(
+                user_id__gte=start,
+            ).exclude(user_id__in=user_ids).values_list('user_id', flat=True)[:range_size]
+        # the ranges starting near the end of the index are short
+        if len(user_ids) < count:
+            user_ids += queryset.exclude(
+                user_id__in=user_ids,
+            ).values_list('user_id', flat=True)[:count - len(user_ids)]
+        return user_ids
+
+    @classmethod
+    def refresh_suggestion_pool(cls):
+        user_ids = cls.sample_user_ids(SUGGESTION_POOL_SIZE)
+        cache.set(SUGGESTION_POOL_KEY, user_ids)
+        return user_ids
+
+    @classmethod
+    def get_suggested_user_ids(cls, user_id, count):
+        """
+        sample users the user doesn't follow yet from the suggestion pool,
+        which is refreshed by refresh_suggestion_pool_task
+        """
+        # import here to avoid circular dependency
+        from friendships.services import FriendshipService
+
+        pool = cache.get(SUGGESTION_POOL_KEY)
+        if pool is None:
+            pool = cls.refresh_suggestion_pool()
+        following_user_id_set = FriendshipService.get_following_user_id_set(user_id)
+        candidates = [
+            candidate_id
+            for candidate_id in pool
+            if candidate_id != user_id and candidate_id not in following_user_id_set
+        ]
+        # e.g. the user follows most of the pool already, top up from a
+        # sample of the other users
+        if len(candidates) < count:
+            candidates += cls.sample_user_ids(
+                count - len(candidates),
+                exclude_user_ids=[user_id, *following_user_id_set, *candidates],
+            )
+        return random.sample(candidates, min(count, len(candidates)))
@@ -0,0 +1,10 @@
+from accounts.services import UserService
+from celery import shared_task
+from utils.time_constants import ONE_MINUTE
+
+
+@shared_task(time_limit=ONE_MINUTE)
+def refresh_suggestion_pool_task():
+    # scheduled by celery beat, see twitter/celery.py
+    user_ids = UserService.refresh_suggestion_pool()
+    return '{} users in the suggestion pool.'.format(len(user_ids))
@@ -1,5 +1,10 @@
+from accounts.constants import SUGGESTION_POOL_SIZE
 from accounts.models import UserProfile
+from accounts.services import UserService
+from django.test import override_settings
+from friendships.models import Friendship
 from testing.testcases import TestCase
+from utils import local_cache
 
 
 class UserProfileTests(TestCase):
@@ -10,3 +15,81 @@ class UserProfileTests(TestCase):
         p = linghu.profile
         self.assertEqual(isinstance(p, UserProfile), True)
         self.assertEqual(UserProfile.objects.count(), 1)
+
+
+class UserServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+
+    def test_get_profiles_through_cache(self):
+        linghu = self.create_user('linghu')
+        dongxie = self.create_user('dongxie')
+        UserProfile.objects.create(user=linghu, nickname='linghu')
+
+        # missing profiles are created
+        profiles = UserService.get_profiles_through_cache([linghu.id, dongxie.id])
+        self.assertEqual(profiles[linghu.id].nickname, 'linghu')
+        self.assertEqual(profiles[dongxie.id].user_id, dongxie.id)
+        self.assertEqual(UserProfile.objects.count(), 2)
+
+        # cache hit
+        with self.assertNumQueries(0):
+            profiles = UserService.get_profiles_through_cache([linghu.id, dongxie.id])
+        self.assertEqual(profiles[linghu.id].nickname, 'linghu')
+
+    @override_settings(LOCAL_CACHE_ENABLED=True)
+    def test_profile_through_local_cache(self):
+        linghu = self.create_user('linghu')
+        UserProfile.objects.create(user=linghu, nickname='linghu')
+        UserService.get_profile_through_cache(linghu.id)
+
+        # served from the memory of the process
+        local_hits = local_cache.stats['local_hits']
+        with self.assertNumQueries(0):
+            profile = UserService.get_profile_through_cache(linghu.id)
+        self.assertEqual(profile.nickname, 'linghu')
+        self.assertEqual(local_cache.stats['local_hits'], local_hits + 1)
+
+        # every caller gets its own copy
+        profile.nickname = 'changed locally'
+        profile = UserService.get_profile_through_cache(linghu.id)
+        self.assertEqual(profile.nickname, 'linghu')
+
+        # saving the profile invalidates both layers
+        profile.nickname = 'new nickname'
+        profile.save()
+        profile = UserService.get_profile_through_cache(linghu.id)
+        self.assertEqual(profile.nickname, 'new nickname')
+
+    def test_get_suggested_user_ids(self):
+        linghu = self.create_user('linghu')
+        users = [self.create_user('user{}'.format(i)) for i in range(SUGGESTION_POOL_SIZE + 1)]
+        # users without a nickname are never suggested
+        self.create_user('no_nickname')
+        for user in [linghu] + users:
+            UserProfile.objects.create(user=user, nickname=user.username)
+        Friendship.objects.create(from_user=linghu, to_user=users[-1])
+
+        # the pool is topped up when it runs short, so every user with a
+        # nickname can be suggested, the followed user is filtered out
+        user_ids = UserService.get_suggested_user_ids(linghu.id, len(users))
+        self.assertEqual(len(user_ids), len(users) - 1)
+        self.assertSetEqual(set(user_ids), {user.id for user in users[:-1]})
+        self.assertEqual(len(UserService.get_suggested_user_ids(linghu.id, 2)), 2)
+
+        # served from the cached pool until it is refreshed
+        pool = UserService.refresh_suggestion_pool()
+        self.assertEqual(len(pool), SUGGESTION_POOL_SIZE)
+        new_user = self.create_user('new_user')
+        UserProfile.objects.create(user=new_user, nickname='new_user')
+        with self.assertNumQueries(0):
+            user_ids = UserService.get_suggested_user_ids(linghu.id, 1)
+        self.assertNotIn(new_user.id, user_ids)
+
+        # a user following the whole pool still gets suggestions
+        for user_id in set(pool) - {linghu.id, users[-1].id}:
+            Friendship.objects.create(from_user_id=linghu.id, to_user_id=user_id)
+        user_ids = UserService.get_suggested_user_ids(linghu.id, 1)
+        self.assertEqual(len(user_ids), 1)
+        self.assertNotIn(user_ids[0], set(pool) | {linghu.id})
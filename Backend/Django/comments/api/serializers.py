@@ -1,14 +1,16 @@
 from accounts.api.serializers import UserSerializerForComment
 from comments.models import Comment
+from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from likes.services import LikeService
 from tweets.models import Tweet
+from utils.memcached_helper import MemcachedHelper
+from utils.serializers import PrefetchListSerializer
 
 
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializerForComment(source='cached_user')
-    likes_count = serializers.SerializerMethodField()
     has_liked = serializers.SerializerMethodField()
 
     class Meta:
@@ -22,11 +24,24 @@ class CommentSerializer(serializers.ModelSerializer):
             'has_liked',
             'created_at',
         )
+        list_serializer_class = PrefetchListSerializer
 
-    def get_likes_count(self, obj):
-        return obj.like_set.count()
+    def prefetch(self, comments):
+        users = MemcachedHelper.prefetch_objects_through_cache(
+            comments, User, 'user_id', '_cached_user',
+        )
+        self.fields['user'].prefetch(users)
+        liked_comment_ids = LikeService.get_liked_object_ids(self.context['request'].user, comments)
+        self.context.setdefault('comment_id_to_has_liked', {}).update({
+            comment.id: comment.id in liked_comment_ids
+            for comment in comments
+        })
 
     def get_has_liked(self, obj):
+        # prefetched for the whole page by the list serializer
+        has_liked = self.context.get('comment_id_to_has_liked', {}).get(obj.id)
+        if has_liked is not None:
+            return has_liked
         return LikeService.has_liked(self.context['request'].user, obj)
 
 
@@ -61,7 +76,9 @@ class CommentSerializerForUpdate(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         instance.content = validated_data['content']
-        instance.save()
+        # likes_count is updated in place by the like listeners, saving the
+        # whole instance would overwrite it with the value loaded before
+        instance.save(update_fields=['content', 'updated_at'])
         return instance
 
 
@@ -1,7 +1,11 @@
+from comments.api.serializers import CommentSerializerForUpdate
 from comments.models import Comment
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from utils.paginations import CommentPagination
 
 COMMENT_URL = '/api/comments/'
 COMMENT_DETAIL_URL = '/api/comments/{}/'
@@ -9,6 +13,7 @@ COMMENT_DETAIL_URL = '/api/comments/{}/'
 class CommentApiTests(TestCase):
 
     def setUp(self):
+        self.clear_cache()
         self.linghu = self.create_user('linghu')
         self.linghu_client = APIClient()
         self.linghu_client.force_authenticate(self.linghu)
@@ -102,6 +107,24 @@ class CommentApiTests(TestCase):
         self.assertNotEqual(comment.created_at, now)
         self.assertNotEqual(comment.updated_at, before_updated_at)
 
+    def test_update_keeps_likes_count(self):
+        comment = self.create_comment(self.linghu, self.tweet, 'original')
+        url = COMMENT_DETAIL_URL.format(comment.id)
+        # the comment is liked while the update is in flight
+        comment = Comment.objects.get(id=comment.id)
+        self.create_like(self.dongxie, comment)
+        serializer = CommentSerializerForUpdate(comment, data={'content': 'new'})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        comment.refresh_from_db()
+        self.assertEqual(comment.content, 'new')
+        self.assertEqual(comment.likes_count, 1)
+
+        response = self.linghu_client.put(url, {'content': 'newer'})
+        self.assertEqual(response.status_code, 200)
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 1)
+
     def test_list(self):
         # must have tweet_id
         response = self.anonymous_client.get(COMMENT_URL)
@@ -131,3 +154,45 @@ class CommentApiTests(TestCase):
             'user_id': self.linghu.id,
         })
         self.assertEqual(len(response.data['comments']), 2)
+
+    def test_list_pagination(self):
+        page_size = CommentPagination.page_size
+        comments = [
+            self.create_comment(self.dongxie, self.tweet, '{}'.format(i))
+            for i in range(page_size + 2)
+        ]
+        # the same created_at is told apart by id
+        Comment.objects.filter(
+            id__in=[comment.id for comment in comments[page_size - 2:page_size + 1]],
+        ).update(created_at=comments[page_size - 2].created_at)
+        self.create_like(self.linghu, comments[0])
+
+        response = self.linghu_client.get(COMMENT_URL, {'tweet_id': self.tweet.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(len(response.data['comments']), page_size)
+        self.assertEqual(response.data['comments'][0]['likes_count'], 1)
+        self.assertEqual(response.data['comments'][0]['has_liked'], True)
+        results = response.data['comments']
+
+        # the first page is cached
+        with CaptureQueriesContext(connection) as captured:
+            self.linghu_client.get(COMMENT_URL, {'tweet_id': self.tweet.id})
+        self.assertFalse(any('comments_comment' in query['sql'] for query in captured.captured_queries))
+
+        response = self.linghu_client.get(COMMENT_URL, {
+            'tweet_id': self.tweet.id,
+            'cursor': response.data['next_cursor'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(response.data['next_cursor'], None)
+        results += response.data['comments']
+        self.assertEqual(
+            [result['id'] for result in results],
+            [comment.id for comment in comments],
+        )
+
+        # invalidated by the comment signals
+        comments[0].delete()
+        response = self.linghu_client.get(COMMENT_URL, {'tweet_id': self.tweet.id})
+        self.assertEqual(response.data['comments'][0]['id'], comments[1].id)
@@ -1,4 +1,5 @@
 from comments.models import Comment
+from comments.services import CommentService
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
@@ -10,12 +11,14 @@ from comments.api.serializers import (
 from utils.permissions import IsObjectOwner
 from inbox.services import NotificationService
 from utils.decorators import required_params
+from utils.paginations import CommentPagination
 
 
 class CommentViewSet(viewsets.GenericViewSet):
 	serializer_class = CommentSerializerForCreate
 	queryset = Comment.objects.all()
 	filterset_fields = ('tweet_id',)
+	pagination_class = CommentPagination
 	# POST /api/comments/ -> create
 	# GET /api/comments/ -> list
 	# GET /api/comments/1/ -> retrieve
@@ -31,17 +34,21 @@ class CommentViewSet(viewsets.GenericViewSet):
 
 	@required_params(params=['tweet_id'])
 	def list(self, request, *args, **kwargs):
-		queryset = self.get_queryset()
-		comments = self.filter_queryset(queryset).order_by('created_at')	
+		tweet_id = request.query_params['tweet_id']
+		if tweet_id.isdigit() and self.paginator.is_first_page(request):
+			comments = self.paginator.paginate_ordered_list(
+				CommentService.get_first_page_comments(int(tweet_id)),
+				request,
+			)
+		else:
+			queryset = self.filter_queryset(self.get_queryset())
+			comments = self.paginate_queryset(queryset)
 		serializer = CommentSerializer(
-            comments,
-            context={'request': request},
-            many=True,
-        )
-		return Response(
-            {'comments': serializer.data},
-            status=status.HTTP_200_OK,
-        )
+			comments,
+			context={'request': request},
+			many=True,
+		)
+		return self.get_paginated_response(serializer.data)
 
 	def create(self, request, *args, **kwargs):
 		data = {
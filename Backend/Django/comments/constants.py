@@ -0,0 +1,2 @@
+# how many comments are recounted by one grouped aggregate query
+COMMENT_LIKES_BACKFILL_BATCH_SIZE = 1000
@@ -1,19 +1,23 @@
 def incr_comments_count(sender, instance, created, **kwargs):
-    from tweets.models import Tweet
-    from django.db.models import F
+    from tweets.services import TweetService
 
     if not created:
         return
 
-    # handle new comment
-    Tweet.objects.filter(id=instance.tweet_id)\
-        .update(comments_count=F('comments_count') + 1)
+    # handle new comment, counted in redis and flushed in batch by
+    # flush_tweet_counts_task
+    TweetService.incr_count(instance.tweet_id, 'comments_count', 1)
 
 
 def decr_comments_count(sender, instance, **kwargs):
-    from tweets.models import Tweet
-    from django.db.models import F
+    from tweets.services import TweetService
 
     # handle comment deletion
-    Tweet.objects.filter(id=instance.tweet_id)\
-        .update(comments_count=F('comments_count') - 1)
+    TweetService.incr_count(instance.tweet_id, 'comments_count', -1)
+
+
+def invalidate_first_page_comments(sender, instance, **kwargs):
+    from comments.services import CommentService
+    # created, edited or deleted. the likes_count is updated in place by
+    # CommentService.incr_likes_count, which invalidates the page as well
+    CommentService.invalidate_first_page_comments(instance.tweet_id)
@@ -0,0 +1,19 @@
+from comments.constants import COMMENT_LIKES_BACKFILL_BATCH_SIZE
+from comments.services import CommentService
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recount likes_count of all the comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=COMMENT_LIKES_BACKFILL_BATCH_SIZE,
+            help='how many comments are recounted at a time',
+        )
+
+    def handle(self, *args, **options):
+        drifted_count = CommentService.backfill_likes_count(options['batch_size'])
+        self.stdout.write('{} comments recounted'.format(drifted_count))
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_likes_count(apps, schema_editor):
+    Comment = apps.get_model('comments', 'Comment')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('likes', 'Like')
+
+    content_type = ContentType.objects.filter(app_label='comments', model='comment').first()
+    if content_type is None:
+        return
+    likes_counts = dict(Like.objects.filter(content_type=content_type).values('object_id').annotate(
+        count=Count('id'),
+    ).values_list('object_id', 'count'))
+
+    comments = []
+    for comment in Comment.objects.filter(id__in=likes_counts.keys()).only('id').iterator():
+        comment.likes_count = likes_counts[comment.id]
+        comments.append(comment)
+    Comment.objects.bulk_update(comments, ['likes_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0001_initial'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.IntegerField(default=0, null=True),
+        ),
+        migrations.RunPython(backfill_likes_count, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
-from comments.listeners import incr_comments_count, decr_comments_count
+from comments.listeners import (
+	decr_comments_count,
+	incr_comments_count,
+	invalidate_first_page_comments,
+)
 from django.contrib.auth.models import User
 from django.db import models
-from django.contrib.contenttypes.models import ContentType
 from likes.models import Like
+from likes.registry import like_target_registry
 from tweets.models import Tweet
 from django.db.models.signals import post_save, pre_delete
 from utils.memcached_helper import MemcachedHelper
@@ -15,6 +19,8 @@ class Comment(models.Model):
 	user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
 	tweet = models.ForeignKey(Tweet, null=True, on_delete=models.SET_NULL)
 	content = models.TextField(max_length=140)
+	# maintained by the like listeners, see CommentService.incr_likes_count
+	likes_count = models.IntegerField(default=0, null=True)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
@@ -33,13 +39,18 @@ class Comment(models.Model):
 	@property
 	def like_set(self):
 		return Like.objects.filter(
-			content_type=ContentType.objects.get_for_model(Comment),
+			content_type_id=like_target_registry.get_content_type_id(Comment),
 			object_id=self.id
 		).order_by('-created_at')
 
 	@property
 	def cached_user(self):
-		return MemcachedHelper.get_object_through_cache(User, self.user_id)
+		# set in batch by the list serializers, see MemcachedHelper.prefetch_objects_through_cache
+		if not hasattr(self, '_cached_user'):
+			self._cached_user = MemcachedHelper.get_object_through_cache(User, self.user_id)
+		return self._cached_user
 
 post_save.connect(incr_comments_count, sender=Comment)
 pre_delete.connect(decr_comments_count, sender=Comment)
+post_save.connect(invalidate_first_page_comments, sender=Comment)
+pre_delete.connect(invalidate_first_page_comments, sender=Comment)
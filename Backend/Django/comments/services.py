@@ -0,0 +1,98 @@
+from comments.constants import COMMENT_LIKES_BACKFILL_BATCH_SIZE
+from comments.models import Comment
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce
+from likes.models import Like
+from likes.registry import like_target_registry
+from twitter.cache import COMMENT_TWEET_ID_PATTERN, TWEET_COMMENTS_FIRST_PAGE_PATTERN
+from utils.paginations import CommentPagination
+
+cache = caches['testing'] if settings.TESTING else caches['default']
+
+
+class CommentService(object):
+
+    @classmethod
+    def get_first_page_comments(cls, tweet_id):
+        """
+        the oldest page_size + 1 comments of the tweet, the first page of
+        CommentPagination plus one to tell if there is a next page
+        """
+        key = TWEET_COMMENTS_FIRST_PAGE_PATTERN.format(tweet_id=tweet_id)
+        comments = cache.get(key)
+        if comments is not None:
+            return comments
+
+        comments = list(Comment.objects.filter(
+            tweet_id=tweet_id,
+        ).order_by('created_at', 'id')[:CommentPagination.page_size + 1])
+        cache.set(key, comments)
+        return comments
+
+    @classmethod
+    def invalidate_first_page_comments(cls, tweet_id):
+        key = TWEET_COMMENTS_FIRST_PAGE_PATTERN.format(tweet_id=tweet_id)
+        cache.delete(key)
+
+    @classmethod
+    def get_tweet_id(cls, comment_id):
+        # the tweet of a comment never changes, so it is cached without
+        # invalidation. a deleted tweet is left in it, which is harmless for
+        # invalidating the cached first page.
+        key = COMMENT_TWEET_ID_PATTERN.format(comment_id=comment_id)
+        tweet_id = cache.get(key)
+        if tweet_id is not None:
+            return tweet_id
+
+        tweet_id = Comment.objects.filter(id=comment_id).values_list('tweet_id', flat=True).first()
+        if tweet_id is not None:
+            cache.set(key, tweet_id)
+        return tweet_id
+
+    @classmethod
+    def incr_likes_count(cls, comment_id, tweet_id, delta):
+        # an atomic UPDATE, concurrent likes never overwrite each other.
+        # likes_count is nullable, the same as the counters of the tweet
+        Comment.objects.filter(id=comment_id).update(
+            likes_count=Coalesce(F('likes_count'), 0) + delta,
+        )
+        # update() sends no post_save, the cached first page holds the count
+        if tweet_id is not None:
+            cls.invalidate_first_page_comments(tweet_id)
+
+    @classmethod
+    def backfill_likes_count(cls, batch_size=COMMENT_LIKES_BACKFILL_BATCH_SIZE):
+        """
+        recount likes_count of all the comments in id order, one grouped
+        aggregate query per batch_size comments, and save only the comments
+        whose counter drifted. return the number of them.
+        """
+        comment_content_type_id = like_target_registry.get_content_type_id(Comment)
+        drifted_count = 0
+        last_id = 0
+        while True:
+            comments = list(
+                Comment.objects.filter(id__gt=last_id).order_by('id').only('id', 'tweet_id', 'likes_count')[:batch_size]
+            )
+            if not comments:
+                break
+            last_id = comments[-1].id
+
+            likes_counts = dict(Like.objects.filter(
+                content_type_id=comment_content_type_id,
+                object_id__in=[comment.id for comment in comments],
+            ).values('object_id').annotate(
+                count=Count('id'),
+            ).order_by().values_list('object_id', 'count'))
+            drifted_comments = []
+            for comment in comments:
+                if comment.likes_count != likes_counts.get(comment.id, 0):
+                    comment.likes_count = likes_counts.get(comment.id, 0)
+                    drifted_comments.append(comment)
+            Comment.objects.bulk_update(drifted_comments, ['likes_count'])
+            for tweet_id in {comment.tweet_id for comment in drifted_comments}:
+                cls.invalidate_first_page_comments(tweet_id)
+            drifted_count += len(drifted_comments)
+        return drifted_count
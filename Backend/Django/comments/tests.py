@@ -1,3 +1,5 @@
+from comments.models import Comment
+from comments.services import CommentService
 from testing.testcases import TestCase
 
 
@@ -8,3 +10,45 @@ class CommentModelTests(TestCase):
 		tweet = self.create_tweet(user)
 		comment = self.create_comment(user, tweet)
 		self.assertNotEqual(comment.__str__(), None)
+
+	def test_likes_count(self):
+		user = self.create_user('linghu')
+		comment = self.create_comment(user, self.create_tweet(user))
+		like = self.create_like(user, comment)
+		self.create_like(self.create_user('dongxie'), comment)
+		comment.refresh_from_db()
+		self.assertEqual(comment.likes_count, 2)
+		like.delete()
+		comment.refresh_from_db()
+		self.assertEqual(comment.likes_count, 1)
+
+		# a null counter is counted from 0
+		Comment.objects.filter(id=comment.id).update(likes_count=None)
+		self.create_like(user, comment)
+		comment.refresh_from_db()
+		self.assertEqual(comment.likes_count, 1)
+
+	def test_get_tweet_id(self):
+		self.clear_cache()
+		user = self.create_user('linghu')
+		tweet = self.create_tweet(user)
+		comment = self.create_comment(user, tweet)
+		self.assertEqual(CommentService.get_tweet_id(comment.id), tweet.id)
+		# the likes of the comment don't read it from the database again
+		with self.assertNumQueries(0):
+			self.assertEqual(CommentService.get_tweet_id(comment.id), tweet.id)
+		self.assertIsNone(CommentService.get_tweet_id(0))
+
+	def test_backfill_likes_count(self):
+		user = self.create_user('linghu')
+		tweet = self.create_tweet(user)
+		comments = [self.create_comment(user, tweet) for _ in range(3)]
+		self.create_like(user, comments[1])
+		Comment.objects.update(likes_count=5)
+
+		self.assertEqual(CommentService.backfill_likes_count(batch_size=2), 3)
+		self.assertEqual(
+			list(Comment.objects.order_by('id').values_list('likes_count', flat=True)),
+			[0, 1, 0],
+		)
+		self.assertEqual(CommentService.backfill_likes_count(), 0)
@@ -1,9 +1,12 @@
 from accounts.api.serializers import UserSerializerForFriendship
 from django.contrib.auth.models import User
+from friendships.constants import BATCH_FOLLOW_LIMIT
 from friendships.models import Friendship
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from friendships.services import FriendshipService
+from utils.memcached_helper import MemcachedHelper
+from utils.serializers import PrefetchListSerializer
 
 
 class FollowingUserIdSetMixin:
@@ -51,28 +54,49 @@ class FriendshipSerializerForCreate(serializers.ModelSerializer):
         )
 
 
+class FriendshipSerializerForBatch(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=BATCH_FOLLOW_LIMIT,
+    )
+    backfill_newsfeeds = serializers.BooleanField(default=False)
+
+
 class FollowerSerializer(serializers.ModelSerializer, FollowingUserIdSetMixin):
-    # user = UserSerializerForFriendship(source='cached_from_user')
-    user = UserSerializerForFriendship(source='from_user')
+    user = UserSerializerForFriendship(source='cached_from_user')
     created_at = serializers.DateTimeField()
     has_followed = serializers.SerializerMethodField()
 
     class Meta:
         model = Friendship
         fields = ('user', 'created_at', 'has_followed')
+        list_serializer_class = PrefetchListSerializer
+
+    def prefetch(self, friendships):
+        users = MemcachedHelper.prefetch_objects_through_cache(
+            friendships, User, 'from_user_id', '_cached_from_user',
+        )
+        self.fields['user'].prefetch(users)
 
     def get_has_followed(self, obj):
         return obj.from_user_id in self.following_user_id_set
 
 class FollowingSerializer(serializers.ModelSerializer, FollowingUserIdSetMixin):
-    # user = UserSerializerForFriendship(source='cached_to_user')
-    user = UserSerializerForFriendship(source='to_user')
+    user = UserSerializerForFriendship(source='cached_to_user')
     created_at = serializers.DateTimeField()
     has_followed = serializers.SerializerMethodField()
 
     class Meta:
         model = Friendship
         fields = ('user', 'created_at', 'has_followed')
+        list_serializer_class = PrefetchListSerializer
+
+    def prefetch(self, friendships):
+        users = MemcachedHelper.prefetch_objects_through_cache(
+            friendships, User, 'to_user_id', '_cached_to_user',
+        )
+        self.fields['user'].prefetch(users)
 
     def get_has_followed(self, obj):
        return obj.to_user_id in self.following_user_id_set
\ No newline at end of file
@@ -1,5 +1,8 @@
+from accounts.services import UserService
 from utils.paginations import FriendshipPagination
 from friendships.models import Friendship
+from friendships.services import FriendshipService
+from newsfeeds.models import NewsFeed
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 
@@ -8,6 +11,8 @@ FOLLOW_URL = '/api/friendships/{}/follow/'
 UNFOLLOW_URL = '/api/friendships/{}/unfollow/'
 FOLLOWERS_URL = '/api/friendships/{}/followers/'
 FOLLOWINGS_URL = '/api/friendships/{}/followings/'
+BATCH_FOLLOW_URL = '/api/friendships/batch_follow/'
+BATCH_UNFOLLOW_URL = '/api/friendships/batch_unfollow/'
 
 
 class FriendshipApiTests(TestCase):
@@ -181,6 +186,47 @@ class FriendshipApiTests(TestCase):
         for result in response.data['results']:
             self.assertEqual(result['has_followed'], True)
 
+    def test_followers_cursor_pagination(self):
+        page_size = FriendshipPagination.page_size
+        friendships = [
+            Friendship.objects.create(
+                from_user=self.create_user('linghu_follower{}'.format(i)),
+                to_user=self.linghu,
+            )
+            for i in range(page_size + 2)
+        ]
+        # the same created_at is told apart by id
+        Friendship.objects.filter(
+            id__in=[friendship.id for friendship in friendships[:5]],
+        ).update(created_at=friendships[0].created_at)
+        expected_ids = list(Friendship.objects.filter(
+            to_user=self.linghu,
+        ).order_by('-created_at', '-id').values_list('from_user_id', flat=True))
+
+        url = FOLLOWERS_URL.format(self.linghu.id)
+        response = self.linghu_client.get(url, {'cursor': '', 'with_total': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(response.data['total_results'], page_size + 2)
+        results = response.data['results']
+
+        response = self.linghu_client.get(url, {
+            'cursor': response.data['next_cursor'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(response.data['next_cursor'], None)
+        self.assertNotIn('total_results', response.data)
+        results += response.data['results']
+
+        response = self.linghu_client.get(url, {'cursor': '', 'with_total': 'false'})
+        self.assertNotIn('total_results', response.data)
+        response = self.linghu_client.get(url, {'cursor': '', 'with_total': 'true'})
+        self.assertEqual(response.data['total_results'], page_size + 2)
+        self.assertEqual([result['user']['id'] for result in results], expected_ids)
+
+        response = self.linghu_client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
     def _test_friendship_pagination(self, url, page_size, max_page_size):
         response = self.anonymous_client.get(url, {'page': 1})
         self.assertEqual(response.status_code, 200)
@@ -216,3 +262,57 @@ class FriendshipApiTests(TestCase):
         self.assertEqual(response.data['total_results'], page_size * 2)
         self.assertEqual(response.data['page_number'], 1)
         self.assertEqual(response.data['has_next_page'], True)
+
+    def test_batch_follow(self):
+        users = [self.create_user('linghu_following{}'.format(i)) for i in range(3)]
+        tweets = [self.create_tweet(user) for user in users]
+        user_ids = [user.id for user in users]
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.create(from_user=self.linghu, to_user=users[0])
+
+        # login is required
+        response = self.anonymous_client.post(BATCH_FOLLOW_URL, {'user_ids': user_ids})
+        self.assertEqual(response.status_code, 401)
+        # user_ids is required
+        response = self.linghu_client.post(BATCH_FOLLOW_URL, {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # self, missing users and existing followings are skipped
+        response = self.linghu_client.post(BATCH_FOLLOW_URL, {
+            'user_ids': user_ids + [self.linghu.id, 0],
+            'backfill_newsfeeds': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['followed_user_ids'], user_ids[1:])
+        self.assertEqual(response.data['backfilled_newsfeeds'], 2)
+        self.assertEqual(
+            FriendshipService.get_following_user_id_set(self.linghu.id),
+            set(user_ids),
+        )
+        self.assertEqual(
+            UserService.get_profile_through_cache(self.linghu.id).followings_count,
+            3,
+        )
+        self.assertEqual(FriendshipService.get_follower_count(users[1].id), 1)
+        self.assertEqual(
+            FriendshipService.get_follower_user_id_set(users[2].id),
+            {self.linghu.id},
+        )
+        self.assertEqual(
+            set(NewsFeed.objects.filter(user=self.linghu).values_list('tweet_id', flat=True)),
+            {tweet.id for tweet in tweets},
+        )
+
+        response = self.linghu_client.post(BATCH_UNFOLLOW_URL, {
+            'user_ids': user_ids[:2],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(
+            FriendshipService.get_following_user_id_set(self.linghu.id),
+            {user_ids[2]},
+        )
+        self.assertEqual(
+            UserService.get_profile_through_cache(self.linghu.id).followings_count,
+            1,
+        )
@@ -7,11 +7,15 @@ from friendships.services import FriendshipService
 from friendships.api.serializers import (
     FollowingSerializer,
     FollowerSerializer,
+    FriendshipSerializerForBatch,
     FriendshipSerializerForCreate,
     MutualUserSerializer,
 )
+from accounts.services import UserService
 from django.contrib.auth.models import User
 from django.db.models import Q
+from newsfeeds.services import NewsFeedService
+from utils.memcached_helper import MemcachedHelper
 from utils.paginations import FriendshipPagination
 
 
@@ -25,6 +29,17 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     # define my own pagination
     pagination_class = FriendshipPagination
 
+    def get_approximate_total(self):
+        # the denormalized counters of the cached profile instead of COUNT(*)
+        try:
+            user = MemcachedHelper.get_object_through_cache(User, self.kwargs['pk'])
+        except User.DoesNotExist:
+            return 0
+        profile = UserService.get_profile_through_cache(user.id)
+        if self.action == 'followers':
+            return profile.followers_count
+        return profile.followings_count
+
     @action(methods=['GET'], detail=True, permission_classes=[IsAuthenticated])
     def followers(self, request, pk):
         friendship = Friendship.objects.filter(
@@ -88,11 +103,48 @@ class FriendshipViewSet(viewsets.GenericViewSet):
         ).delete()
         return Response({'success': True, 'deleted': deleted})
 
+    @action(methods=['POST'], detail=False, permission_classes=[IsAuthenticated])
+    def batch_follow(self, request):
+        # e.g. following the suggested users during onboarding in one request
+        serializer = FriendshipSerializerForBatch(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        followed_user_ids = FriendshipService.batch_follow(
+            request.user.id,
+            serializer.validated_data['user_ids'],
+        )
+        backfilled = 0
+        if serializer.validated_data['backfill_newsfeeds'] and followed_user_ids:
+            backfilled = NewsFeedService.backfill_newsfeeds(request.user.id, followed_user_ids)
+        return Response({
+            'success': True,
+            'followed_user_ids': followed_user_ids,
+            'backfilled_newsfeeds': backfilled,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(methods=['POST'], detail=False, permission_classes=[IsAuthenticated])
+    def batch_unfollow(self, request):
+        serializer = FriendshipSerializerForBatch(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        # one DELETE, the listeners keep the caches and counters in sync
+        deleted, _ = Friendship.objects.filter(
+            from_user=request.user,
+            to_user_id__in=serializer.validated_data['user_ids'],
+        ).delete()
+        return Response({'success': True, 'deleted': deleted})
+
     def list(self, request):
         return Response({'message': 'this is friendships'})
     
     @action(methods=['GET'], detail=True, permission_classes=[IsAuthenticated])
     def get_allowed_user(self, request, pk):
-        mutual_followers = FriendshipService.get_mutual_followers(user_id=pk)
+        mutual_followers = FriendshipService.get_mutual_followers(user_id=int(pk))
         serializer = MutualUserSerializer(mutual_followers, many=True, context={'request': request})
         return Response(serializer.data)
\ No newline at end of file
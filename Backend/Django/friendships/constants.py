@@ -0,0 +1,12 @@
+# how many users can be followed or unfollowed by one batch request
+BATCH_FOLLOW_LIMIT = 100
+
+# how many "people you may know" user ids are kept for every user
+RECOMMENDED_USERS_LIMIT = 20
+# the recommendations are computed from at most this many followings
+RECOMMENDATION_FOLLOWINGS_LIMIT = 500
+# the changes of the followings within this many seconds are picked up by
+# one recompute of the recommendations
+RECOMMENDATION_REFRESH_DELAY = 30
+# the mark of a queued recompute outlives the delay, in case the task is late
+RECOMMENDATION_REFRESH_TIMEOUT = 10 * RECOMMENDATION_REFRESH_DELAY
@@ -1,3 +1,56 @@
+from django.db import transaction
+
+
 def invalidate_following_cache(instance, sender, **kwargs):
     from friendships.services import FriendshipService
-    FriendshipService.invalidate_following_cache(instance.from_user_id)
\ No newline at end of file
+    from newsfeeds.services import NewsFeedService
+    FriendshipService.invalidate_following_cache(instance.from_user_id)
+    FriendshipService.invalidate_follower_cache(instance.to_user_id)
+    FriendshipService.invalidate_mutual_cache(instance.from_user_id)
+    FriendshipService.invalidate_mutual_cache(instance.to_user_id)
+    # followed celebrities are derived from the followings
+    NewsFeedService.invalidate_followed_celebrities(instance.from_user_id)
+
+
+def incr_friendship_counts(sender, instance, created, **kwargs):
+    from friendships.services import FriendshipService
+    if not created:
+        return
+    FriendshipService.update_friendship_counts(instance.from_user_id, [instance.to_user_id], 1)
+
+
+def decr_friendship_counts(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    FriendshipService.update_friendship_counts(instance.from_user_id, [instance.to_user_id], -1)
+
+
+def backfill_newsfeeds(sender, instance, created, **kwargs):
+    from newsfeeds.tasks import backfill_newsfeeds_task
+    if not created:
+        return
+    # the task checks the friendship, so it can only run once it's committed
+    transaction.on_commit(lambda: backfill_newsfeeds_task.delay(
+        instance.from_user_id,
+        instance.to_user_id,
+    ))
+
+
+def remove_newsfeeds(sender, instance, **kwargs):
+    # post_delete, the task checks the friendship is really gone
+    from newsfeeds.tasks import remove_newsfeeds_task
+    transaction.on_commit(lambda: remove_newsfeeds_task.delay(
+        instance.from_user_id,
+        instance.to_user_id,
+    ))
+
+
+def refresh_recommended_users(sender, instance, created=False, **kwargs):
+    from friendships.services import FriendshipService
+    if created:
+        FriendshipService.remove_recommended_user(instance.from_user_id, instance.to_user_id)
+    FriendshipService.refresh_recommended_users(instance.from_user_id)
+
+
+def clear_friendships_of_deleted_user(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    FriendshipService.clear_friendships_of_user(instance.id)
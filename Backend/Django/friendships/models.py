@@ -1,7 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_delete
-from friendships.listeners import invalidate_following_cache
+from django.db.models.signals import post_delete, post_save, pre_delete
+from friendships.listeners import (
+    backfill_newsfeeds,
+    clear_friendships_of_deleted_user,
+    decr_friendship_counts,
+    incr_friendship_counts,
+    invalidate_following_cache,
+    refresh_recommended_users,
+    remove_newsfeeds,
+)
 from utils.memcached_helper import MemcachedHelper
 
 
@@ -35,12 +43,25 @@ class Friendship(models.Model):
 
     @property
     def cached_from_user(self):
-        return MemcachedHelper.get_object_through_cache(User, self.from_user_id)
+        # set in batch by the list serializers, see MemcachedHelper.prefetch_objects_through_cache
+        if not hasattr(self, '_cached_from_user'):
+            self._cached_from_user = MemcachedHelper.get_object_through_cache(User, self.from_user_id)
+        return self._cached_from_user
 
     @property
     def cached_to_user(self):
-        return MemcachedHelper.get_object_through_cache(User, self.to_user_id)
+        # set in batch by the list serializers, see MemcachedHelper.prefetch_objects_through_cache
+        if not hasattr(self, '_cached_to_user'):
+            self._cached_to_user = MemcachedHelper.get_object_through_cache(User, self.to_user_id)
+        return self._cached_to_user
 
 
 pre_delete.connect(invalidate_following_cache, sender=Friendship)
 post_save.connect(invalidate_following_cache, sender=Friendship)
+post_save.connect(incr_friendship_counts, sender=Friendship)
+pre_delete.connect(decr_friendship_counts, sender=Friendship)
+post_save.connect(backfill_newsfeeds, sender=Friendship)
+post_delete.connect(remove_newsfeeds, sender=Friendship)
+post_save.connect(refresh_recommended_users, sender=Friendship)
+post_delete.connect(refresh_recommended_users, sender=Friendship)
+pre_delete.connect(clear_friendships_of_deleted_user, sender=User)
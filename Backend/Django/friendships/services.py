@@ -1,12 +1,40 @@
 from django.conf import settings
 from django.core.cache import caches
 from django.contrib.auth.models import User
-from django.db.models import Subquery, Q
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from friendships.constants import (
+    RECOMMENDATION_FOLLOWINGS_LIMIT,
+    RECOMMENDATION_REFRESH_DELAY,
+    RECOMMENDATION_REFRESH_TIMEOUT,
+    RECOMMENDED_USERS_LIMIT,
+)
 from friendships.models import Friendship
-from twitter.cache import FOLLOWINGS_PATTERN
+from twitter.cache import (
+    FOLLOWERS_PATTERN,
+    FOLLOWINGS_PATTERN,
+    MUTUAL_FOLLOWS_PATTERN,
+    RECOMMENDED_USERS_PATTERN,
+    RECOMMENDED_USERS_REFRESH_PATTERN,
+)
+from utils.memcached_helper import MemcachedHelper
+from utils.redis_helper import RedisHelper
+from utils.time_constants import ONE_DAY
 
 cache = caches['testing'] if settings.TESTING else caches['default']
 
+# the unique (from_user_id, to_user_id) skips the existing friendships,
+# RETURNING tells which ones are created. the clauses come from the database
+# backend, see FriendshipService.get_insert_friendships_sql
+INSERT_FRIENDSHIPS_SQL = """
+{insert} {table} (from_user_id, to_user_id, created_at)
+VALUES {values}
+{on_conflict}
+{returning}
+"""
+
 
 class FriendshipService(object):
 
@@ -34,11 +62,42 @@ class FriendshipService(object):
 
         # 正确的写法二，使用 prefetch_related，会自动执行成两条语句，用 In Query 查询
         # 实际执行的 SQL 查询和上面是一样的，一共两条 SQL Queries
-        friendships = Friendship.objects.filter(
-            to_user=user,
-        ).prefetch_related('from_user')
-        return [friendship.from_user for friendship in friendships]
-    
+        # friendships = Friendship.objects.filter(
+        #     to_user=user,
+        # ).prefetch_related('from_user')
+        # return [friendship.from_user for friendship in friendships]
+
+        # 正确的写法三，follower ids 和 user 都从 cache 中读取
+        return MemcachedHelper.get_objects_through_cache(
+            User,
+            cls.get_follower_ids(user.id),
+        )
+
+    @classmethod
+    def get_follower_ids(cls, to_user_id):
+        # only the ids are needed in most cases (e.g. newsfeed fanout), so
+        # there is no need to load the User rows of all followers
+        return list(cls.get_follower_user_id_set(to_user_id))
+
+    @classmethod
+    def get_follower_count(cls, to_user_id):
+        # import here to avoid circular dependency
+        from accounts.services import UserService
+        return UserService.get_profile_through_cache(to_user_id).followers_count
+
+    @classmethod
+    def get_user_ids_with_followers_at_least(cls, user_ids, followers_count):
+        # import here to avoid circular dependency
+        from accounts.services import UserService
+        # the denormalized counters of the cached profiles instead of
+        # counting the friendships of every user
+        user_id_to_profile = UserService.get_profiles_through_cache(user_ids)
+        return set(
+            user_id
+            for user_id, profile in user_id_to_profile.items()
+            if profile.followers_count >= followers_count
+        )
+
     @classmethod
     def has_followed(cls, from_user, to_user):
         if from_user == to_user:
@@ -55,11 +114,11 @@ class FriendshipService(object):
         if user_id_set is not None:
             return user_id_set
 
-        friendships = Friendship.objects.filter(from_user_id=from_user_id)
-        user_id_set = set([
-            fs.to_user_id
-            for fs in friendships
-        ])
+        # the followed user might have been deleted (SET_NULL)
+        user_id_set = set(Friendship.objects.filter(
+            from_user_id=from_user_id,
+            to_user_id__isnull=False,
+        ).values_list('to_user_id', flat=True))
         cache.set(key, user_id_set)
         return user_id_set
 
@@ -68,6 +127,254 @@ class FriendshipService(object):
         key = FOLLOWINGS_PATTERN.format(user_id=from_user_id)
         cache.delete(key)
 
+    @classmethod
+    def get_follower_user_id_set(cls, to_user_id):
+        key = FOLLOWERS_PATTERN.format(user_id=to_user_id)
+        user_id_set = cache.get(key)
+        if user_id_set is not None:
+            return user_id_set
+
+        user_id_set = set(Friendship.objects.filter(
+            to_user_id=to_user_id,
+            from_user_id__isnull=False,
+        ).values_list('from_user_id', flat=True))
+        cache.set(key, user_id_set)
+        return user_id_set
+
+    @classmethod
+    def invalidate_follower_cache(cls, to_user_id):
+        key = FOLLOWERS_PATTERN.format(user_id=to_user_id)
+        cache.delete(key)
+
+    @classmethod
+    def get_mutual_user_id_set(cls, user_id):
+        # users followed by the user that also follow the user back
+        key = MUTUAL_FOLLOWS_PATTERN.format(user_id=user_id)
+        user_id_set = cache.get(key)
+        if user_id_set is not None:
+            return user_id_set
+
+        user_id_set = (
+            cls.get_following_user_id_set(user_id) &
+            cls.get_follower_user_id_set(user_id)
+        )
+        cache.set(key, user_id_set)
+        return user_id_set
+
+    @classmethod
+    def invalidate_mutual_cache(cls, user_id):
+        key = MUTUAL_FOLLOWS_PATTERN.format(user_id=user_id)
+        cache.delete(key)
+
+    @classmethod
+    def compute_recommended_user_ids(cls, user_id):
+        """
+        the users followed by the followings of the user, ranked by how many
+        followings follow them. run by compute_recommended_users_task.
+        """
+        # the changes of the followings from now on need another recompute
+        RedisHelper.pop_value(RECOMMENDED_USERS_REFRESH_PATTERN.format(user_id=user_id))
+
+        # the most recent followings over the (from_user_id, created_at) index
+        following_ids = list(Friendship.objects.filter(
+            from_user_id=user_id,
+            to_user_id__isnull=False,
+        ).order_by('-created_at').values_list(
+            'to_user_id',
+            flat=True,
+        )[:RECOMMENDATION_FOLLOWINGS_LIMIT])
+        user_ids = list(Friendship.objects.filter(
+            from_user_id__in=following_ids,
+            to_user_id__isnull=False,
+        ).exclude(
+            to_user_id__in=following_ids + [user_id],
+        ).values('to_user_id').annotate(
+            overlap=Count('id'),
+        ).order_by('-overlap', 'to_user_id').values_list(
+            'to_user_id',
+            flat=True,
+        )[:RECOMMENDED_USERS_LIMIT])
+        # followings of the friends change without the user knowing, expire
+        # the list once a day so it catches up
+        key = RECOMMENDED_USERS_PATTERN.format(user_id=user_id)
+        cache.set(key, user_ids, timeout=ONE_DAY)
+        return user_ids
+
+    @classmethod
+    def get_recommended_user_ids(cls, user_id):
+        key = RECOMMENDED_USERS_PATTERN.format(user_id=user_id)
+        user_ids = cache.get(key)
+        if user_ids is not None:
+            return user_ids
+        # never computed on the request thread
+        cls.refresh_recommended_users(user_id, countdown=0)
+        return []
+
+    @classmethod
+    def refresh_recommended_users(cls, user_id, countdown=RECOMMENDATION_REFRESH_DELAY):
+        """
+        queue a recompute of the recommendations unless one is queued
+        already, so a burst of follows is recomputed once
+        """
+        # import here to avoid circular dependency
+        from friendships.tasks import compute_recommended_users_task
+
+        key = RECOMMENDED_USERS_REFRESH_PATTERN.format(user_id=user_id)
+        if not RedisHelper.add_value(key, 1, RECOMMENDATION_REFRESH_TIMEOUT):
+            return
+        compute_recommended_users_task.apply_async(args=[user_id], countdown=countdown)
+
+    @classmethod
+    def remove_recommended_user(cls, user_id, followed_user_id):
+        # a followed user is dropped at once, the ranking is refreshed later
+        key = RECOMMENDED_USERS_PATTERN.format(user_id=user_id)
+        user_ids = cache.get(key)
+        if user_ids is None or followed_user_id not in user_ids:
+            return
+        user_ids = [candidate_id for candidate_id in user_ids if candidate_id != followed_user_id]
+        cache.set(key, user_ids, timeout=ONE_DAY)
+
+    @classmethod
+    def update_friendship_counts(cls, from_user_id, to_user_ids, delta):
+        # import here to avoid circular dependency
+        from accounts.models import UserProfile
+        from accounts.services import UserService
+
+        # a missing profile is created with the counters computed from the
+        # friendships, see UserService.get_or_create_profile
+        to_user_ids = [user_id for user_id in to_user_ids if user_id is not None]
+        if from_user_id is not None:
+            UserProfile.objects.filter(user_id=from_user_id).update(
+                followings_count=F('followings_count') + delta * len(to_user_ids),
+            )
+            UserService.invalidate_profile(from_user_id)
+        if to_user_ids:
+            UserProfile.objects.filter(user_id__in=to_user_ids).update(
+                followers_count=F('followers_count') + delta,
+            )
+            for to_user_id in to_user_ids:
+                UserService.invalidate_profile(to_user_id)
+
+    @classmethod
+    def clear_friendships_of_user(cls, user_id):
+        """
+        the user is about to be deleted, its friendships are kept with a null
+        user (SET_NULL), which is a bulk UPDATE without any signal. the
+        caches and the counters of the other side are fixed here.
+        """
+        # import here to avoid circular dependency
+        from accounts.models import UserProfile
+        from accounts.services import UserService
+        from newsfeeds.services import NewsFeedService
+
+        follower_ids = set(cls.get_follower_user_id_set(user_id))
+        following_ids = set(cls.get_following_user_id_set(user_id))
+        if follower_ids:
+            UserProfile.objects.filter(user_id__in=follower_ids).update(
+                followings_count=F('followings_count') - 1,
+            )
+        if following_ids:
+            UserProfile.objects.filter(user_id__in=following_ids).update(
+                followers_count=F('followers_count') - 1,
+            )
+        for follower_id in follower_ids:
+            cls.invalidate_following_cache(follower_id)
+            cls.invalidate_mutual_cache(follower_id)
+            NewsFeedService.invalidate_followed_celebrities(follower_id)
+        for following_id in following_ids:
+            cls.invalidate_follower_cache(following_id)
+            cls.invalidate_mutual_cache(following_id)
+        for other_user_id in follower_ids | following_ids:
+            UserService.invalidate_profile(other_user_id)
+        cls.invalidate_following_cache(user_id)
+        cls.invalidate_follower_cache(user_id)
+        cls.invalidate_mutual_cache(user_id)
+
+    @classmethod
+    def get_insert_friendships_sql(cls, num_rows):
+        # e.g. INSERT ... ON CONFLICT DO NOTHING on postgres, INSERT OR
+        # IGNORE on sqlite, see LikeService.get_insert_like_sql
+        returning, _ = connection.ops.return_insert_columns([
+            Friendship._meta.get_field('to_user'),
+        ])
+        return INSERT_FRIENDSHIPS_SQL.format(
+            insert=connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            table=connection.ops.quote_name(Friendship._meta.db_table),
+            values=', '.join(['(%s, %s, %s)'] * num_rows),
+            on_conflict=connection.ops.on_conflict_suffix_sql(
+                [],
+                OnConflict.IGNORE,
+                [],
+                [],
+            ),
+            returning=returning,
+        )
+
+    @classmethod
+    def insert_friendships(cls, from_user_id, to_user_ids):
+        """
+        create the friendships which don't exist yet, return the ids of the
+        users followed by them. a friendship created in between by another
+        request is skipped by the unique (from_user_id, to_user_id).
+        """
+        to_user_ids = list(to_user_ids)
+        if not to_user_ids:
+            return set()
+        # bulk_create(ignore_conflicts=True) can't tell the rows it inserted,
+        # without RETURNING they are inserted one by one
+        if not connection.features.can_return_columns_from_insert or \
+                not connection.features.supports_ignore_conflicts:
+            created_user_ids = set()
+            for to_user_id in to_user_ids:
+                try:
+                    with transaction.atomic():
+                        Friendship.objects.bulk_create([
+                            Friendship(from_user_id=from_user_id, to_user_id=to_user_id),
+                        ])
+                except IntegrityError:
+                    continue
+                created_user_ids.add(to_user_id)
+            return created_user_ids
+
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        params = []
+        for to_user_id in to_user_ids:
+            params.extend([from_user_id, to_user_id, created_at])
+        with connection.cursor() as cursor:
+            cursor.execute(cls.get_insert_friendships_sql(len(to_user_ids)), params)
+            return set(row[0] for row in cursor.fetchall())
+
+    @classmethod
+    def batch_follow(cls, from_user_id, to_user_ids):
+        """
+        follow all the users at once, return the ids of the users which are
+        followed by this call
+        """
+        # import here to avoid circular dependency
+        from newsfeeds.services import NewsFeedService
+
+        to_user_ids = set(User.objects.filter(
+            id__in=to_user_ids,
+        ).exclude(id=from_user_id).values_list('id', flat=True))
+        # the existing followings are skipped by the insert, the counters are
+        # updated only by the rows it actually created
+        to_user_ids = cls.insert_friendships(from_user_id, sorted(to_user_ids))
+        if not to_user_ids:
+            return []
+
+        # the raw INSERT does not send post_save, so the work of the
+        # friendship listeners is done here, once for the whole batch
+        cls.invalidate_following_cache(from_user_id)
+        cls.invalidate_mutual_cache(from_user_id)
+        NewsFeedService.invalidate_followed_celebrities(from_user_id)
+        for to_user_id in to_user_ids:
+            cls.invalidate_follower_cache(to_user_id)
+            cls.invalidate_mutual_cache(to_user_id)
+            cls.remove_recommended_user(from_user_id, to_user_id)
+        cls.update_friendship_counts(from_user_id, to_user_ids, 1)
+        cls.refresh_recommended_users(from_user_id)
+        return sorted(to_user_ids)
+
     @classmethod
     def has_following(cls, from_user_id, to_user_id):
         if from_user_id == to_user_id:
@@ -79,20 +386,6 @@ class FriendshipService(object):
 
     @classmethod
     def get_mutual_followers(cls, user_id):
-        # Users that user_a follows
-        following_ids = Friendship.objects.filter(
-            from_user=user_id
-        ).values_list('to_user_id', flat=True)
-
-        # Users that follow user_a
-        follower_ids = Friendship.objects.filter(
-            to_user=user_id
-        ).values_list('from_user_id', flat=True)
-
-        # Mutual follows: Users followed by user_a that also follow user_a
-        mutual_follows = User.objects.filter(
-            (Q(id__in=Subquery(following_ids)) & Q(id__in=Subquery(follower_ids))) |
-            Q(id=user_id)
-        )
-
-        return mutual_follows
\ No newline at end of file
+        # the mutual follows and the user itself, ordered by id
+        user_ids = sorted(cls.get_mutual_user_id_set(user_id) | {user_id})
+        return MemcachedHelper.get_objects_through_cache(User, user_ids)
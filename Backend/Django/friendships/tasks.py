@@ -0,0 +1,9 @@
+from celery import shared_task
+from friendships.services import FriendshipService
+from utils.time_constants import ONE_MINUTE
+
+
+@shared_task(time_limit=ONE_MINUTE)
+def compute_recommended_users_task(user_id):
+    user_ids = FriendshipService.compute_recommended_user_ids(user_id)
+    return '{} users recommended.'.format(len(user_ids))
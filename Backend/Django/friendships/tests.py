@@ -1,6 +1,14 @@
+from accounts.models import UserProfile
+from accounts.services import UserService
+from datetime import timedelta
+from django.db import connection
+from friendships.constants import RECOMMENDATION_REFRESH_TIMEOUT
 from friendships.models import Friendship
 from friendships.services import FriendshipService
 from testing.testcases import TestCase
+from twitter.cache import RECOMMENDED_USERS_REFRESH_PATTERN
+from unittest.mock import patch
+from utils.redis_helper import RedisHelper
 
 
 class FriendshipServiceTests(TestCase):
@@ -24,3 +32,157 @@ class FriendshipServiceTests(TestCase):
         FriendshipService.invalidate_following_cache(self.linghu.id)
         user_id_set = FriendshipService.get_following_user_id_set(self.linghu.id)
         self.assertSetEqual(user_id_set, {user1.id, user2.id})
+
+    def test_get_followers(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        for from_user in [user1, user2]:
+            Friendship.objects.create(from_user=from_user, to_user=self.linghu)
+
+        self.assertSetEqual(
+            FriendshipService.get_follower_user_id_set(self.linghu.id),
+            {user1.id, user2.id},
+        )
+        self.assertSetEqual(
+            set(user.id for user in FriendshipService.get_followers(self.linghu)),
+            {user1.id, user2.id},
+        )
+
+        # invalidated by the friendship listeners
+        Friendship.objects.create(from_user=self.dongxie, to_user=self.linghu)
+        Friendship.objects.filter(from_user=user1).delete()
+        self.assertSetEqual(
+            FriendshipService.get_follower_user_id_set(self.linghu.id),
+            {user2.id, self.dongxie.id},
+        )
+
+    def test_friendship_counts(self):
+        # the profile is created after the friendship
+        Friendship.objects.create(from_user=self.dongxie, to_user=self.linghu)
+        self.assertEqual(FriendshipService.get_follower_count(self.linghu.id), 1)
+        self.assertEqual(self.dongxie.profile.followings_count, 1)
+
+        # maintained by the friendship listeners
+        user1 = self.create_user('user1')
+        Friendship.objects.create(from_user=user1, to_user=self.linghu)
+        self.assertEqual(FriendshipService.get_follower_count(self.linghu.id), 2)
+        Friendship.objects.filter(from_user=self.dongxie).delete()
+        self.assertEqual(FriendshipService.get_follower_count(self.linghu.id), 1)
+        self.assertEqual(
+            FriendshipService.get_user_ids_with_followers_at_least(
+                [self.linghu.id, self.dongxie.id],
+                1,
+            ),
+            {self.linghu.id},
+        )
+
+    def test_delete_user(self):
+        user1 = self.create_user('user1')
+        Friendship.objects.create(from_user=self.linghu, to_user=self.dongxie)
+        Friendship.objects.create(from_user=user1, to_user=self.linghu)
+        Friendship.objects.create(from_user=self.dongxie, to_user=self.linghu)
+        self.assertEqual(FriendshipService.get_follower_ids(self.dongxie.id), [self.linghu.id])
+        self.assertEqual(FriendshipService.get_mutual_user_id_set(self.dongxie.id), {self.linghu.id})
+        self.assertEqual(FriendshipService.get_following_user_id_set(user1.id), {self.linghu.id})
+        self.assertEqual(FriendshipService.get_follower_count(self.dongxie.id), 1)
+        self.assertEqual(UserService.get_profile_through_cache(user1.id).followings_count, 1)
+
+        # the friendships are kept with a null user
+        self.linghu.delete()
+        self.assertEqual(FriendshipService.get_follower_ids(self.dongxie.id), [])
+        self.assertEqual(FriendshipService.get_mutual_user_id_set(self.dongxie.id), set())
+        self.assertEqual(FriendshipService.get_following_user_id_set(user1.id), set())
+        self.assertEqual(FriendshipService.get_follower_count(self.dongxie.id), 0)
+        self.assertEqual(UserService.get_profile_through_cache(self.dongxie.id).followings_count, 0)
+        self.assertEqual(UserService.get_profile_through_cache(user1.id).followings_count, 0)
+
+        # nor are they counted by a profile created afterwards
+        user2 = self.create_user('user2')
+        user3 = self.create_user('user3')
+        Friendship.objects.create(from_user=user2, to_user=user3)
+        UserProfile.objects.filter(user=user3).delete()
+        user2.delete()
+        self.assertEqual(FriendshipService.get_follower_count(user3.id), 0)
+
+    def test_get_mutual_followers(self):
+        user1 = self.create_user('user1')
+        for user in [self.dongxie, user1]:
+            Friendship.objects.create(from_user=self.linghu, to_user=user)
+        Friendship.objects.create(from_user=self.dongxie, to_user=self.linghu)
+
+        mutual_followers = FriendshipService.get_mutual_followers(self.linghu.id)
+        self.assertEqual(
+            [user.id for user in mutual_followers],
+            [self.linghu.id, self.dongxie.id],
+        )
+        self.assertSetEqual(
+            FriendshipService.get_mutual_user_id_set(self.dongxie.id),
+            {self.linghu.id},
+        )
+
+        # invalidated by the friendship listeners
+        Friendship.objects.create(from_user=user1, to_user=self.linghu)
+        Friendship.objects.filter(from_user=self.dongxie).delete()
+        self.assertSetEqual(
+            FriendshipService.get_mutual_user_id_set(self.linghu.id),
+            {user1.id},
+        )
+        self.assertSetEqual(FriendshipService.get_mutual_user_id_set(self.dongxie.id), set())
+
+    @patch('friendships.services.RECOMMENDATION_FOLLOWINGS_LIMIT', 1)
+    def test_compute_recommended_user_ids(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        user3 = self.create_user('user3')
+        Friendship.objects.create(from_user=self.dongxie, to_user=user2)
+        Friendship.objects.create(from_user=user1, to_user=user3)
+        old_friendship = Friendship.objects.create(from_user=self.linghu, to_user=user1)
+        friendship = Friendship.objects.create(from_user=self.linghu, to_user=self.dongxie)
+        Friendship.objects.filter(id=old_friendship.id).update(
+            created_at=friendship.created_at - timedelta(days=1),
+        )
+
+        # the most recent followings are used, not the ones with the largest id
+        self.assertEqual(FriendshipService.compute_recommended_user_ids(self.linghu.id), [user2.id])
+
+        # the follows are not recomputed again while a recompute is queued
+        key = RECOMMENDED_USERS_REFRESH_PATTERN.format(user_id=self.linghu.id)
+        RedisHelper.add_value(key, 1, RECOMMENDATION_REFRESH_TIMEOUT)
+        Friendship.objects.create(from_user=self.linghu, to_user=user3)
+        self.assertEqual(FriendshipService.get_recommended_user_ids(self.linghu.id), [user2.id])
+
+        # the queued recompute picks them up
+        self.assertEqual(FriendshipService.compute_recommended_user_ids(self.linghu.id), [])
+        self.assertTrue(RedisHelper.add_value(key, 1, RECOMMENDATION_REFRESH_TIMEOUT))
+
+    def test_batch_follow(self):
+        user1 = self.create_user('user1')
+        user2 = self.create_user('user2')
+        Friendship.objects.create(from_user=self.dongxie, to_user=user1)
+        Friendship.objects.create(from_user=self.dongxie, to_user=user2)
+        Friendship.objects.create(from_user=self.linghu, to_user=self.dongxie)
+        self.assertEqual(
+            FriendshipService.compute_recommended_user_ids(self.linghu.id),
+            [user1.id, user2.id],
+        )
+
+        # the followed users are dropped from the recommendations at once
+        key = RECOMMENDED_USERS_REFRESH_PATTERN.format(user_id=self.linghu.id)
+        RedisHelper.add_value(key, 1, RECOMMENDATION_REFRESH_TIMEOUT)
+        self.assertEqual(
+            FriendshipService.batch_follow(self.linghu.id, [user1.id, self.dongxie.id]),
+            [user1.id],
+        )
+        self.assertEqual(FriendshipService.get_recommended_user_ids(self.linghu.id), [user2.id])
+        self.assertEqual(UserService.get_profile_through_cache(self.linghu.id).followings_count, 2)
+
+        # the friendships created in between are not counted again, with or
+        # without RETURNING
+        with patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.assertEqual(
+                FriendshipService.batch_follow(self.linghu.id, [user1.id, user2.id]),
+                [user2.id],
+            )
+            self.assertEqual(FriendshipService.batch_follow(self.linghu.id, [user2.id]), [])
+        self.assertEqual(UserService.get_profile_through_cache(self.linghu.id).followings_count, 3)
+        self.assertEqual(FriendshipService.get_follower_count(user2.id), 2)
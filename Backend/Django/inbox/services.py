@@ -1,27 +1,33 @@
 from comments.models import Comment
-from django.contrib.contenttypes.models import ContentType
+from likes.registry import like_target_registry
 from notifications.signals import notify
 from tweets.models import Tweet
+from utils.memcached_helper import MemcachedHelper
 
 
 class NotificationService(object):
     
     @classmethod
     def send_like_notification(cls, like):
-        target = like.content_object
-        if like.user == target.user:
+        model_class = like_target_registry.get_model_class_by_content_type_id(like.content_type_id)
+        # the users and the tweets are read through the object cache
+        if model_class == Tweet:
+            target = MemcachedHelper.get_object_through_cache(Tweet, like.object_id)
+        else:
+            target = like.content_object
+        if like.user_id == target.user_id:
             return
-        if like.content_type == ContentType.objects.get_for_model(Tweet):
+        if model_class == Tweet:
             notify.send(
-                like.user,
-                recipient=target.user,
+                like.cached_user,
+                recipient=target.cached_user,
                 verb='liked your tweet',
                 target=target
             )
-        if like.content_type == ContentType.objects.get_for_model(Comment):
+        if model_class == Comment:
             notify.send(
-                like.user,
-                recipient=target.user,
+                like.cached_user,
+                recipient=target.cached_user,
                 verb='liked your comment',
                 target=target
             )
@@ -1,10 +1,12 @@
 from accounts.api.serializers import UserSerializerForLike
-from comments.models import Comment
-from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth.models import User
 from likes.models import Like
+from likes.registry import like_target_registry
+from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from tweets.models import Tweet
+from utils.memcached_helper import MemcachedHelper
+from utils.serializers import PrefetchListSerializer
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -13,6 +15,13 @@ class LikeSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = Like
 		fields = ('user', 'created_at')
+		list_serializer_class = PrefetchListSerializer
+
+	def prefetch(self, likes):
+		users = MemcachedHelper.prefetch_objects_through_cache(
+			likes, User, 'user_id', '_cached_user',
+		)
+		self.fields['user'].prefetch(users)
 
 
 class LikeSerializerForCreateAndCancel(serializers.ModelSerializer):
@@ -24,18 +33,15 @@ class LikeSerializerForCreateAndCancel(serializers.ModelSerializer):
 		fields = ('content_type', 'object_id')
 
 	def _get_model_class(self, data):
-		if data['content_type'] == 'comment':
-			return Comment
-		if data['content_type'] == 'tweet':
-			return Tweet
-		return None
+		return like_target_registry.get_model_class(data['content_type'])
 
 	def validate(self, data):
 		model_class = self._get_model_class(data)
 		if model_class is None:
 			raise ValidationError({'content_type': 'Content type does not exist'})
-		liked_object = model_class.objects.filter(id=data['object_id']).first()
-		if liked_object is None:
+		if MemcachedHelper.is_cached(model_class, data['object_id']):
+			return data
+		if not model_class.objects.filter(id=data['object_id']).exists():
 			raise ValidationError({'object_id': 'Object does not exist'})
 		return data
 
@@ -43,18 +49,34 @@ class LikeSerializerForCreate(LikeSerializerForCreateAndCancel):
 	def get_or_create(self):
 		validated_data = self.validated_data
 		model_class = self._get_model_class(validated_data)
-		return Like.objects.get_or_create(
-			content_type=ContentType.objects.get_for_model(model_class),
-			object_id=validated_data['object_id'],
-			user=self.context['request'].user,
+		return LikeService.like(
+			self.context['request'].user.id,
+			model_class,
+			validated_data['object_id'],
 		)
 
 
 class LikeSerializerForCancel(LikeSerializerForCreateAndCancel):
 	def cancel(self):
 		model_class = self._get_model_class(self.validated_data)
-		deleted, _ = Like.objects.filter(
-			content_type=ContentType.objects.get_for_model(model_class),
-			object_id=self.validated_data['object_id'],
-			user=self.context['request'].user,
-		).delete()
+		return LikeService.unlike(
+			self.context['request'].user.id,
+			model_class,
+			self.validated_data['object_id'],
+		)
+
+
+class LikeSerializerForToggle(LikeSerializerForCreateAndCancel):
+	liked = serializers.BooleanField()
+
+	class Meta:
+		model = Like
+		fields = ('content_type', 'object_id', 'liked')
+
+	def toggle(self):
+		LikeService.request_toggle(
+			self.context['request'].user.id,
+			self._get_model_class(self.validated_data),
+			self.validated_data['object_id'],
+			self.validated_data['liked'],
+		)
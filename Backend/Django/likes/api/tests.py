@@ -1,12 +1,23 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from likes.models import Like
+from likes.registry import like_target_registry
+from likes.services import LikeService
 from testing.testcases import TestCase
+from tweets.models import Tweet
+from twitter.cache import LIKE_TOGGLE_PATTERN
+from utils.memcached_helper import MemcachedHelper
+from utils.redis_helper import RedisHelper
 
 
 LIKE_BASE_URL = '/api/likes/'
 LIKE_CANCEL_URL = '/api/likes/cancel/'
+LIKE_TOGGLE_URL = '/api/likes/toggle/'
 
 class LikeApiTests(TestCase):
 
     def setUp(self):
+        self.clear_cache()
         self.daniel, self.daniel_client = self.create_user_and_client('daniel')
         self.ybb, self.ybb_client = self.create_user_and_client('ybb')
 
@@ -128,4 +139,88 @@ class LikeApiTests(TestCase):
         response = self.daniel_client.post(LIKE_CANCEL_URL, like_comment_data)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(tweet.like_set.count(), 0)
-        self.assertEqual(comment.like_set.count(), 0)
\ No newline at end of file
+        self.assertEqual(comment.like_set.count(), 0)
+
+    def test_no_content_type_queries(self):
+        tweet = self.create_tweet(self.daniel)
+        comment = self.create_comment(self.daniel, tweet)
+        # the content types are resolved once per process
+        self.ybb_client.post(LIKE_BASE_URL, {'content_type': 'tweet', 'object_id': tweet.id})
+
+        with CaptureQueriesContext(connection) as captured:
+            for content_type, target in [('tweet', tweet), ('comment', comment)]:
+                data = {'content_type': content_type, 'object_id': target.id}
+                response = self.daniel_client.post(LIKE_BASE_URL, data)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(LikeService.has_liked(self.daniel, target), True)
+                response = self.daniel_client.post(LIKE_BASE_URL, data)
+                self.assertEqual(response.status_code, 201)
+                response = self.daniel_client.post(LIKE_CANCEL_URL, data)
+                self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            'django_content_type' in query['sql']
+            for query in captured.captured_queries
+        ))
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 0)
+
+    def test_like_in_one_query(self):
+        tweet = self.create_tweet(self.daniel)
+        with CaptureQueriesContext(connection) as captured:
+            like, created = LikeService.like(self.ybb.id, Tweet, tweet.id)
+        self.assertEqual(created, True)
+        self.assertEqual(len(captured.captured_queries), 1)
+        self.assertEqual(Like.objects.get(id=like.id).user_id, self.ybb.id)
+
+        # duplicate likes are no-ops
+        duplicate, created = LikeService.like(self.ybb.id, Tweet, tweet.id)
+        self.assertEqual(created, False)
+        self.assertEqual(duplicate.id, like.id)
+        self.assertEqual(tweet.like_set.count(), 1)
+
+        # a cached target is not read again to validate the like
+        MemcachedHelper.get_object_through_cache(Tweet, tweet.id)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.daniel_client.post(LIKE_BASE_URL, {
+                'content_type': 'tweet',
+                'object_id': tweet.id,
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(any('tweets_tweet' in query['sql'] for query in captured.captured_queries))
+
+    def test_toggle(self):
+        tweet = self.create_tweet(self.daniel)
+        data = {'content_type': 'tweet', 'object_id': tweet.id}
+        response = self.ybb_client.post(LIKE_TOGGLE_URL, data)
+        self.assertEqual(response.status_code, 400)
+        response = self.ybb_client.post(LIKE_TOGGLE_URL, dict(data, liked=True))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['liked'], True)
+        self.assertEqual(LikeService.has_liked(self.ybb, tweet), True)
+        self.ybb_client.post(LIKE_TOGGLE_URL, dict(data, liked=False))
+        self.assertEqual(LikeService.has_liked(self.ybb, tweet), False)
+
+    def test_toggle_coalescing(self):
+        tweet = self.create_tweet(self.daniel)
+        content_type_id = like_target_registry.get_content_type_id(Tweet)
+        key = LIKE_TOGGLE_PATTERN.format(
+            user_id=self.ybb.id,
+            content_type_id=content_type_id,
+            object_id=tweet.id,
+        )
+        # flips within the window only replace the pending state
+        for liked in [1, 0, 1, 0, 1]:
+            RedisHelper.replace_value(key, liked, 10)
+        with CaptureQueriesContext(connection) as captured:
+            LikeService.apply_toggle(self.ybb.id, content_type_id, tweet.id)
+        self.assertEqual(
+            len([query for query in captured.captured_queries if 'likes_like' in query['sql']]),
+            1,
+        )
+        self.assertEqual(tweet.like_set.count(), 1)
+
+        # applied once
+        self.assertEqual(
+            LikeService.apply_toggle(self.ybb.id, content_type_id, tweet.id),
+            'no pending state.',
+        )
@@ -3,6 +3,7 @@ from likes.api.serializers import (
 	LikeSerializer,
 	LikeSerializerForCreate,
 	LikeSerializerForCancel,
+	LikeSerializerForToggle,
 )
 from likes.models import Like
 from rest_framework.decorators import action
@@ -52,3 +53,23 @@ class LikeViewSet(viewsets.GenericViewSet):
 		return Response({
 			'success': True,
 		}, status=status.HTTP_200_OK)
+
+	@action(methods=['POST'], detail=False)
+	@required_params(method='POST', params=['content_type', 'object_id', 'liked'])
+	def toggle(self, request):
+		# for rapid taps on the heart, the flips are coalesced and only the
+		# last state is written a moment later
+		serializer = LikeSerializerForToggle(
+			data=request.data,
+			context={'request': request},
+		)
+		if not serializer.is_valid():
+			return Response({
+				'message': 'Please check input',
+				'errors': serializer.errors,
+			}, status=status.HTTP_400_BAD_REQUEST)
+		serializer.toggle()
+		return Response({
+			'success': True,
+			'liked': serializer.validated_data['liked'],
+		}, status=status.HTTP_202_ACCEPTED)
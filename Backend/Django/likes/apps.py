@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class LikesConfig(AppConfig):
     name = 'likes'
+
+    def ready(self):
+        from comments.models import Comment
+        from likes.registry import like_target_registry
+        from tweets.models import Tweet
+
+        like_target_registry.register('tweet', Tweet)
+        like_target_registry.register('comment', Comment)
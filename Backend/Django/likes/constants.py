@@ -0,0 +1,5 @@
+# like/unlike flips of the same user on the same object within this many
+# seconds are coalesced, only the last state is written to the database
+LIKE_TOGGLE_COALESCE_WINDOW = 2
+# the pending state outlives the window, in case the task applying it is late
+LIKE_TOGGLE_STATE_TIMEOUT = 10 * LIKE_TOGGLE_COALESCE_WINDOW
@@ -1,27 +1,48 @@
 def incr_likes_count(sender, instance, created, **kwargs):
+    from comments.models import Comment
+    from comments.services import CommentService
+    from likes.registry import like_target_registry
     from tweets.models import Tweet
-    from django.db.models import F
+    from tweets.services import TweetService
 
     if not created:
         return
 
-    model_class = instance.content_type.model_class()
+    # content_type_id, loading the content_type FK would be a query
+    model_class = like_target_registry.get_model_class_by_content_type_id(instance.content_type_id)
+    if model_class == Comment:
+        CommentService.incr_likes_count(
+            instance.object_id,
+            CommentService.get_tweet_id(instance.object_id),
+            1,
+        )
+        return
     if model_class != Tweet:
-        # TODO HOMEWORK 给 Comment 使用类似的方法进行 likes_count 的统计
         return
 
-    # 不可以使用 tweet.likes_count += 1; tweet.save() 的方式
-    # 因此这个操作不是原子操作，必须使用 update 语句才是原子操作
-    Tweet.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') + 1)
+    # updating the same row for every like of a popular tweet causes lock
+    # contention, so the like is counted in redis and flushed in batch by
+    # flush_tweet_counts_task
+    TweetService.incr_count(instance.object_id, 'likes_count', 1)
 
 def decr_likes_count(sender, instance, **kwargs):
+    from comments.models import Comment
+    from comments.services import CommentService
+    from likes.registry import like_target_registry
     from tweets.models import Tweet
-    from django.db.models import F
+    from tweets.services import TweetService
 
-    model_class = instance.content_type.model_class()
+    # content_type_id, loading the content_type FK would be a query
+    model_class = like_target_registry.get_model_class_by_content_type_id(instance.content_type_id)
+    if model_class == Comment:
+        CommentService.incr_likes_count(
+            instance.object_id,
+            CommentService.get_tweet_id(instance.object_id),
+            -1,
+        )
+        return
     if model_class != Tweet:
-        # TODO HOMEWORK 给 Comment 使用类似的方法进行 likes_count 的统计
         return
 
     # handle tweet likes cancel
-    Tweet.objects.filter(id=instance.object_id).update(likes_count=F('likes_count') - 1)
+    TweetService.incr_count(instance.object_id, 'likes_count', -1)
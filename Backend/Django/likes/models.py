@@ -33,7 +33,10 @@ class Like(models.Model):
 	
 	@property
 	def cached_user(self):
-		return MemcachedHelper.get_object_through_cache(User, self.user_id)
+		# set in batch by the list serializers, see MemcachedHelper.prefetch_objects_through_cache
+		if not hasattr(self, '_cached_user'):
+			self._cached_user = MemcachedHelper.get_object_through_cache(User, self.user_id)
+		return self._cached_user
 	
 pre_delete.connect(decr_likes_count, sender=Like)
 post_save.connect(incr_likes_count, sender=Like)
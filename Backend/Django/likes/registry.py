@@ -0,0 +1,54 @@
+import threading
+from django.contrib.contenttypes.models import ContentType
+
+
+class LikeTargetRegistry:
+    """
+    the models which can be liked, by the content_type name the like api
+    takes. the models are registered by LikesConfig.ready, their content type
+    ids are resolved once per process with a single query, so the like path
+    never reads django_content_type afterwards.
+    """
+
+    def __init__(self):
+        self._name_to_model_class = {}
+        self._model_class_to_content_type_id = None
+        self._content_type_id_to_model_class = None
+        self._lock = threading.Lock()
+
+    def register(self, name, model_class):
+        self._name_to_model_class[name] = model_class
+        self._model_class_to_content_type_id = None
+
+    def get_model_class(self, name):
+        return self._name_to_model_class.get(name)
+
+    def _load_content_type_ids(self):
+        if self._model_class_to_content_type_id is not None:
+            return self._model_class_to_content_type_id
+        # the database is not ready when the apps are loaded (e.g. migrate),
+        # the content types are read on first use instead
+        with self._lock:
+            if self._model_class_to_content_type_id is None:
+                content_types = ContentType.objects.get_for_models(
+                    *self._name_to_model_class.values()
+                )
+                self._content_type_id_to_model_class = {
+                    content_type.id: model_class
+                    for model_class, content_type in content_types.items()
+                }
+                self._model_class_to_content_type_id = {
+                    model_class: content_type.id
+                    for model_class, content_type in content_types.items()
+                }
+        return self._model_class_to_content_type_id
+
+    def get_content_type_id(self, model_class):
+        return self._load_content_type_ids()[model_class]
+
+    def get_model_class_by_content_type_id(self, content_type_id):
+        self._load_content_type_ids()
+        return self._content_type_id_to_model_class.get(content_type_id)
+
+
+like_target_registry = LikeTargetRegistry()
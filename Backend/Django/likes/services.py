@@ -1,5 +1,22 @@
+from django.db import connection
+from django.db.models.constants import OnConflict
+from django.db.models.signals import post_save
+from django.utils import timezone
+from likes.constants import LIKE_TOGGLE_COALESCE_WINDOW, LIKE_TOGGLE_STATE_TIMEOUT
 from likes.models import Like
-from django.contrib.contenttypes.models import ContentType
+from likes.registry import like_target_registry
+from twitter.cache import LIKE_TOGGLE_PATTERN
+from utils.redis_helper import RedisHelper
+
+# the unique (user, content_type, object_id) makes a duplicate like a no-op,
+# RETURNING tells if the row is created, all in one roundtrip. the clauses
+# come from the database backend, see LikeService.get_insert_like_sql
+INSERT_LIKE_SQL = """
+{insert} {table} (user_id, content_type_id, object_id, created_at)
+VALUES (%s, %s, %s, %s)
+{on_conflict}
+{returning}
+"""
 
 
 class LikeService(object):
@@ -9,7 +26,145 @@ class LikeService(object):
         if user.is_anonymous:
             return False
         return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(target.__class__),
+            content_type_id=like_target_registry.get_content_type_id(target.__class__),
             object_id=target.id,
             user=user,
         ).exists()
+
+    @classmethod
+    def get_liked_object_ids(cls, user, targets):
+        """
+        the ids of the targets (objects of the same model) liked by the user,
+        in one IN query instead of one has_liked per target
+        """
+        if user.is_anonymous or not targets:
+            return set()
+        return set(Like.objects.filter(
+            content_type_id=like_target_registry.get_content_type_id(targets[0].__class__),
+            object_id__in=[target.id for target in targets],
+            user=user,
+        ).values_list('object_id', flat=True))
+
+    @classmethod
+    def get_insert_like_sql(cls):
+        # e.g. INSERT ... ON CONFLICT DO NOTHING on postgres, INSERT OR
+        # IGNORE on sqlite
+        returning, _ = connection.ops.return_insert_columns([Like._meta.pk])
+        return INSERT_LIKE_SQL.format(
+            insert=connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            table=connection.ops.quote_name(Like._meta.db_table),
+            on_conflict=connection.ops.on_conflict_suffix_sql(
+                [],
+                OnConflict.IGNORE,
+                [],
+                [],
+            ),
+            returning=returning,
+        )
+
+    @classmethod
+    def like(cls, user_id, model_class, object_id):
+        """
+        return (like, created), a duplicate like reads the existing one
+        """
+        content_type_id = like_target_registry.get_content_type_id(model_class)
+        # the single roundtrip needs an INSERT which both skips a duplicate
+        # and returns the new id
+        if not connection.features.can_return_columns_from_insert or \
+                not connection.features.supports_ignore_conflicts:
+            return Like.objects.get_or_create(
+                user_id=user_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+            )
+
+        created_at = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                cls.get_insert_like_sql(),
+                [
+                    user_id,
+                    content_type_id,
+                    object_id,
+                    connection.ops.adapt_datetimefield_value(created_at),
+                ],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            like = Like.objects.get(
+                user_id=user_id,
+                content_type_id=content_type_id,
+                object_id=object_id,
+            )
+            return like, False
+
+        like = Like(
+            id=row[0],
+            user_id=user_id,
+            content_type_id=content_type_id,
+            object_id=object_id,
+            created_at=created_at,
+        )
+        # the raw INSERT sends no signal, the like listeners count it as usual
+        post_save.send(
+            sender=Like,
+            instance=like,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=connection.alias,
+        )
+        return like, True
+
+    @classmethod
+    def unlike(cls, user_id, model_class, object_id):
+        deleted, _ = Like.objects.filter(
+            user_id=user_id,
+            content_type_id=like_target_registry.get_content_type_id(model_class),
+            object_id=object_id,
+        ).delete()
+        return deleted
+
+    @classmethod
+    def request_toggle(cls, user_id, model_class, object_id, liked):
+        """
+        like or unlike after LIKE_TOGGLE_COALESCE_WINDOW seconds, the flips in
+        between only replace the pending state and never touch the database
+        """
+        # import here to avoid circular dependency
+        from likes.tasks import apply_like_toggle_task
+
+        content_type_id = like_target_registry.get_content_type_id(model_class)
+        key = LIKE_TOGGLE_PATTERN.format(
+            user_id=user_id,
+            content_type_id=content_type_id,
+            object_id=object_id,
+        )
+        previous = RedisHelper.replace_value(key, int(liked), LIKE_TOGGLE_STATE_TIMEOUT)
+        # the first flip of the window schedules the write
+        if previous is None:
+            apply_like_toggle_task.apply_async(
+                args=[user_id, content_type_id, object_id],
+                countdown=LIKE_TOGGLE_COALESCE_WINDOW,
+            )
+
+    @classmethod
+    def apply_toggle(cls, user_id, content_type_id, object_id):
+        # import here to avoid circular dependency
+        from inbox.services import NotificationService
+
+        key = LIKE_TOGGLE_PATTERN.format(
+            user_id=user_id,
+            content_type_id=content_type_id,
+            object_id=object_id,
+        )
+        liked = RedisHelper.pop_value(key)
+        if liked is None:
+            return 'no pending state.'
+        model_class = like_target_registry.get_model_class_by_content_type_id(content_type_id)
+        if not int(liked):
+            return '{} likes deleted.'.format(cls.unlike(user_id, model_class, object_id))
+        like, created = cls.like(user_id, model_class, object_id)
+        if created:
+            NotificationService.send_like_notification(like)
+        return 'like created.' if created else 'already liked.'
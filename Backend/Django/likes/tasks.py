@@ -0,0 +1,9 @@
+from celery import shared_task
+from likes.services import LikeService
+from utils.time_constants import ONE_MINUTE
+
+
+@shared_task(time_limit=ONE_MINUTE)
+def apply_like_toggle_task(user_id, content_type_id, object_id):
+    # scheduled by LikeService.request_toggle once per coalescing window
+    return LikeService.apply_toggle(user_id, content_type_id, object_id)
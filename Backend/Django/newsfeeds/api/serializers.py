@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from newsfeeds.models import NewsFeed
 from tweets.api.serializers import TweetSerializer
+from tweets.models import Tweet
+from utils.memcached_helper import MemcachedHelper
+from utils.serializers import PrefetchListSerializer
 
 
 class NewsFeedSerializer(serializers.ModelSerializer):
@@ -8,4 +11,11 @@ class NewsFeedSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = NewsFeed
-        fields = ('id', 'created_at', 'tweet')
\ No newline at end of file
+        fields = ('id', 'created_at', 'tweet')
+        list_serializer_class = PrefetchListSerializer
+
+    def prefetch(self, newsfeeds):
+        tweets = MemcachedHelper.prefetch_objects_through_cache(
+            newsfeeds, Tweet, 'tweet_id', '_cached_tweet',
+        )
+        self.fields['tweet'].prefetch(tweets)
\ No newline at end of file
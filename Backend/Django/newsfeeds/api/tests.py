@@ -1,7 +1,12 @@
+from django.conf import settings
+from django.test import override_settings
 from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
 from friendships.models import Friendship
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from utils.paginations import EndlessPagination
+from utils.time_helpers import utc_now
 
 
 NEWSFEEDS_URL = '/api/newsfeeds/'
@@ -12,6 +17,7 @@ FOLLOW_URL = '/api/friendships/{}/follow/'
 class NewsFeedApiTests(TestCase):
 
     def setUp(self):
+        self.clear_cache()
         self.linghu = self.create_user('linghu')
         self.linghu_client = APIClient()
         self.linghu_client.force_authenticate(self.linghu)
@@ -52,3 +58,163 @@ class NewsFeedApiTests(TestCase):
         response = self.linghu_client.get(NEWSFEEDS_URL)
         self.assertEqual(len(response.data['results']), 2)
         self.assertEqual(response.data['results'][0]['tweet']['id'], posted_tweet_id)
+
+    @override_settings(NEWSFEED_CELEBRITY_THRESHOLD=3)
+    def test_celebrity_newsfeeds(self):
+        # dongxie becomes a celebrity after linghu follows him
+        self.linghu_client.post(FOLLOW_URL.format(self.dongxie.id))
+        posted_tweet_ids = []
+        for i in range(EndlessPagination.page_size):
+            response = self.dongxie_client.post(POST_TWEETS_URL, {
+                'content': 'Hello Celebrity {}'.format(i),
+            })
+            posted_tweet_ids.append(response.data['id'])
+        response = self.linghu_client.post(POST_TWEETS_URL, {'content': 'Hello World'})
+        posted_tweet_ids.append(response.data['id'])
+
+        # the tweets of dongxie are not pushed to followers
+        self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), 1)
+        self.assertEqual(NewsFeed.objects.filter(user=self.dongxie).count(), 10)
+
+        # but linghu can still read them from the newsfeed, ordered by time
+        response = self.linghu_client.get(NEWSFEEDS_URL)
+        self.assertEqual(response.data['has_next_page'], True)
+        results = response.data['results']
+        self.assertEqual(len(results), EndlessPagination.page_size)
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            posted_tweet_ids[::-1][:EndlessPagination.page_size],
+        )
+
+        response = self.linghu_client.get(NEWSFEEDS_URL, {
+            'created_at__lt': results[-1]['created_at'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], posted_tweet_ids[0])
+
+        response = self.linghu_client.get(NEWSFEEDS_URL, {
+            'created_at__gt': results[1]['created_at'],
+        })
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], posted_tweet_ids[-1])
+
+        # the tweets are still pulled after dongxie drops below the threshold
+        Friendship.objects.filter(to_user=self.dongxie).exclude(from_user=self.linghu).first().delete()
+        # as if the cached followed celebrities expired
+        NewsFeedService.invalidate_followed_celebrities(self.linghu.id)
+        response = self.linghu_client.get(NEWSFEEDS_URL)
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            posted_tweet_ids[::-1][:EndlessPagination.page_size],
+        )
+
+        # and the new ones are pushed as usual
+        response = self.dongxie_client.post(POST_TWEETS_URL, {'content': 'Hello again'})
+        tweet_id = response.data['id']
+        self.assertTrue(NewsFeed.objects.filter(user=self.linghu, tweet_id=tweet_id).exists())
+        response = self.linghu_client.get(NEWSFEEDS_URL)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], tweet_id)
+
+    def test_newsfeeds_of_deleted_tweets(self):
+        tweets = [self.create_tweet(self.dongxie) for _ in range(3)]
+        for tweet in tweets:
+            NewsFeed.objects.create(user=self.linghu, tweet=tweet)
+        # the newsfeed is kept with a null tweet
+        tweets[1].delete()
+        NewsFeedService.invalidate_cached_newsfeeds(self.linghu.id)
+
+        results = []
+        params = {'page_size': 1}
+        while True:
+            response = self.linghu_client.get(NEWSFEEDS_URL, params)
+            self.assertEqual(response.status_code, 200)
+            results.extend(response.data['results'])
+            if not response.data['has_next_page']:
+                break
+            params = {'page_size': 1, 'cursor': response.data['next_cursor']}
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            [tweets[2].id, tweets[0].id],
+        )
+
+        # the pulled tweets are not compared with the null tweet either
+        newsfeeds = NewsFeedService.merge_pulled_tweets(
+            self.linghu.id,
+            [NewsFeed(user=self.linghu, tweet_id=None, created_at=tweets[0].created_at)],
+            [tweets[0]],
+        )
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweets[0].id])
+
+    def test_deleted_tweets_in_cached_newsfeeds(self):
+        tweets = [self.create_tweet(self.dongxie) for _ in range(3)]
+        for tweet in tweets:
+            NewsFeed.objects.create(user=self.linghu, tweet=tweet)
+        response = self.linghu_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(response.data['results']), 3)
+
+        # the deleted tweet is still in the cached newsfeeds
+        tweets[2].delete()
+        response = self.linghu_client.get(NEWSFEEDS_URL, {'page_size': 1})
+        self.assertEqual(response.data['results'][0]['tweet']['id'], tweets[1].id)
+        self.assertEqual(response.data['has_next_page'], True)
+        response = self.linghu_client.get(NEWSFEEDS_URL)
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            [tweets[1].id, tweets[0].id],
+        )
+
+    def test_pagination_beyond_cached_newsfeeds(self):
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        page_size = EndlessPagination.page_size
+        newsfeeds = []
+        for i in range(list_limit + page_size):
+            tweet = self.create_tweet(self.dongxie, 'newsfeed {}'.format(i))
+            newsfeeds.append(NewsFeed.objects.create(user=self.linghu, tweet=tweet))
+        newsfeeds = newsfeeds[::-1]
+
+        # only the newest newsfeeds are cached
+        response = self.linghu_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(NewsFeedService.get_cached_newsfeeds(self.linghu.id)), list_limit)
+
+        results = []
+        while True:
+            results.extend(response.data['results'])
+            if not response.data['has_next_page']:
+                break
+            response = self.linghu_client.get(NEWSFEEDS_URL, {
+                'created_at__lt': response.data['results'][-1]['created_at'],
+            })
+        self.assertEqual([r['id'] for r in results], [f.id for f in newsfeeds])
+
+    def test_cursor_pagination_with_same_created_at(self):
+        # e.g. the newsfeeds created by one fanout batch
+        created_at = utc_now()
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        tweets = [self.create_tweet(self.dongxie) for _ in range(list_limit + 5)]
+        for tweet in tweets:
+            NewsFeed.objects.create(user=self.linghu, tweet=tweet, created_at=created_at)
+
+        # pages in the cached window and beyond it
+        results = []
+        params = {'page_size': 4}
+        while True:
+            response = self.linghu_client.get(NEWSFEEDS_URL, params)
+            self.assertLessEqual(len(response.data['results']), 4)
+            results.extend(response.data['results'])
+            if not response.data['has_next_page']:
+                break
+            params = {'page_size': 4, 'cursor': response.data['next_cursor']}
+        self.assertEqual(
+            [result['tweet']['id'] for result in results],
+            sorted([tweet.id for tweet in tweets], reverse=True),
+        )
+
+        # the page size is bounded, and so is the refresh
+        response = self.linghu_client.get(NEWSFEEDS_URL, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), EndlessPagination.max_page_size)
+        response = self.linghu_client.get(NEWSFEEDS_URL, {
+            'created_at__gt': '2000-01-01T00:00:00Z',
+        })
+        self.assertEqual(len(response.data['results']), EndlessPagination.page_size)
+        self.assertEqual(response.data['has_next_page'], True)
@@ -1,17 +1,40 @@
+from functools import partial
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from newsfeeds.models import NewsFeed
 from newsfeeds.api.serializers import NewsFeedSerializer
-from utils.paginations import EndlessPagination
+from newsfeeds.services import NewsFeedService
+from utils.paginations import NewsFeedPagination
 
 
 class NewsFeedViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
-    pagination_class = EndlessPagination
+    pagination_class = NewsFeedPagination
 
     def list(self, request):
-        queryset = NewsFeed.objects.filter(user=self.request.user)
-        page = self.paginate_queryset(queryset)
+        # pushed newsfeeds and tweets pulled from followed celebrities, each
+        # one is bounded by the page size so the merge is O(page_size)
+        newsfeeds = self.paginator.slice_cached_list(
+            partial(NewsFeedService.get_cached_newsfeeds_slice, self.request.user.id),
+            request,
+        )
+        # the page is older than the cached newsfeeds, read from the database
+        if newsfeeds is None:
+            newsfeeds = self.paginator.slice_queryset(
+                NewsFeed.objects.filter(user=self.request.user, tweet_id__isnull=False),
+                request,
+            )
+        tweets = self.paginator.slice_queryset(
+            NewsFeedService.get_celebrity_tweets(self.request.user.id),
+            request,
+            tiebreak_field='id',
+        )
+        newsfeeds = NewsFeedService.merge_pulled_tweets(
+            self.request.user.id,
+            newsfeeds,
+            tweets,
+        )
+        page = self.paginator.paginate_ordered_list(newsfeeds, request)
         serializer = NewsFeedSerializer(
             page,
             context={'request': request},
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+# how many follower ids a single fanout batch task writes newsfeeds for
+FANOUT_BATCH_SIZE = 3 if settings.TESTING else 1000
+
+# how many of the newest tweets of newly followed users are backfilled into
+# the follower's newsfeed
+NEWSFEED_BACKFILL_LIMIT = 5 if settings.TESTING else 100
+
+# how many newsfeeds of an unfollowed user a single DELETE removes
+NEWSFEED_CLEANUP_BATCH_SIZE = 3 if settings.TESTING else 1000
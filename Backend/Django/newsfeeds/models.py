@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from tweets.models import Tweet
 from utils.memcached_helper import MemcachedHelper
 
@@ -8,7 +9,9 @@ class NewsFeed(models.Model):
     # user means who can see this tweet news instead of who create this tweet news
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     tweet = models.ForeignKey(Tweet, on_delete=models.SET_NULL, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # copied from the tweet instead of auto_now_add, fanout is asynchronous and
+    # the feed should be ordered by when the tweet was posted, not delivered
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         index_together = (('user', 'created_at'),)
@@ -20,4 +23,7 @@ class NewsFeed(models.Model):
     
     @property
     def cached_tweet(self):
-        return MemcachedHelper.get_object_through_cache(Tweet, self.tweet_id)
+        # set in batch by the list serializers, see MemcachedHelper.prefetch_objects_through_cache
+        if not hasattr(self, '_cached_tweet'):
+            self._cached_tweet = MemcachedHelper.get_object_through_cache(Tweet, self.tweet_id)
+        return self._cached_tweet
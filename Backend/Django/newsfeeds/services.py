@@ -1,22 +1,187 @@
+from django.conf import settings
+from django.core.cache import caches
 from friendships.services import FriendshipService
+from newsfeeds.constants import NEWSFEED_BACKFILL_LIMIT, NEWSFEED_CLEANUP_BATCH_SIZE
 from newsfeeds.models import NewsFeed
+from newsfeeds.tasks import fanout_newsfeeds_main_task
+from tweets.models import Tweet
+from twitter.cache import FOLLOWED_CELEBRITIES_PATTERN, USER_NEWSFEEDS_PATTERN
+from utils.memcached_helper import MemcachedHelper
+from utils.redis_helper import RedisHelper
+from utils.time_constants import ONE_MINUTE
+
+cache = caches['testing'] if settings.TESTING else caches['default']
 
 
 class NewsFeedService(object):
 
     @classmethod
     def fanout_to_followers(cls, tweet):
-        # can not use for + query
-        # for follower in FriendshipService.get_followers(tweet.user):
-        #     NewsFeed.objects.create(
-        #         user=follower,
-        #         tweet=tweet,
-        #     )
-
-        # use bulk_create, to improve the insert performance from O(n) to O(1)
+        # the author can see the tweet in their own newsfeed right away,
+        # this is a single insert so it is fine to do it in the request
+        newsfeed = NewsFeed.objects.create(
+            user_id=tweet.user_id,
+            tweet_id=tweet.id,
+            created_at=tweet.created_at,
+        )
+        cls.push_newsfeeds_to_cache([newsfeed])
+
+        # tweets of celebrities are pulled by their followers when they read
+        # the newsfeed, writing one newsfeed per follower is too expensive
+        # for them. it is decided once when the tweet is posted, so the tweet
+        # is read the same way however the followers count changes later.
+        follower_count = FriendshipService.get_follower_count(tweet.user_id)
+        if follower_count >= settings.NEWSFEED_CELEBRITY_THRESHOLD:
+            Tweet.objects.filter(id=tweet.id).update(posted_as_celebrity=True)
+            tweet.posted_as_celebrity = True
+            MemcachedHelper.invalidate_cached_object(Tweet, tweet.id)
+            return
+
+        # writing one newsfeed per follower costs O(followers), so it is done
+        # asynchronously by celery and the request returns in constant time.
+        # the newsfeeds use the tweet's created_at, so the order of the feed
+        # does not depend on when the fanout tasks are actually executed.
+        fanout_newsfeeds_main_task.delay(tweet.id, tweet.created_at, tweet.user_id)
+
+    @classmethod
+    def get_cached_newsfeeds(cls, user_id):
+        return cls.get_cached_newsfeeds_slice(user_id).objects
+
+    @classmethod
+    def get_cached_newsfeeds_slice(cls, user_id, **kwargs):
+        """
+        see RedisHelper.load_objects_slice for kwargs
+        """
+        queryset = NewsFeed.objects.filter(
+            user_id=user_id,
+            tweet_id__isnull=False,
+        ).order_by('-created_at', '-tweet_id')
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
+        cached_slice = RedisHelper.load_objects_slice(key, queryset, **kwargs)
+        # the tweet of a cached newsfeed might have been deleted after it was
+        # cached, removing it from the cached newsfeeds of every follower is
+        # O(followers). the tweet is null as in the database (SET_NULL), so
+        # the newsfeed is skipped by the pagination instead of taking a slot.
+        MemcachedHelper.prefetch_objects_through_cache(
+            cached_slice.objects, Tweet, 'tweet_id', '_cached_tweet',
+        )
+        for newsfeed in cached_slice.objects:
+            if newsfeed.cached_tweet is None:
+                newsfeed.tweet_id = None
+        return cached_slice
+
+    @classmethod
+    def push_newsfeeds_to_cache(cls, newsfeeds):
+        RedisHelper.push_objects([
+            (USER_NEWSFEEDS_PATTERN.format(user_id=newsfeed.user_id), newsfeed)
+            for newsfeed in newsfeeds
+        ])
+
+    @classmethod
+    def invalidate_cached_newsfeeds(cls, user_id):
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=user_id)
+        RedisHelper.invalidate_list(key)
+
+    @classmethod
+    def get_followed_celebrity_ids(cls, user_id):
+        key = FOLLOWED_CELEBRITIES_PATTERN.format(user_id=user_id)
+        celebrity_ids = cache.get(key)
+        if celebrity_ids is not None:
+            return celebrity_ids
+
+        # the followings who have ever posted as a celebrity, over the
+        # (posted_as_celebrity, user, created_at) index of Tweet
+        following_ids = FriendshipService.get_following_user_id_set(user_id)
+        celebrity_ids = set(Tweet.objects.filter(
+            posted_as_celebrity=True,
+            user_id__in=following_ids,
+        ).order_by().values_list('user_id', flat=True).distinct())
+        # a short expire time is enough to pick up users who just became
+        # celebrities
+        cache.set(key, celebrity_ids, timeout=10 * ONE_MINUTE)
+        return celebrity_ids
+
+    @classmethod
+    def invalidate_followed_celebrities(cls, user_id):
+        key = FOLLOWED_CELEBRITIES_PATTERN.format(user_id=user_id)
+        cache.delete(key)
+
+    @classmethod
+    def get_celebrity_tweets(cls, user_id):
+        celebrity_ids = cls.get_followed_celebrity_ids(user_id)
+        if not celebrity_ids:
+            return Tweet.objects.none()
+        # uses the ('posted_as_celebrity', 'user', 'created_at') index of Tweet
+        return Tweet.objects.filter(posted_as_celebrity=True, user_id__in=celebrity_ids)
+
+    @classmethod
+    def merge_pulled_tweets(cls, user_id, newsfeeds, tweets):
+        """
+        merge the pushed newsfeeds with the tweets pulled from celebrities
+        into one list ordered by (created_at, tweet_id) desc. pulled tweets are wrapped
+        into unsaved NewsFeed objects so they can be serialized the same way.
+        """
+        # the tweet of a newsfeed might have been deleted (SET_NULL)
+        merged = [newsfeed for newsfeed in newsfeeds if newsfeed.tweet_id is not None]
+        pushed_tweet_ids = set(newsfeed.tweet_id for newsfeed in merged)
+        for tweet in tweets:
+            # the tweet might have been pushed before the author became a
+            # celebrity
+            if tweet.id in pushed_tweet_ids:
+                continue
+            merged.append(NewsFeed(
+                user_id=user_id,
+                tweet_id=tweet.id,
+                created_at=tweet.created_at,
+            ))
+        merged.sort(
+            key=lambda newsfeed: (newsfeed.created_at, newsfeed.tweet_id),
+            reverse=True,
+        )
+        return merged
+
+    @classmethod
+    def backfill_newsfeeds(cls, user_id, followed_user_ids):
+        """
+        add the newest NEWSFEED_BACKFILL_LIMIT tweets of each newly followed
+        user to the user's newsfeed with one insert, return the number of them
+        """
+        # one query per followed user over the (posted_as_celebrity, user,
+        # created_at) index, so a prolific author doesn't take the whole
+        # limit. the tweets posted as a celebrity are pulled when the
+        # newsfeed is read.
         newsfeeds = [
-            NewsFeed(user=follower, tweet=tweet)
-            for follower in FriendshipService.get_followers(tweet.user)
+            NewsFeed(user_id=user_id, tweet_id=tweet_id, created_at=created_at)
+            for followed_user_id in followed_user_ids
+            for tweet_id, created_at in Tweet.objects.filter(
+                posted_as_celebrity=False,
+                user_id=followed_user_id,
+            ).order_by('-created_at').values_list('id', 'created_at')[:NEWSFEED_BACKFILL_LIMIT]
         ]
-        newsfeeds.append(NewsFeed(user=tweet.user, tweet=tweet))
-        NewsFeed.objects.bulk_create(newsfeeds)
+        if not newsfeeds:
+            return 0
+        NewsFeed.objects.bulk_create(newsfeeds, ignore_conflicts=True)
+        # the newsfeeds are older than the cached ones, load them again
+        cls.invalidate_cached_newsfeeds(user_id)
+        return len(newsfeeds)
+
+    @classmethod
+    def remove_newsfeeds(cls, user_id, unfollowed_user_id):
+        """
+        remove the tweets of the unfollowed user from the user's newsfeed,
+        return the number of the removed newsfeeds
+        """
+        deleted = 0
+        # small batches so a prolific author doesn't lock the table for long
+        while True:
+            newsfeed_ids = list(NewsFeed.objects.filter(
+                user_id=user_id,
+                tweet__user_id=unfollowed_user_id,
+            ).values_list('id', flat=True)[:NEWSFEED_CLEANUP_BATCH_SIZE])
+            if not newsfeed_ids:
+                break
+            NewsFeed.objects.filter(id__in=newsfeed_ids).delete()
+            deleted += len(newsfeed_ids)
+        if deleted:
+            cls.invalidate_cached_newsfeeds(user_id)
+        return deleted
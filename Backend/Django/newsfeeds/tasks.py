@@ -0,0 +1,80 @@
+from celery import shared_task
+from django.contrib.auth.models import User
+from friendships.services import FriendshipService
+from newsfeeds.constants import FANOUT_BATCH_SIZE
+from newsfeeds.models import NewsFeed
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(time_limit=ONE_HOUR)
+def fanout_newsfeeds_batch_task(tweet_id, created_at, follower_ids):
+    # import inside the task to avoid circular dependency
+    from newsfeeds.services import NewsFeedService
+
+    # a follower might have been deleted since the follower ids were read,
+    # a newsfeed of a missing user would fail the insert of the whole batch
+    follower_ids = list(User.objects.filter(
+        id__in=follower_ids,
+    ).values_list('id', flat=True))
+    newsfeeds = [
+        NewsFeed(user_id=follower_id, tweet_id=tweet_id, created_at=created_at)
+        for follower_id in follower_ids
+    ]
+    # a retried batch must not fail on the (user, tweet) unique constraint
+    NewsFeed.objects.bulk_create(newsfeeds, ignore_conflicts=True)
+
+    # bulk_create does not return the ids with ignore_conflicts, read the
+    # created newsfeeds back so they can be pushed to the cached lists
+    newsfeeds = NewsFeed.objects.filter(
+        tweet_id=tweet_id,
+        user_id__in=follower_ids,
+    )
+    NewsFeedService.push_newsfeeds_to_cache(newsfeeds)
+    return '{} newsfeeds created'.format(len(newsfeeds))
+
+
+@shared_task(time_limit=ONE_HOUR)
+def fanout_newsfeeds_main_task(tweet_id, created_at, tweet_user_id):
+    # the tweets posted as a celebrity are never fanned out, see
+    # NewsFeedService.fanout_to_followers
+
+    # only read the follower ids, loading every follower User row is useless
+    # for fanout and very expensive for users with a lot of followers
+    follower_ids = FriendshipService.get_follower_ids(tweet_user_id)
+
+    # split the followers into batches, every batch is a separated task so
+    # that they can be processed by different workers at the same time
+    index = 0
+    while index < len(follower_ids):
+        batch_ids = follower_ids[index: index + FANOUT_BATCH_SIZE]
+        fanout_newsfeeds_batch_task.delay(tweet_id, created_at, batch_ids)
+        index += FANOUT_BATCH_SIZE
+
+    return '{} newsfeeds going to fanout, {} batches created.'.format(
+        len(follower_ids),
+        (len(follower_ids) - 1) // FANOUT_BATCH_SIZE + 1,
+    )
+
+
+@shared_task(time_limit=ONE_HOUR)
+def backfill_newsfeeds_task(user_id, followed_user_id):
+    # import inside the task to avoid circular dependency
+    from newsfeeds.services import NewsFeedService
+
+    # the user might have unfollowed again before the task runs
+    if followed_user_id not in FriendshipService.get_following_user_id_set(user_id):
+        return 'not following anymore, skip backfill.'
+    count = NewsFeedService.backfill_newsfeeds(user_id, [followed_user_id])
+    return '{} newsfeeds backfilled.'.format(count)
+
+
+@shared_task(time_limit=ONE_HOUR)
+def remove_newsfeeds_task(user_id, unfollowed_user_id):
+    # import inside the task to avoid circular dependency
+    from newsfeeds.services import NewsFeedService
+
+    # the user might have followed again before the task runs
+    if unfollowed_user_id in FriendshipService.get_following_user_id_set(user_id):
+        return 'following again, skip cleanup.'
+    count = NewsFeedService.remove_newsfeeds(user_id, unfollowed_user_id)
+    return '{} newsfeeds removed.'.format(count)
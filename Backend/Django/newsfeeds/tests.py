@@ -1,3 +1,179 @@
-from django.test import TestCase
+from datetime import timedelta
+from friendships.models import Friendship
+from newsfeeds.constants import (
+    FANOUT_BATCH_SIZE,
+    NEWSFEED_BACKFILL_LIMIT,
+    NEWSFEED_CLEANUP_BATCH_SIZE,
+)
+from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
+from newsfeeds.tasks import fanout_newsfeeds_batch_task
+from testing.testcases import TestCase
+from utils.redis_helper import RedisHelper
 
-# Create your tests here.
+
+class NewsFeedServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+
+    def test_fanout_in_batches(self):
+        # more followers than a single batch can handle
+        followers = [
+            self.create_user('follower{}'.format(i))
+            for i in range(FANOUT_BATCH_SIZE * 2 + 1)
+        ]
+        for follower in followers:
+            Friendship.objects.create(from_user=follower, to_user=self.linghu)
+
+        tweet = self.create_tweet(self.linghu)
+        NewsFeedService.fanout_to_followers(tweet)
+        self.assertEqual(NewsFeed.objects.filter(tweet=tweet).count(), len(followers) + 1)
+        for follower in followers:
+            newsfeed = NewsFeed.objects.get(user=follower)
+            self.assertEqual(newsfeed.tweet_id, tweet.id)
+            self.assertEqual(newsfeed.created_at, tweet.created_at)
+        self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), 1)
+
+        # every new tweet is fanned out the same way
+        NewsFeedService.fanout_to_followers(self.create_tweet(self.linghu))
+        self.assertEqual(NewsFeed.objects.filter(user=followers[0]).count(), 2)
+
+    def test_fanout_to_deleted_followers(self):
+        followers = [self.create_user('follower{}'.format(i)) for i in range(2)]
+        tweet = self.create_tweet(self.linghu)
+        follower_ids = [follower.id for follower in followers]
+        # deleted after the follower ids were read
+        followers[1].delete()
+        fanout_newsfeeds_batch_task(tweet.id, tweet.created_at, follower_ids)
+        self.assertEqual(
+            list(NewsFeed.objects.filter(tweet=tweet).values_list('user_id', flat=True)),
+            [followers[0].id],
+        )
+
+    def test_newsfeeds_on_follow_and_unfollow(self):
+        dongxie = self.create_user('dongxie')
+        tweets = [
+            self.create_tweet(dongxie)
+            for _ in range(max(NEWSFEED_BACKFILL_LIMIT, NEWSFEED_CLEANUP_BATCH_SIZE) + 1)
+        ]
+        other_tweet = self.create_tweet(self.create_user('other'))
+        NewsFeed.objects.create(user=self.linghu, tweet=other_tweet)
+
+        # the newest tweets are backfilled when following
+        # the tasks are queued once the friendship is committed
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            friendship = Friendship.objects.create(from_user=self.linghu, to_user=dongxie)
+            self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), 1)
+        self.assertEqual(len(callbacks), 1)
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [other_tweet.id] + [tweet.id for tweet in tweets[::-1][:NEWSFEED_BACKFILL_LIMIT]],
+        )
+
+        # all the tweets of dongxie are removed when unfollowing
+        NewsFeedService.fanout_to_followers(tweets[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            friendship.delete()
+        self.assertFalse(NewsFeed.objects.filter(user=self.linghu, tweet__user=dongxie).exists())
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [other_tweet.id])
+
+    def test_backfill_newsfeeds_per_followed_user(self):
+        dongxie = self.create_user('dongxie')
+        ouyangfeng = self.create_user('ouyangfeng')
+        ouyangfeng_tweet = self.create_tweet(ouyangfeng)
+        dongxie_tweets = [self.create_tweet(dongxie) for _ in range(NEWSFEED_BACKFILL_LIMIT + 1)]
+
+        # the newer tweets of dongxie don't crowd out the older one
+        self.assertEqual(
+            NewsFeedService.backfill_newsfeeds(self.linghu.id, [ouyangfeng.id, dongxie.id]),
+            NEWSFEED_BACKFILL_LIMIT + 1,
+        )
+        self.assertEqual(
+            set(NewsFeed.objects.filter(user=self.linghu).values_list('tweet_id', flat=True)),
+            {ouyangfeng_tweet.id} | {tweet.id for tweet in dongxie_tweets[1:]},
+        )
+
+    def test_get_cached_newsfeeds(self):
+        newsfeed_ids = []
+        for i in range(3):
+            tweet = self.create_tweet(self.create_user('user{}'.format(i)))
+            newsfeed = NewsFeed.objects.create(user=self.linghu, tweet=tweet)
+            newsfeed_ids.append(newsfeed.id)
+        newsfeed_ids = newsfeed_ids[::-1]
+
+        # cache miss
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual([f.id for f in newsfeeds], newsfeed_ids)
+
+        # cache hit
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual([f.id for f in newsfeeds], newsfeed_ids)
+        self.assertEqual(newsfeeds[0].created_at, NewsFeed.objects.get(id=newsfeed_ids[0]).created_at)
+
+        # fanout pushes the new newsfeed to the cached list
+        tweet = self.create_tweet(self.linghu)
+        NewsFeedService.fanout_to_followers(tweet)
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual(newsfeeds[0].tweet_id, tweet.id)
+        self.assertEqual([f.id for f in newsfeeds[1:]], newsfeed_ids)
+
+        # an older newsfeed pushed later is still kept in order
+        tweet = self.create_tweet(self.linghu)
+        newsfeed = NewsFeed.objects.create(
+            user=self.linghu,
+            tweet=tweet,
+            created_at=tweet.created_at - timedelta(days=1),
+        )
+        NewsFeedService.push_newsfeeds_to_cache([newsfeed])
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual(newsfeeds[-1].id, newsfeed.id)
+
+        # the cached list is loaded again after invalidation
+        NewsFeedService.invalidate_cached_newsfeeds(self.linghu.id)
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual(len(newsfeeds), 5)
+
+    def test_push_to_uncached_list(self):
+        # nothing is pushed if the list is not cached yet, otherwise the
+        # cached list would only contain the new newsfeed
+        NewsFeed.objects.create(user=self.linghu, tweet=self.create_tweet(self.linghu))
+        NewsFeedService.fanout_to_followers(self.create_tweet(self.linghu))
+        newsfeeds = NewsFeedService.get_cached_newsfeeds(self.linghu.id)
+        self.assertEqual(len(newsfeeds), 2)
+
+    def test_get_cached_empty_newsfeeds(self):
+        # an empty list is cached as well
+        self.assertEqual(NewsFeedService.get_cached_newsfeeds(self.linghu.id), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(NewsFeedService.get_cached_newsfeeds(self.linghu.id), [])
+
+        # and a pushed newsfeed replaces the placeholder of the empty list
+        tweet = self.create_tweet(self.linghu)
+        NewsFeedService.fanout_to_followers(tweet)
+        cached_slice = NewsFeedService.get_cached_newsfeeds_slice(self.linghu.id)
+        self.assertEqual([f.tweet_id for f in cached_slice.objects], [tweet.id])
+        self.assertEqual(cached_slice.size, 1)
+
+    def test_get_cached_newsfeeds_slice(self):
+        newsfeeds = [
+            NewsFeed.objects.create(user=self.linghu, tweet=self.create_tweet(self.linghu))
+            for _ in range(5)
+        ]
+        newsfeeds = newsfeeds[::-1]
+
+        # only count newsfeeds are read from the offset
+        cached_slice = NewsFeedService.get_cached_newsfeeds_slice(self.linghu.id, offset=1, count=2)
+        self.assertEqual([f.id for f in cached_slice.objects], [f.id for f in newsfeeds[1:3]])
+        self.assertEqual(cached_slice.size, 5)
+
+        # only newsfeeds in the score range are read
+        cached_slice = NewsFeedService.get_cached_newsfeeds_slice(
+            self.linghu.id,
+            max_score='({}'.format(RedisHelper.get_score(newsfeeds[1])),
+            min_score=RedisHelper.get_score(newsfeeds[3]),
+        )
+        self.assertEqual([f.id for f in cached_slice.objects], [f.id for f in newsfeeds[2:4]])
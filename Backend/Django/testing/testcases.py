@@ -6,12 +6,16 @@ from likes.models import Like
 from rest_framework.test import APIClient
 from tweets.models import Tweet
 from django.core.cache import caches
+from utils.local_cache import local_cache
+from utils.redis_client import RedisClient
 
 
 class TestCase(DjangoTestCase):
 
     def clear_cache(self):
         caches['testing'].clear()
+        local_cache.clear()
+        RedisClient.clear()
         
     @property
     def anonymous_client(self):
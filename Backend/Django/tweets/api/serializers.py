@@ -1,13 +1,21 @@
-import random
 from accounts.api.serializers import UserSerializerForTweet
+from django.contrib.auth.models import User
 from comments.api.serializers import CommentSerializer
+from comments.services import CommentService
 from likes.api.serializers import LikeSerializer
 from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from tweets.constants import TWEET_PHOTOS_UPLOAD_LIMIT
+from tweets.constants import (
+    TWEET_DETAIL_COMMENTS_LIMIT,
+    TWEET_DETAIL_LIKES_LIMIT,
+    TWEET_PHOTOS_UPLOAD_LIMIT,
+)
 from tweets.models import Tweet
 from tweets.services import TweetService
+from utils.memcached_helper import MemcachedHelper
+from utils.paginations import encode_cursor
+from utils.serializers import PrefetchListSerializer
 
 
 class TweetSerializer(serializers.ModelSerializer):
@@ -29,36 +37,53 @@ class TweetSerializer(serializers.ModelSerializer):
             'has_liked',
             'photo_urls',
         )
+        list_serializer_class = PrefetchListSerializer
+
+    def prefetch(self, tweets):
+        users = MemcachedHelper.prefetch_objects_through_cache(
+            tweets, User, 'user_id', '_cached_user',
+        )
+        self.fields['user'].prefetch(users)
+        TweetService.prefetch_counts(tweets)
+        liked_tweet_ids = LikeService.get_liked_object_ids(self.context['request'].user, tweets)
+        self.context.setdefault('tweet_id_to_has_liked', {}).update({
+            tweet.id: tweet.id in liked_tweet_ids
+            for tweet in tweets
+        })
+        self.context.setdefault('tweet_id_to_photo_urls', {}).update(
+            TweetService.get_photo_urls([tweet.id for tweet in tweets]),
+        )
 
     def get_likes_count(self, obj):
-        if random.randint(0, 10000) == 0:
-            likes_count = obj.like_set.count()
-            obj.likes_count = likes_count
-            obj.save()
-            return likes_count
-        return obj.likes_count
+        return TweetService.get_count(obj, 'likes_count')
 
     def get_comments_count(self, obj):
-        if random.randint(0, 10000) == 0:
-            comments_count = obj.comment_set.count()
-            obj.comments_count = comments_count
-            obj.save()
-            return comments_count
-        return obj.comments_count
+        return TweetService.get_count(obj, 'comments_count')
 
     def get_has_liked(self, obj):
+        # prefetched for the whole page by the list serializer
+        has_liked = self.context.get('tweet_id_to_has_liked', {}).get(obj.id)
+        if has_liked is not None:
+            return has_liked
         return LikeService.has_liked(self.context['request'].user, obj)
 
     def get_photo_urls(self, obj):
-        photo_urls = []
-        for photo in obj.tweetphoto_set.all().order_by('order'):
-            photo_urls.append(photo.file.url)
-        return photo_urls
+        # prefetched for the whole page by the list serializer
+        photo_urls = self.context.get('tweet_id_to_photo_urls', {}).get(obj.id)
+        if photo_urls is not None:
+            return photo_urls
+        return TweetService.get_photo_urls([obj.id])[obj.id]
 
 
 class TweetSerializerForDetail(TweetSerializer):
-    comments = CommentSerializer(source='comment_set', many=True)
-    likes = LikeSerializer(source='like_set', many=True)
+    """
+    embeds the first comments and the latest likes only, next_cursor of each
+    pages the rest through /api/comments/ and /api/tweets/<id>/likes/
+    """
+    comments = serializers.SerializerMethodField()
+    comments_next_cursor = serializers.SerializerMethodField()
+    likes = serializers.SerializerMethodField()
+    likes_next_cursor = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
@@ -69,13 +94,47 @@ class TweetSerializerForDetail(TweetSerializer):
             'created_at',
             'content',
             'likes',
-            'comments',
+            'comments_next_cursor',
+            'likes_next_cursor',
             'likes_count',
             'comments_count',
             'has_liked',
             'photo_urls',
         )
 
+    def _get_next_cursor(self, objects, limit):
+        if len(objects) <= limit:
+            return None
+        return encode_cursor(objects[limit - 1].created_at, objects[limit - 1].id)
+
+    def _get_embedded_comments(self, obj):
+        # the cached first page of /api/comments/, it has one more comment
+        # than the limit to tell if there is a next page
+        return CommentService.get_first_page_comments(obj.id)[:TWEET_DETAIL_COMMENTS_LIMIT + 1]
+
+    def _get_embedded_likes(self, obj):
+        if not hasattr(self, '_embedded_likes'):
+            self._embedded_likes = {}
+        if obj.id not in self._embedded_likes:
+            self._embedded_likes[obj.id] = list(
+                obj.like_set.order_by('-created_at', '-id')[:TWEET_DETAIL_LIKES_LIMIT + 1]
+            )
+        return self._embedded_likes[obj.id]
+
+    def get_comments(self, obj):
+        comments = self._get_embedded_comments(obj)[:TWEET_DETAIL_COMMENTS_LIMIT]
+        return CommentSerializer(comments, many=True, context=self.context).data
+
+    def get_comments_next_cursor(self, obj):
+        return self._get_next_cursor(self._get_embedded_comments(obj), TWEET_DETAIL_COMMENTS_LIMIT)
+
+    def get_likes(self, obj):
+        likes = self._get_embedded_likes(obj)[:TWEET_DETAIL_LIKES_LIMIT]
+        return LikeSerializer(likes, many=True, context=self.context).data
+
+    def get_likes_next_cursor(self, obj):
+        return self._get_next_cursor(self._get_embedded_likes(obj), TWEET_DETAIL_LIKES_LIMIT)
+
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
     content = serializers.CharField(min_length=6, max_length=140)
@@ -1,18 +1,28 @@
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
+from friendships.models import Friendship
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from tweets.constants import TWEET_DETAIL_COMMENTS_LIMIT, TWEET_DETAIL_LIKES_LIMIT
 from tweets.models import Tweet, TweetPhoto
+from tweets.services import TweetService
+from utils.paginations import EndlessPagination
 
 
 # 注意要加 '/' 结尾，要不然会产生 301 redirect
 TWEET_LIST_API = '/api/tweets/'
 TWEET_CREATE_API = '/api/tweets/'
 TWEET_RETRIEVE_API = '/api/tweets/{}/'
+TWEET_LIKES_API = '/api/tweets/{}/likes/'
+COMMENT_LIST_API = '/api/comments/'
 
 
 class TweetApiTests(TestCase):
 
     def setUp(self):
+        self.clear_cache()
         self.user1 = self.create_user('user1', 'user1@jiuzhang.com')
         self.tweets1 = [
             self.create_tweet(self.user1)
@@ -154,3 +164,141 @@ class TweetApiTests(TestCase):
         profile = self.user1.profile
         self.assertEqual(response.data['user']['nickname'], profile.nickname)
         self.assertEqual(response.data['user']['avatar'], None)
+
+    def test_retrieve_with_bounded_comments_and_likes(self):
+        tweet = self.create_tweet(self.user1)
+        comments = [
+            self.create_comment(self.user2, tweet)
+            for _ in range(TWEET_DETAIL_COMMENTS_LIMIT + 1)
+        ]
+        likes = [
+            self.create_like(self.create_user('liker{}'.format(i)), tweet)
+            for i in range(TWEET_DETAIL_LIKES_LIMIT + 1)
+        ]
+
+        response = self.anonymous_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['comments']],
+            [comment.id for comment in comments[:TWEET_DETAIL_COMMENTS_LIMIT]],
+        )
+        self.assertEqual(len(response.data['likes']), TWEET_DETAIL_LIKES_LIMIT)
+        self.assertEqual(response.data['likes'][0]['user']['id'], likes[-1].user_id)
+
+        # the rest are paged with the cursors
+        comments_response = self.anonymous_client.get(COMMENT_LIST_API, {
+            'tweet_id': tweet.id,
+            'cursor': response.data['comments_next_cursor'],
+        })
+        self.assertEqual(
+            [comment['id'] for comment in comments_response.data['comments']],
+            [comments[-1].id],
+        )
+        likes_response = self.anonymous_client.get(TWEET_LIKES_API.format(tweet.id), {
+            'cursor': response.data['likes_next_cursor'],
+        })
+        self.assertEqual(likes_response.status_code, 200)
+        self.assertEqual(likes_response.data['has_next_page'], False)
+        self.assertEqual(
+            [like['user']['id'] for like in likes_response.data['results']],
+            [likes[0].user_id],
+        )
+
+    def test_list_api_with_type(self):
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'type': 'tweet',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet.id for tweet in self.tweets1[::-1]],
+        )
+
+        self.create_like(self.user2, self.tweets1[1])
+        # the likes list is filtered by likes_count in the database
+        TweetService.flush_pending_counts()
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'type': 'likes',
+        })
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], self.tweets1[1].id)
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+
+    def test_list_api_has_liked(self):
+        self.create_like(self.user1, self.tweets1[0])
+        self.create_like(self.user2, self.tweets1[1])
+        with CaptureQueriesContext(connection) as context:
+            response = self.user1_client.get(TWEET_LIST_API, {
+                'user_id': self.user1.id,
+                'type': 'tweet',
+            })
+        self.assertEqual(
+            [tweet['has_liked'] for tweet in response.data['results']],
+            [False, False, True],
+        )
+        # one query for the whole page
+        like_queries = [
+            query for query in context.captured_queries
+            if 'likes_like' in query['sql']
+        ]
+        self.assertEqual(len(like_queries), 1)
+
+    def test_list_api_is_following(self):
+        Friendship.objects.create(from_user=self.user1, to_user=self.user2)
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user2.id,
+            'type': 'tweet',
+        })
+        self.assertEqual(
+            [tweet['user']['is_following'] for tweet in response.data['results']],
+            [True, True],
+        )
+        response = self.anonymous_client.get(TWEET_LIST_API, {
+            'user_id': self.user2.id,
+            'type': 'tweet',
+        })
+        self.assertEqual(
+            [tweet['user']['is_following'] for tweet in response.data['results']],
+            [False, False],
+        )
+
+        # the cached following set is read once for the page
+        for _ in range(3):
+            self.create_tweet(self.user2)
+        with CaptureQueriesContext(connection) as context:
+            self.user1_client.get(TWEET_LIST_API, {
+                'user_id': self.user2.id,
+                'type': 'tweet',
+            })
+        friendship_queries = [
+            query for query in context.captured_queries
+            if 'friendships_friendship' in query['sql']
+        ]
+        self.assertEqual(len(friendship_queries), 0)
+
+    def test_list_pagination_beyond_cached_tweets(self):
+        list_limit = settings.REDIS_LIST_LENGTH_LIMIT
+        page_size = EndlessPagination.page_size
+        for _ in range(list_limit + page_size - len(self.tweets1)):
+            self.create_tweet(self.user1)
+        tweet_ids = list(
+            Tweet.objects.filter(user=self.user1).order_by('-created_at').values_list('id', flat=True)
+        )
+
+        results = []
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'type': 'tweet',
+        })
+        while True:
+            results.extend(response.data['results'])
+            if not response.data['has_next_page']:
+                break
+            response = self.user1_client.get(TWEET_LIST_API, {
+                'user_id': self.user1.id,
+                'type': 'tweet',
+                'created_at__lt': response.data['results'][-1]['created_at'],
+            })
+        self.assertEqual([tweet['id'] for tweet in results], tweet_ids)
@@ -1,5 +1,8 @@
+from functools import partial
+from likes.api.serializers import LikeSerializer
 from newsfeeds.services import NewsFeedService
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from tweets.api.serializers import (
@@ -8,6 +11,7 @@ from tweets.api.serializers import (
     TweetSerializerForDetail,
 )
 from tweets.models import Tweet
+from tweets.services import TweetService
 from utils.decorators import required_params
 from utils.paginations import EndlessPagination
 
@@ -17,30 +21,32 @@ class TweetViewSet(viewsets.GenericViewSet):
     pagination_class = EndlessPagination
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'likes']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
     @required_params(params=['user_id', 'type'])
     def list(self, request):
         user_id = request.query_params['user_id']
-        request_tweet_type = request.query_params['type']
+        tweet_type = request.query_params['type']
 
-        filter_type = {
-            'tweet': {},
-            'likes': {'likes_count__gt': 0},
-            'replies': {'comments_count__gt': 0},
-            'media': {'tweetphoto__isnull': False}
-        }
-
-        filteration = filter_type.get(request_tweet_type, {})
-
-        tweets = Tweet.objects.filter(
-            user_id=user_id,
-            **filteration
-        ).order_by('-created_at').distinct()
+        # the ids of the newest tweets are cached per user and per type, the
+        # tweets of the page are then loaded through the object cache
+        tweet_ids = self.paginator.slice_cached_list(
+            partial(TweetService.get_cached_tweet_ids_slice, user_id, tweet_type),
+            request,
+        )
+        if tweet_ids is None:
+            # the page is older than the cached tweets
+            tweets = self.paginate_queryset(
+                TweetService.get_tweets(user_id, tweet_type),
+            )
+        else:
+            tweet_ids = self.paginator.paginate_ordered_list(tweet_ids, request)
+            tweets = TweetService.get_tweets_by_ids(
+                [tweet_id.id for tweet_id in tweet_ids],
+            )
 
-        tweets = self.paginate_queryset(tweets)
         serializer = TweetSerializer(
             tweets,
             context={'request': request},
@@ -55,6 +61,14 @@ class TweetViewSet(viewsets.GenericViewSet):
         )
         return Response(serializer.data)
 
+    @action(methods=['GET'], detail=True)
+    def likes(self, request, pk):
+        # the likes beyond the ones embedded in the tweet detail, newest first
+        tweet = self.get_object()
+        likes = self.paginate_queryset(tweet.like_set)
+        serializer = LikeSerializer(likes, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
+
     def create(self, request):
         serializer = TweetSerializerForCreate(
             data=request.data,
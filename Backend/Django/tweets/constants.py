@@ -1,3 +1,7 @@
+from django.conf import settings
+from utils.time_constants import ONE_DAY, ONE_MINUTE
+
+
 class TweetPhotoStatus:
     PENDING = 0
     APPROVED = 1
@@ -11,7 +15,35 @@ TWEET_PHOTO_STATUS_CHOICES = (
 )
 
 TWEET_PHOTOS_UPLOAD_LIMIT = 4
+# how many comments and likes are embedded in the tweet detail, the rest are
+# paged with the cursors returned along with them
+TWEET_DETAIL_COMMENTS_LIMIT = 10
+TWEET_DETAIL_LIKES_LIMIT = 10
+# the cached photo urls are signed urls, they have to expire from the cache
+# well before the signatures do
+TWEET_PHOTO_URLS_CACHE_TIMEOUT = settings.AWS_QUERYSTRING_EXPIRE // 2
+
+# filters of the tweet lists in a user's profile page, every type has its own
+# cached list of tweet ids
+TWEET_LIST_FILTERS = {
+    'tweet': {},
+    'likes': {'likes_count__gt': 0},
+    'replies': {'comments_count__gt': 0},
+    'media': {'tweetphoto__isnull': False},
+}
+DEFAULT_TWEET_LIST_TYPE = 'tweet'
 
-# TWEETSTYPE = {
-#     'medias':  tweetphoto__isnull=False,
-# }
\ No newline at end of file
+# the denormalized counters of a tweet, and the tweet list filtered by each
+TWEET_COUNT_FIELDS = {
+    'likes_count': 'likes',
+    'comments_count': 'replies',
+}
+# how many tweets are updated by one statement when flushing the counters
+TWEET_COUNTS_FLUSH_BATCH_SIZE = 500
+# how many tweets are recounted by each step of reconcile_counts
+TWEET_COUNTS_RECONCILE_BATCH_SIZE = 1000
+# the flush and the reconcile hold the lock of the counters in the database,
+# released by then or expired in case the worker died
+TWEET_COUNTS_LOCK_TIMEOUT = ONE_MINUTE
+# how long the flushed batches are remembered
+TWEET_COUNTS_FLUSH_RETENTION = ONE_DAY
@@ -0,0 +1,19 @@
+def push_tweet_to_cache(sender, instance, created, **kwargs):
+    from tweets.services import TweetService
+    if not created:
+        # the cached lists are derived from the fields of the tweet
+        TweetService.invalidate_cached_tweet_lists(instance.user_id)
+        return
+    TweetService.push_tweet_to_cache(instance)
+
+
+def invalidate_cached_tweet_lists(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    TweetService.invalidate_cached_tweet_lists(instance.user_id)
+
+
+def invalidate_photo_urls(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    # e.g. the status of the photo is changed
+    if instance.tweet_id is not None:
+        TweetService.invalidate_photo_urls(instance.tweet_id)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from tweets.constants import TWEET_COUNTS_RECONCILE_BATCH_SIZE
+from tweets.services import TweetService
+
+
+class Command(BaseCommand):
+    help = 'Recount likes_count and comments_count of all the tweets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=TWEET_COUNTS_RECONCILE_BATCH_SIZE,
+            help='how many tweets are recounted at a time',
+        )
+
+    def handle(self, *args, **options):
+        drifted_count = TweetService.reconcile_counts(options['batch_size'])
+        self.stdout.write('{} tweets reconciled'.format(drifted_count))
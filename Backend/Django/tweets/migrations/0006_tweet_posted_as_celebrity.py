@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tweets', '0005_tweetcountsflush'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='posted_as_celebrity',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='tweet',
+            index_together={('posted_as_celebrity', 'user', 'created_at'), ('user', 'created_at')},
+        ),
+    ]
@@ -1,11 +1,16 @@
 from utils.memcached_helper import MemcachedHelper
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from likes.models import Like
+from likes.registry import like_target_registry
 from utils.time_helpers import utc_now
 from utils.listeners import invalidate_object_cache
 from tweets.constants import TweetPhotoStatus, TWEET_PHOTO_STATUS_CHOICES
+from tweets.listeners import (
+    invalidate_cached_tweet_lists,
+    invalidate_photo_urls,
+    push_tweet_to_cache,
+)
 from django.db.models.signals import post_save, pre_delete
 
 
@@ -15,9 +20,16 @@ class Tweet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     likes_count = models.IntegerField(default=0, null=True)
     comments_count = models.IntegerField(default=0, null=True)
+    # posted when the author had at least NEWSFEED_CELEBRITY_THRESHOLD
+    # followers, such a tweet is pulled by the followers instead of being
+    # pushed to their newsfeeds, even after the author has fewer followers
+    posted_as_celebrity = models.BooleanField(default=False)
 
     class Meta:
-        index_together = (('user', 'created_at'),)
+        index_together = (
+            ('user', 'created_at'),
+            ('posted_as_celebrity', 'user', 'created_at'),
+        )
         ordering = ('user', '-created_at')
 
     def __str__(self):
@@ -32,13 +44,16 @@ class Tweet(models.Model):
     @property
     def like_set(self):
         return Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(Tweet),
+            content_type_id=like_target_registry.get_content_type_id(Tweet),
             object_id=self.id,
         ).order_by('-created_at')
 
     @property
     def cached_user(self):
-        return MemcachedHelper.get_object_through_cache(User, self.user_id)
+        # set in batch by the list serializers, see MemcachedHelper.prefetch_objects_through_cache
+        if not hasattr(self, '_cached_user'):
+            self._cached_user = MemcachedHelper.get_object_through_cache(User, self.user_id)
+        return self._cached_user
 
 
 class TweetPhoto(models.Model):
@@ -79,5 +94,22 @@ class TweetPhoto(models.Model):
     def __str__(self):
         return f'{self.tweet_id}: {self.file}'
 
+
+class TweetCountsFlush(models.Model):
+    """
+    a batch of counter deltas flushed from redis to the tweets, recorded in
+    the same transaction as the UPDATE so a batch is never added twice
+    """
+    generation = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.created_at} {self.generation}'
+
+
 post_save.connect(invalidate_object_cache, sender=Tweet)
 pre_delete.connect(invalidate_object_cache, sender=Tweet)
+post_save.connect(push_tweet_to_cache, sender=Tweet)
+pre_delete.connect(invalidate_cached_tweet_lists, sender=Tweet)
+post_save.connect(invalidate_photo_urls, sender=TweetPhoto)
+pre_delete.connect(invalidate_photo_urls, sender=TweetPhoto)
@@ -1,5 +1,33 @@
-from tweets.models import TweetPhoto
+from datetime import timedelta
+from django.db import transaction
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from likes.registry import like_target_registry
+from tweets.constants import (
+    DEFAULT_TWEET_LIST_TYPE,
+    TWEET_COUNT_FIELDS,
+    TWEET_COUNTS_FLUSH_BATCH_SIZE,
+    TWEET_COUNTS_FLUSH_RETENTION,
+    TWEET_COUNTS_LOCK_TIMEOUT,
+    TWEET_COUNTS_RECONCILE_BATCH_SIZE,
+    TWEET_LIST_FILTERS,
+    TWEET_PHOTO_URLS_CACHE_TIMEOUT,
+)
+from tweets.models import Tweet, TweetCountsFlush, TweetPhoto
+from twitter.cache import (
+    PENDING_TWEET_COUNTS_KEY,
+    TWEET_COUNTS_LOCK_KEY,
+    TWEET_COUNTS_PATTERN,
+    TWEET_PHOTO_URLS_PATTERN,
+    USER_TWEETS_PATTERN,
+)
+from utils.memcached_helper import MemcachedHelper
+from utils.redis_helper import RedisHelper
+from utils.time_helpers import utc_now
 
+cache = caches['testing'] if settings.TESTING else caches['default']
 
 class TweetService(object):
 
@@ -15,3 +43,391 @@ class TweetService(object):
             )
             photos.append(photo)
         TweetPhoto.objects.bulk_create(photos)
+        # bulk_create does not send post_save, the tweet is a media tweet now
+        cls.invalidate_cached_tweet_lists(tweet.user_id, ['media'])
+        cls.invalidate_photo_urls(tweet.id)
+        # sign the urls before the tweet is read
+        from tweets.tasks import cache_photo_urls_task
+        cache_photo_urls_task.delay([tweet.id])
+
+    @classmethod
+    def _load_photo_urls(cls, tweet_ids):
+        tweet_id_to_photo_urls = {tweet_id: [] for tweet_id in tweet_ids}
+        # ordered the same way as the (tweet, order) index
+        photos = TweetPhoto.objects.filter(
+            tweet_id__in=tweet_ids,
+        ).order_by('tweet_id', 'order')
+        for photo in photos:
+            tweet_id_to_photo_urls[photo.tweet_id].append(photo.file.url)
+        return tweet_id_to_photo_urls
+
+    @classmethod
+    def cache_photo_urls(cls, tweet_ids):
+        tweet_id_to_photo_urls = cls._load_photo_urls(tweet_ids)
+        cache.set_many(
+            {
+                TWEET_PHOTO_URLS_PATTERN.format(tweet_id=tweet_id): photo_urls
+                for tweet_id, photo_urls in tweet_id_to_photo_urls.items()
+            },
+            timeout=TWEET_PHOTO_URLS_CACHE_TIMEOUT,
+        )
+        return tweet_id_to_photo_urls
+
+    @classmethod
+    def get_photo_urls(cls, tweet_ids):
+        """
+        return {tweet_id: photo urls}, the urls are signed when the photos are
+        uploaded, so the tweets read are usually cache hits
+        """
+        keys = [TWEET_PHOTO_URLS_PATTERN.format(tweet_id=tweet_id) for tweet_id in tweet_ids]
+        key_to_photo_urls = cache.get_many(keys)
+        tweet_id_to_photo_urls = {
+            tweet_id: key_to_photo_urls[key]
+            for tweet_id, key in zip(tweet_ids, keys)
+            if key in key_to_photo_urls
+        }
+        missed_ids = [
+            tweet_id for tweet_id in tweet_ids if tweet_id not in tweet_id_to_photo_urls
+        ]
+        if missed_ids:
+            tweet_id_to_photo_urls.update(cls.cache_photo_urls(missed_ids))
+        return tweet_id_to_photo_urls
+
+    @classmethod
+    def invalidate_photo_urls(cls, tweet_id):
+        cache.delete(TWEET_PHOTO_URLS_PATTERN.format(tweet_id=tweet_id))
+
+    @classmethod
+    def get_tweets(cls, user_id, tweet_type):
+        filteration = TWEET_LIST_FILTERS.get(tweet_type, {})
+        return Tweet.objects.filter(
+            user_id=user_id,
+            **filteration
+        ).order_by('-created_at', '-id').distinct()
+
+    @classmethod
+    def get_cached_tweet_ids(cls, user_id, tweet_type):
+        return cls.get_cached_tweet_ids_slice(user_id, tweet_type).objects
+
+    @classmethod
+    def get_cached_tweet_ids_slice(cls, user_id, tweet_type, **kwargs):
+        """
+        see RedisHelper.load_ids_slice for kwargs
+        """
+        if tweet_type not in TWEET_LIST_FILTERS:
+            tweet_type = DEFAULT_TWEET_LIST_TYPE
+        key = USER_TWEETS_PATTERN.format(user_id=user_id, tweet_type=tweet_type)
+        return RedisHelper.load_ids_slice(key, cls.get_tweets(user_id, tweet_type), **kwargs)
+
+    @classmethod
+    def get_tweets_by_ids(cls, tweet_ids):
+        return MemcachedHelper.get_objects_through_cache(Tweet, tweet_ids)
+
+    @classmethod
+    def push_tweet_to_cache(cls, tweet):
+        # a new tweet has no likes, comments or photos yet, so it only
+        # belongs to the default list
+        key = USER_TWEETS_PATTERN.format(
+            user_id=tweet.user_id,
+            tweet_type=DEFAULT_TWEET_LIST_TYPE,
+        )
+        RedisHelper.push_id(key, tweet)
+
+    @classmethod
+    def invalidate_cached_tweet_lists(cls, user_id, tweet_types=None):
+        if tweet_types is None:
+            tweet_types = TWEET_LIST_FILTERS.keys()
+        RedisHelper.invalidate_list(*[
+            USER_TWEETS_PATTERN.format(user_id=user_id, tweet_type=tweet_type)
+            for tweet_type in tweet_types
+        ])
+
+    @classmethod
+    def incr_count(cls, tweet_id, field, delta):
+        """
+        likes_count and comments_count are counted in redis instead of
+        updating the hot tweet row every time, flush_pending_counts writes the
+        accumulated deltas to the database
+        """
+        RedisHelper.incr_counter(
+            TWEET_COUNTS_PATTERN.format(tweet_id=tweet_id),
+            field,
+            delta,
+            PENDING_TWEET_COUNTS_KEY,
+            '{}:{}'.format(tweet_id, field),
+        )
+
+    @classmethod
+    def prefetch_counts(cls, tweets):
+        """
+        load the counters of the tweets, set to tweet._cached_counts
+        """
+        fields = list(TWEET_COUNT_FIELDS)
+        tweet_ids = [tweet.id for tweet in tweets]
+        keys = [TWEET_COUNTS_PATTERN.format(tweet_id=tweet_id) for tweet_id in tweet_ids]
+        tweet_id_to_counts = {
+            tweet_id: counts
+            for tweet_id, counts in zip(tweet_ids, RedisHelper.get_counters(keys, fields))
+            if counts is not None
+        }
+
+        # cache miss, the cached tweet objects might be older than the last
+        # flush, so the counts are read from the database
+        missed_ids = [
+            tweet_id for tweet_id in tweet_ids if tweet_id not in tweet_id_to_counts
+        ]
+        if missed_ids:
+            tweet_id_to_counts.update(cls._load_counts(missed_ids))
+
+        for tweet in tweets:
+            tweet._cached_counts = tweet_id_to_counts.get(tweet.id, {
+                field: getattr(tweet, field) or 0 for field in fields
+            })
+
+    @classmethod
+    def _load_counts(cls, tweet_ids):
+        """
+        return {tweet_id: counts}, the counts in the database plus the deltas
+        not flushed yet. they are cached only under the lock of the flush,
+        otherwise a flush in between would add its deltas twice or lose them,
+        and the cached counters would stay wrong until they expire.
+        """
+        fields = list(TWEET_COUNT_FIELDS)
+        lock = RedisHelper.acquire_lock(TWEET_COUNTS_LOCK_KEY, TWEET_COUNTS_LOCK_TIMEOUT)
+        if lock is None:
+            # a flush is running, the counts are good enough to be read once
+            rows = list(Tweet.objects.filter(id__in=tweet_ids).values('id', *fields))
+            pending_counts = iter(RedisHelper.get_pending_counts(
+                PENDING_TWEET_COUNTS_KEY,
+                ['{}:{}'.format(row['id'], field) for row in rows for field in fields],
+            ))
+            return {
+                row['id']: {
+                    field: (row[field] or 0) + next(pending_counts)
+                    for field in fields
+                }
+                for row in rows
+            }
+
+        try:
+            rows = list(Tweet.objects.filter(id__in=tweet_ids).values('id', *fields))
+            # a flush which saved its deltas but died before acknowledging
+            # them left them in the flushing hash
+            generation = RedisHelper.get_flushing_generation(PENDING_TWEET_COUNTS_KEY)
+            include_flushing = generation is None or \
+                not TweetCountsFlush.objects.filter(generation=generation).exists()
+            key_to_counts = RedisHelper.init_counters(
+                {
+                    TWEET_COUNTS_PATTERN.format(tweet_id=row['id']): {
+                        field: (row[field] or 0, '{}:{}'.format(row['id'], field))
+                        for field in fields
+                    }
+                    for row in rows
+                },
+                PENDING_TWEET_COUNTS_KEY,
+                include_flushing=include_flushing,
+            )
+        finally:
+            RedisHelper.release_lock(TWEET_COUNTS_LOCK_KEY, lock)
+        return {
+            row['id']: key_to_counts[TWEET_COUNTS_PATTERN.format(tweet_id=row['id'])]
+            for row in rows
+        }
+
+    @classmethod
+    def get_count(cls, tweet, field):
+        if not hasattr(tweet, '_cached_counts'):
+            cls.prefetch_counts([tweet])
+        return tweet._cached_counts[field]
+
+    @classmethod
+    def flush_pending_counts(cls):
+        """
+        add the deltas accumulated in redis to the counters in the database,
+        one UPDATE per batch of tweets, return the number of tweets updated.
+        the flushes are serialized by a lock, and every batch of deltas is
+        recorded as a TweetCountsFlush so a retried batch is not added twice.
+        """
+        lock = RedisHelper.acquire_lock(TWEET_COUNTS_LOCK_KEY, TWEET_COUNTS_LOCK_TIMEOUT)
+        if lock is None:
+            # another flush is running, its deltas are left to it
+            return 0
+        try:
+            return cls._flush_pending_counts()
+        finally:
+            RedisHelper.release_lock(TWEET_COUNTS_LOCK_KEY, lock)
+
+    @classmethod
+    def _flush_pending_counts(cls):
+        generation, pending_counts = RedisHelper.pop_pending_counts(PENDING_TWEET_COUNTS_KEY)
+        if generation is None:
+            return 0
+        field_to_deltas = {field: {} for field in TWEET_COUNT_FIELDS}
+        for pending_field, delta in pending_counts.items():
+            tweet_id, field = pending_field.split(':')
+            if delta and field in field_to_deltas:
+                field_to_deltas[field][int(tweet_id)] = delta
+
+        with transaction.atomic():
+            _, created = TweetCountsFlush.objects.get_or_create(generation=generation)
+            # otherwise the batch was saved but not acknowledged, e.g. the
+            # worker died in between
+            if created:
+                for field, deltas in field_to_deltas.items():
+                    tweet_ids = list(deltas)
+                    for start in range(0, len(tweet_ids), TWEET_COUNTS_FLUSH_BATCH_SIZE):
+                        batch_ids = tweet_ids[start:start + TWEET_COUNTS_FLUSH_BATCH_SIZE]
+                        Tweet.objects.filter(id__in=batch_ids).update(**{
+                            field: Coalesce(F(field), 0) + Case(
+                                *[When(id=tweet_id, then=Value(deltas[tweet_id])) for tweet_id in batch_ids],
+                                default=Value(0),
+                                output_field=IntegerField(),
+                            ),
+                        })
+                TweetCountsFlush.objects.filter(
+                    created_at__lt=utc_now() - timedelta(seconds=TWEET_COUNTS_FLUSH_RETENTION),
+                ).delete()
+        RedisHelper.ack_pending_counts(PENDING_TWEET_COUNTS_KEY, generation)
+
+        tweet_ids = set()
+        for field, deltas in field_to_deltas.items():
+            tweet_ids.update(deltas)
+            # the likes / replies lists are filtered by the counters in the
+            # database, so they change only now
+            user_ids = set(Tweet.objects.filter(
+                id__in=deltas,
+            ).values_list('user_id', flat=True))
+            for user_id in user_ids:
+                cls.invalidate_cached_tweet_lists(user_id, [TWEET_COUNT_FIELDS[field]])
+        for tweet_id in tweet_ids:
+            MemcachedHelper.invalidate_cached_object(Tweet, tweet_id)
+        return len(tweet_ids)
+
+    @classmethod
+    def reconcile_counts(cls, batch_size=TWEET_COUNTS_RECONCILE_BATCH_SIZE):
+        """
+        recount likes_count and comments_count of all the tweets in id order,
+        batch_size tweets at a time with grouped aggregate queries, and fix
+        only the tweets whose counters drifted. return the number of them.
+        every batch holds the lock of the flush, so no delta is added to the
+        database while it is recounted.
+        """
+        drifted_count = 0
+        last_id = 0
+        while True:
+            lock = RedisHelper.acquire_lock(
+                TWEET_COUNTS_LOCK_KEY,
+                TWEET_COUNTS_LOCK_TIMEOUT,
+                blocking_timeout=TWEET_COUNTS_LOCK_TIMEOUT,
+            )
+            if lock is None:
+                # the flushes keep going, the rest is left to the next run
+                break
+            try:
+                tweets, drifted_tweets = cls._reconcile_batch(last_id, batch_size)
+            finally:
+                RedisHelper.release_lock(TWEET_COUNTS_LOCK_KEY, lock)
+            if not tweets:
+                break
+            last_id = tweets[-1].id
+            # the cached counters might be wrong even if the database is not,
+            # they are loaded again from the recounted values
+            RedisHelper.invalidate_list(*[
+                TWEET_COUNTS_PATTERN.format(tweet_id=tweet.id)
+                for tweet in tweets
+            ])
+
+            drifted_count += len(drifted_tweets)
+            for tweet in drifted_tweets:
+                MemcachedHelper.invalidate_cached_object(Tweet, tweet.id)
+        return drifted_count
+
+    @classmethod
+    def _get_drifts(cls, tweets):
+        """
+        return {tweet_id: {field: drift}} of the drifted tweets, drift is the
+        difference between the counter in the database and the recounted one
+        """
+        # import here to avoid circular dependency
+        from comments.models import Comment
+        from likes.models import Like
+
+        fields = list(TWEET_COUNT_FIELDS)
+        tweet_ids = [tweet.id for tweet in tweets]
+        # the deltas still in redis will be added by the next flush, so they
+        # are not part of the expected value in the database. they are read
+        # before the rows are counted, a like is counted in redis before it
+        # is committed.
+        pending_counts = iter(RedisHelper.get_pending_counts(
+            PENDING_TWEET_COUNTS_KEY,
+            ['{}:{}'.format(tweet_id, field) for tweet_id in tweet_ids for field in fields],
+        ))
+        actual_counts = {
+            'likes_count': dict(Like.objects.filter(
+                content_type_id=like_target_registry.get_content_type_id(Tweet),
+                object_id__in=tweet_ids,
+            ).values('object_id').annotate(
+                count=Count('id'),
+            ).values_list('object_id', 'count')),
+            'comments_count': dict(Comment.objects.filter(
+                tweet_id__in=tweet_ids,
+            ).values('tweet_id').annotate(
+                count=Count('id'),
+            ).values_list('tweet_id', 'count')),
+        }
+
+        tweet_id_to_drifts = {}
+        for tweet in tweets:
+            drifts = {}
+            for field in fields:
+                expected = actual_counts[field].get(tweet.id, 0) - next(pending_counts)
+                observed = getattr(tweet, field) or 0
+                if observed != expected or getattr(tweet, field) is None:
+                    drifts[field] = observed - expected
+            if drifts:
+                tweet_id_to_drifts[tweet.id] = drifts
+        return tweet_id_to_drifts
+
+    @classmethod
+    def _reconcile_batch(cls, last_id, batch_size):
+        """
+        return the tweets of the batch and the drifted ones, the caller holds
+        the lock of the flush
+        """
+        # a batch which was popped but not acknowledged would be counted as
+        # pending although it might be in the database already
+        cls._flush_pending_counts()
+
+        fields = list(TWEET_COUNT_FIELDS)
+        with transaction.atomic():
+            tweets = list(
+                Tweet.objects.select_for_update().filter(
+                    id__gt=last_id,
+                ).order_by('id').only('id', *fields)[:batch_size]
+            )
+            if not tweets:
+                return [], []
+
+            tweet_id_to_drifts = cls._get_drifts(tweets)
+            if not tweet_id_to_drifts:
+                return tweets, []
+            # a like or comment being saved is counted in redis before its
+            # row is committed, such a drift is gone on the second read
+            drifted_tweets = [tweet for tweet in tweets if tweet.id in tweet_id_to_drifts]
+            confirmed_drifts = cls._get_drifts(drifted_tweets)
+            drifted_tweets = [
+                tweet for tweet in drifted_tweets
+                if confirmed_drifts.get(tweet.id) == tweet_id_to_drifts[tweet.id]
+            ]
+            if not drifted_tweets:
+                return tweets, []
+
+            # the rows are locked and no flush runs, so the recounted values
+            # can be written as they are
+            drifted_fields = set()
+            for tweet in drifted_tweets:
+                for field, drift in tweet_id_to_drifts[tweet.id].items():
+                    setattr(tweet, field, (getattr(tweet, field) or 0) - drift)
+                    drifted_fields.add(field)
+            Tweet.objects.bulk_update(drifted_tweets, list(drifted_fields))
+        return tweets, drifted_tweets
@@ -0,0 +1,20 @@
+from celery import shared_task
+from tweets.services import TweetService
+from utils.time_constants import ONE_HOUR, ONE_MINUTE
+
+
+@shared_task(time_limit=ONE_MINUTE)
+def flush_tweet_counts_task():
+    # scheduled by celery beat, see twitter/celery.py
+    return TweetService.flush_pending_counts()
+
+
+@shared_task(time_limit=ONE_MINUTE)
+def cache_photo_urls_task(tweet_ids):
+    TweetService.cache_photo_urls(tweet_ids)
+
+
+@shared_task(time_limit=ONE_HOUR)
+def reconcile_tweet_counts_task():
+    # scheduled by celery beat, see twitter/celery.py
+    return TweetService.reconcile_counts()
@@ -1,12 +1,25 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from likes.models import Like
 from testing.testcases import TestCase
-from tweets.constants import TweetPhotoStatus
-from tweets.models import TweetPhoto
+from tweets.constants import TweetPhotoStatus, TWEET_COUNTS_LOCK_TIMEOUT
+from tweets.models import Tweet, TweetCountsFlush, TweetPhoto
+from tweets.services import TweetService
+from twitter.cache import (
+    PENDING_TWEET_COUNTS_KEY,
+    TWEET_COUNTS_LOCK_KEY,
+    TWEET_COUNTS_PATTERN,
+)
 from datetime import timedelta
+from utils.redis_client import RedisClient
+from utils.redis_helper import RedisHelper
 from utils.time_helpers import utc_now
+from unittest.mock import patch
 
 
 class TweetTests(TestCase):
     def setUp(self):
+        self.clear_cache()
         self.linghu = self.create_user('linghu')
         self.tweet = self.create_tweet(self.linghu, content='YBB I IIIIII')
 
@@ -34,4 +47,268 @@ class TweetTests(TestCase):
         )
         self.assertEqual(photo.user, self.linghu)
         self.assertEqual(photo.status, TweetPhotoStatus.PENDING)
-        self.assertEqual(self.tweet.tweetphoto_set.count(), 1)
\ No newline at end of file
+        self.assertEqual(self.tweet.tweetphoto_set.count(), 1)
+
+class TweetServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+
+    def test_get_cached_tweet_ids(self):
+        tweet_ids = [self.create_tweet(self.linghu).id for _ in range(3)][::-1]
+
+        # cache miss
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'tweet')
+        self.assertEqual([t.id for t in cached_ids], tweet_ids)
+        # cache hit, created_at is the same as in the db
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'tweet')
+        self.assertEqual([t.id for t in cached_ids], tweet_ids)
+        self.assertEqual(
+            cached_ids[0].created_at,
+            Tweet.objects.get(id=tweet_ids[0]).created_at,
+        )
+
+        # new tweet is pushed to the cached list
+        tweet = self.create_tweet(self.linghu)
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'tweet')
+        self.assertEqual([t.id for t in cached_ids], [tweet.id] + tweet_ids)
+
+        # deleted tweet is removed
+        tweet.delete()
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'tweet')
+        self.assertEqual([t.id for t in cached_ids], tweet_ids)
+
+    def test_get_cached_derived_tweet_ids(self):
+        tweets = [self.create_tweet(self.linghu) for _ in range(3)]
+        self.assertEqual(TweetService.get_cached_tweet_ids(self.linghu.id, 'likes'), [])
+        self.assertEqual(TweetService.get_cached_tweet_ids(self.linghu.id, 'replies'), [])
+
+        self.create_like(self.linghu, tweets[0])
+        TweetService.flush_pending_counts()
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'likes')
+        self.assertEqual([t.id for t in cached_ids], [tweets[0].id])
+
+        comment = self.create_comment(self.linghu, tweets[1])
+        TweetService.flush_pending_counts()
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'replies')
+        self.assertEqual([t.id for t in cached_ids], [tweets[1].id])
+        comment.delete()
+        TweetService.flush_pending_counts()
+        self.assertEqual(TweetService.get_cached_tweet_ids(self.linghu.id, 'replies'), [])
+
+        TweetService.create_photos_from_files(tweets[2], [
+            SimpleUploadedFile('selfie.jpg', str.encode('selfie'), 'image/jpeg'),
+        ])
+        cached_ids = TweetService.get_cached_tweet_ids(self.linghu.id, 'media')
+        self.assertEqual([t.id for t in cached_ids], [tweets[2].id])
+
+    def test_get_tweets_by_ids(self):
+        tweets = [self.create_tweet(self.linghu) for _ in range(3)]
+        tweet_ids = [tweets[2].id, tweets[0].id, tweets[1].id]
+
+        # all the misses are read in one query
+        with self.assertNumQueries(1):
+            result = TweetService.get_tweets_by_ids(tweet_ids)
+        self.assertEqual([tweet.id for tweet in result], tweet_ids)
+
+        # all of them are cached now
+        with self.assertNumQueries(0):
+            result = TweetService.get_tweets_by_ids(tweet_ids)
+        self.assertEqual([tweet.id for tweet in result], tweet_ids)
+
+        # deleted tweets are skipped
+        tweets[0].delete()
+        result = TweetService.get_tweets_by_ids(tweet_ids)
+        self.assertEqual([tweet.id for tweet in result], [tweets[2].id, tweets[1].id])
+
+    def test_counts_through_redis(self):
+        tweet = self.create_tweet(self.linghu)
+        dongxie = self.create_user('dongxie')
+        key = TWEET_COUNTS_PATTERN.format(tweet_id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 0)
+
+        # counted in redis, the database is not updated until the flush
+        like = self.create_like(dongxie, tweet)
+        self.create_like(self.linghu, tweet)
+        self.create_comment(dongxie, tweet)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(tweet.likes_count, 0)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 2)
+        self.assertEqual(TweetService.get_count(tweet, 'comments_count'), 1)
+
+        # counters which are not cached include the deltas not flushed yet
+        RedisClient.get_connection().delete(key)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 2)
+
+        self.assertEqual(TweetService.flush_pending_counts(), 1)
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 2)
+        self.assertEqual(tweet.comments_count, 1)
+        RedisClient.get_connection().delete(key)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 2)
+
+        like.delete()
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 1)
+        TweetService.flush_pending_counts()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 1)
+
+    def test_load_counts_with_flush(self):
+        tweet = self.create_tweet(self.linghu)
+        dongxie = self.create_user('dongxie')
+        key = TWEET_COUNTS_PATTERN.format(tweet_id=tweet.id)
+        self.create_like(dongxie, tweet)
+        conn = RedisClient.get_connection()
+
+        # the counters are not cached while a flush holds the lock
+        conn.delete(key)
+        lock = RedisHelper.acquire_lock(TWEET_COUNTS_LOCK_KEY, TWEET_COUNTS_LOCK_TIMEOUT)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 1)
+        self.assertFalse(conn.exists(key))
+        RedisHelper.release_lock(TWEET_COUNTS_LOCK_KEY, lock)
+
+        # a flush saved the batch but died before acknowledging it, the
+        # deltas being flushed are not added twice
+        generation, _ = RedisHelper.pop_pending_counts(PENDING_TWEET_COUNTS_KEY)
+        TweetCountsFlush.objects.create(generation=generation)
+        Tweet.objects.filter(id=tweet.id).update(likes_count=1)
+        self.create_like(self.linghu, tweet)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 2)
+        self.assertTrue(conn.exists(key))
+
+        # nor are they lost if the batch was not saved
+        conn.delete(key)
+        TweetCountsFlush.objects.filter(generation=generation).delete()
+        Tweet.objects.filter(id=tweet.id).update(likes_count=0)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'likes_count'), 2)
+
+    def test_flush_pending_counts_once(self):
+        tweet = self.create_tweet(self.linghu)
+        dongxie = self.create_user('dongxie')
+        self.create_like(dongxie, tweet)
+
+        # a flush is skipped while another one holds the lock
+        lock = RedisHelper.acquire_lock(TWEET_COUNTS_LOCK_KEY, TWEET_COUNTS_LOCK_TIMEOUT)
+        self.assertEqual(TweetService.flush_pending_counts(), 0)
+        RedisHelper.release_lock(TWEET_COUNTS_LOCK_KEY, lock)
+
+        # a flush saved the batch but died before acknowledging it
+        generation, pending_counts = RedisHelper.pop_pending_counts(PENDING_TWEET_COUNTS_KEY)
+        self.assertEqual(pending_counts, {'{}:likes_count'.format(tweet.id): 1})
+        TweetCountsFlush.objects.create(generation=generation)
+        Tweet.objects.filter(id=tweet.id).update(likes_count=1)
+
+        # the retry does not add the batch again, nor merge the new deltas
+        # into it
+        self.create_comment(dongxie, tweet)
+        TweetService.flush_pending_counts()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 1)
+        self.assertEqual(tweet.comments_count, 0)
+
+        TweetService.flush_pending_counts()
+        tweet.refresh_from_db()
+        self.assertEqual(tweet.likes_count, 1)
+        self.assertEqual(tweet.comments_count, 1)
+
+    def test_reconcile_counts(self):
+        tweets = [self.create_tweet(self.linghu) for _ in range(3)]
+        dongxie = self.create_user('dongxie')
+        self.create_like(dongxie, tweets[0])
+        self.create_comment(dongxie, tweets[1])
+        TweetService.flush_pending_counts()
+        self.assertEqual(TweetService.reconcile_counts(batch_size=2), 0)
+
+        # drifted counters are fixed
+        Tweet.objects.filter(id=tweets[0].id).update(likes_count=5)
+        Tweet.objects.filter(id=tweets[2].id).update(comments_count=3)
+        self.assertEqual(TweetService.reconcile_counts(batch_size=2), 2)
+        self.assertEqual(Tweet.objects.get(id=tweets[0].id).likes_count, 1)
+        self.assertEqual(Tweet.objects.get(id=tweets[2].id).comments_count, 0)
+
+        # deltas not flushed yet are not regarded as drift
+        self.create_like(self.linghu, tweets[0])
+        self.assertEqual(TweetService.reconcile_counts(batch_size=2), 0)
+        TweetService.flush_pending_counts()
+        self.assertEqual(Tweet.objects.get(id=tweets[0].id).likes_count, 2)
+
+        # nor is a batch which was saved but not acknowledged
+        self.create_like(self.linghu, tweets[1])
+        generation, _ = RedisHelper.pop_pending_counts(PENDING_TWEET_COUNTS_KEY)
+        TweetCountsFlush.objects.create(generation=generation)
+        Tweet.objects.filter(id=tweets[1].id).update(likes_count=1)
+        self.assertEqual(TweetService.reconcile_counts(batch_size=2), 0)
+        self.assertEqual(Tweet.objects.get(id=tweets[1].id).likes_count, 1)
+
+        # the cached counters are loaded again even if the database is right
+        TweetService.flush_pending_counts()
+        tweet = Tweet.objects.get(id=tweets[2].id)
+        self.assertEqual(TweetService.get_count(tweet, 'comments_count'), 0)
+        key = TWEET_COUNTS_PATTERN.format(tweet_id=tweet.id)
+        RedisClient.get_connection().hset(key, 'comments_count', 7)
+        self.assertEqual(TweetService.reconcile_counts(batch_size=2), 0)
+        tweet = Tweet.objects.get(id=tweet.id)
+        self.assertEqual(TweetService.get_count(tweet, 'comments_count'), 0)
+
+    def test_reconcile_counts_with_like_being_saved(self):
+        tweet = self.create_tweet(self.linghu)
+        dongxie = self.create_user('dongxie')
+        self.create_like(dongxie, tweet)
+        TweetService.flush_pending_counts()
+
+        get_drifts = TweetService._get_drifts
+
+        def save_like_during_first_read(tweets):
+            if Like.objects.filter(user=self.linghu).exists():
+                return get_drifts(tweets)
+            # the like is counted in redis but not committed yet when the
+            # batch is recounted for the first time
+            TweetService.incr_count(tweet.id, 'likes_count', 1)
+            drifts = get_drifts(tweets)
+            Like.objects.bulk_create([Like(
+                content_type=ContentType.objects.get_for_model(Tweet),
+                object_id=tweet.id,
+                user=self.linghu,
+            )])
+            return drifts
+
+        with patch.object(TweetService, '_get_drifts', side_effect=save_like_during_first_read):
+            self.assertEqual(TweetService.reconcile_counts(), 0)
+        TweetService.flush_pending_counts()
+        self.assertEqual(Tweet.objects.get(id=tweet.id).likes_count, 2)
+
+    def test_get_photo_urls(self):
+        tweet = self.create_tweet(self.linghu)
+        plain_tweet = self.create_tweet(self.linghu)
+        TweetService.create_photos_from_files(tweet, [
+            SimpleUploadedFile('selfie1.jpg', str.encode('selfie1'), 'image/jpeg'),
+            SimpleUploadedFile('selfie2.jpg', str.encode('selfie2'), 'image/jpeg'),
+        ])
+
+        # signed when the photos are created
+        with self.assertNumQueries(0):
+            photo_urls = TweetService.get_photo_urls([tweet.id])
+        self.assertEqual(len(photo_urls[tweet.id]), 2)
+        self.assertIn('selfie1', photo_urls[tweet.id][0])
+
+        # one query for all the misses, tweets without photos are cached too
+        with self.assertNumQueries(1):
+            photo_urls = TweetService.get_photo_urls([plain_tweet.id])
+        self.assertEqual(photo_urls, {plain_tweet.id: []})
+        with self.assertNumQueries(0):
+            TweetService.get_photo_urls([tweet.id, plain_tweet.id])
+
+        # changing a photo invalidates the cache
+        photo = TweetPhoto.objects.filter(tweet=tweet).order_by('order').last()
+        photo.status = TweetPhotoStatus.REJECTED
+        photo.save()
+        with self.assertNumQueries(1):
+            photo_urls = TweetService.get_photo_urls([tweet.id])
+        self.assertEqual(len(photo_urls[tweet.id]), 2)
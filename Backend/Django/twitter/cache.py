@@ -1,2 +1,17 @@
 FOLLOWINGS_PATTERN = 'followings:{user_id}'
+FOLLOWERS_PATTERN = 'followers:{user_id}'
+MUTUAL_FOLLOWS_PATTERN = 'mutual_follows:{user_id}'
+RECOMMENDED_USERS_PATTERN = 'recommended_users:{user_id}'
+RECOMMENDED_USERS_REFRESH_PATTERN = 'recommended_users_refresh:{user_id}'
 USER_PROFILE_PATTERN = 'userprofile:{user_id}'
+FOLLOWED_CELEBRITIES_PATTERN = 'followed_celebrities:{user_id}'
+USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+USER_TWEETS_PATTERN = 'user_tweets:{user_id}:{tweet_type}'
+TWEET_COUNTS_PATTERN = 'tweet_counts:{tweet_id}'
+TWEET_PHOTO_URLS_PATTERN = 'tweet_photo_urls:{tweet_id}'
+TWEET_COMMENTS_FIRST_PAGE_PATTERN = 'tweet_comments_first_page:{tweet_id}'
+COMMENT_TWEET_ID_PATTERN = 'comment_tweet_id:{comment_id}'
+LIKE_TOGGLE_PATTERN = 'like_toggle:{user_id}:{content_type_id}:{object_id}'
+PENDING_TWEET_COUNTS_KEY = 'pending_tweet_counts'
+TWEET_COUNTS_LOCK_KEY = 'tweet_counts_lock'
+SUGGESTION_POOL_KEY = 'suggestion_pool'
@@ -32,4 +32,16 @@ app.conf.beat_schedule = {
         'task': 'stocks.tasks.get_async_options',
         'schedule': crontab(hour=8, minute=41, day_of_week='1-5'),
     },
+    'flush-tweet-counts': {
+        'task': 'tweets.tasks.flush_tweet_counts_task',
+        'schedule': 60.0,
+    },
+    'refresh-suggestion-pool': {
+        'task': 'accounts.tasks.refresh_suggestion_pool_task',
+        'schedule': crontab(minute=0),
+    },
+    'reconcile-tweet-counts': {
+        'task': 'tweets.tasks.reconcile_tweet_counts_task',
+        'schedule': crontab(hour=9, minute=30),
+    },
 }
\ No newline at end of file
@@ -34,21 +34,88 @@ INTERNAL_IPS = config('INTERNAL_IPS', default='127.0.0.1').split(',')
 DEFAULT_FILE_STORAGE = config('DEFAULT_FILE_STORAGE', default='storages.backends.s3boto3.S3Boto3Storage')
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME')
+# seconds the signed urls of the uploaded files are valid for
+AWS_QUERYSTRING_EXPIRE = config('AWS_QUERYSTRING_EXPIRE', default=3600, cast=int)
 
 # API Keys
 CHAT_GPT_API_KEY = config('CHAT_GPT_API_KEY')
 EXPO_ACCESS_TOKEN = config('EXPO_ACCESS_TOKEN')
 FINN_API_KEY = config('FINN_API_KEY')
 
+# Redis Configuration
+REDIS_HOST = config('REDIS_HOST', default='127.0.0.1')
+REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
+REDIS_DB = config('REDIS_DB', default=0, cast=int)
+REDIS_KEY_EXPIRE_TIME = 7 * 86400  # in seconds
+# the number of newest objects kept in a cached list, older ones are read
+# from the database
+REDIS_LIST_LENGTH_LIMIT = config('REDIS_LIST_LENGTH_LIMIT', default=1000, cast=int)
+
 # Cache Configuration
+# CACHE_BACKEND picks the cache tier behind the default alias: redis,
+# memcached or locmem (a per-process fallback for local development)
+CACHE_BACKEND = config('CACHE_BACKEND', default='redis')
+CACHE_KEY_PREFIX = config('CACHE_KEY_PREFIX', default='twitter')
+CACHE_TIMEOUT = config('CACHE_TIMEOUT', default=86400, cast=int)  # 1 day
+CACHE_MAX_CONNECTIONS = config('CACHE_MAX_CONNECTIONS', default=50, cast=int)
+CACHE_BACKENDS = {
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        # a different db from REDIS_DB, so the cached objects and the cached
+        # lists don't evict or flush each other
+        'LOCATION': config(
+            'CACHE_REDIS_URL',
+            default='redis://{}:{}/{}'.format(REDIS_HOST, REDIS_PORT, REDIS_DB + 2),
+        ),
+        'OPTIONS': {
+            'max_connections': CACHE_MAX_CONNECTIONS,
+        },
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': config('CACHE_MEMCACHED_LOCATION', default='127.0.0.1:11211').split(','),
+        'OPTIONS': {
+            'use_pooling': True,
+            'max_pool_size': CACHE_MAX_CONNECTIONS,
+            'no_delay': True,
+            'ignore_exc': True,
+        },
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'cache_table',
-        'TIMEOUT': 86400  # 1 day
-    }
+    'default': dict(
+        CACHE_BACKENDS[CACHE_BACKEND],
+        KEY_PREFIX=CACHE_KEY_PREFIX,
+        TIMEOUT=CACHE_TIMEOUT,
+    ),
+    # used instead of default when running unit tests, see the
+    # `caches['testing'] if settings.TESTING else caches['default']` lookups
+    'testing': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'testing',
+        'KEY_PREFIX': 'testing',
+        'TIMEOUT': 86400,
+    },
 }
 
+# an optional per process LRU cache in front of the default cache for hot
+# objects (users, profiles, tweets), see utils/local_cache.py
+LOCAL_CACHE_ENABLED = config('LOCAL_CACHE_ENABLED', default=False, cast=bool)
+LOCAL_CACHE_MAX_SIZE = config('LOCAL_CACHE_MAX_SIZE', default=1000, cast=int)
+LOCAL_CACHE_TTL = config('LOCAL_CACHE_TTL', default=5, cast=int)  # in seconds
+
+# Newsfeed Configuration
+# authors with at least this many followers are not fanned out, their tweets
+# are pulled into the newsfeeds of their followers when the feed is read
+NEWSFEED_CELEBRITY_THRESHOLD = config('NEWSFEED_CELEBRITY_THRESHOLD', default=10000, cast=int)
+
 # Database Configuration
 DATABASES = {
     'default': {
@@ -212,6 +279,9 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760 # 10MB in bytes
 TESTING = ((" ".join(sys.argv)).find('manage.py test') != -1)
 if TESTING:
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+    # use a separated redis db and a small list limit for unit tests
+    REDIS_DB = 1
+    REDIS_LIST_LENGTH_LIMIT = 20
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
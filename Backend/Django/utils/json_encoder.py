@@ -0,0 +1,15 @@
+from django.core.serializers.json import DjangoJSONEncoder
+import datetime
+
+
+class JSONEncoder(DjangoJSONEncoder):
+
+    def default(self, o):
+        # DjangoJSONEncoder truncates datetime to milliseconds, we keep the
+        # microseconds so the cached created_at is the same as in the db
+        if isinstance(o, datetime.datetime):
+            r = o.isoformat()
+            if r.endswith('+00:00'):
+                r = r[:-6] + 'Z'
+            return r
+        return super(JSONEncoder, self).default(o)
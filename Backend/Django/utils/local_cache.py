@@ -0,0 +1,162 @@
+import copy
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_INVALIDATION_CHANNEL = 'local_cache_invalidation'
+
+
+class LocalCache:
+    """
+    a thread safe LRU cache in the memory of the current process, the entries
+    expire after `ttl` seconds so other processes' writes show up quickly even
+    if an invalidation message is lost
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if expire_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        # callers set attributes on the objects they get (e.g. _cached_user),
+        # so every caller gets its own copy
+        return copy.copy(value)
+
+    def set(self, key, value):
+        value = copy.copy(value)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# shared by all the TwoLevelCache instances of the process
+local_cache = LocalCache(
+    max_size=settings.LOCAL_CACHE_MAX_SIZE,
+    ttl=settings.LOCAL_CACHE_TTL,
+)
+# hit / miss counters of each layer in the current process
+stats = Counter()
+
+_subscriber_pid = None
+_subscriber_lock = threading.Lock()
+
+
+def _on_invalidation(message):
+    key = message['data']
+    if isinstance(key, bytes):
+        key = key.decode()
+    local_cache.delete(key)
+
+
+def _ensure_subscribed():
+    # one listener thread per process, started again in forked workers
+    global _subscriber_pid
+    if _subscriber_pid == os.getpid():
+        return
+    with _subscriber_lock:
+        if _subscriber_pid == os.getpid():
+            return
+        from utils.redis_client import RedisClient
+        # entries copied from the parent process might have missed messages
+        local_cache.clear()
+        try:
+            pubsub = RedisClient.get_connection().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{LOCAL_CACHE_INVALIDATION_CHANNEL: _on_invalidation})
+            pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except Exception:
+            logger.exception('failed to subscribe to local cache invalidations')
+        _subscriber_pid = os.getpid()
+
+
+def _publish_invalidation(key):
+    from utils.redis_client import RedisClient
+    try:
+        RedisClient.get_connection().publish(LOCAL_CACHE_INVALIDATION_CHANNEL, key)
+    except Exception:
+        # the local copies expire after LOCAL_CACHE_TTL anyway
+        logger.exception('failed to publish local cache invalidation')
+
+
+class TwoLevelCache:
+    """
+    puts the per process local_cache (when settings.LOCAL_CACHE_ENABLED) in
+    front of a shared django cache. deletes are broadcast through redis pub/sub
+    so the other processes drop their local copies as well.
+    """
+
+    def __init__(self, shared_cache):
+        self.shared_cache = shared_cache
+
+    @property
+    def local_enabled(self):
+        return settings.LOCAL_CACHE_ENABLED
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        key_to_value = {}
+        missed_keys = list(keys)
+        if self.local_enabled:
+            _ensure_subscribed()
+            missed_keys = []
+            for key in keys:
+                value = local_cache.get(key)
+                if value is None:
+                    missed_keys.append(key)
+                else:
+                    key_to_value[key] = value
+            stats['local_hits'] += len(key_to_value)
+            stats['local_misses'] += len(missed_keys)
+        if not missed_keys:
+            return key_to_value
+
+        shared_values = self.shared_cache.get_many(missed_keys)
+        stats['shared_hits'] += len(shared_values)
+        stats['shared_misses'] += len(missed_keys) - len(shared_values)
+        if self.local_enabled:
+            for key, value in shared_values.items():
+                local_cache.set(key, value)
+        key_to_value.update(shared_values)
+        return key_to_value
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, data):
+        self.shared_cache.set_many(data)
+        if self.local_enabled:
+            for key, value in data.items():
+                local_cache.set(key, value)
+
+    def delete(self, key):
+        self.shared_cache.delete(key)
+        local_cache.delete(key)
+        if self.local_enabled:
+            _publish_invalidation(key)
@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.core.cache import caches
+from utils.local_cache import TwoLevelCache
 
-cache = caches['testing'] if settings.TESTING else caches['default']
+cache = TwoLevelCache(caches['testing'] if settings.TESTING else caches['default'])
 
 
 class MemcachedHelper:
@@ -24,6 +25,53 @@ class MemcachedHelper:
         cache.set(key, obj)
         return obj
 
+    @classmethod
+    def get_objects_through_cache(cls, model_class, object_ids):
+        """
+        batch version of get_object_through_cache, one get_many for the cache
+        and one IN query for all the misses. the objects are returned in the
+        order of object_ids, the ones that do not exist are skipped.
+        """
+        keys = [cls.get_key(model_class, object_id) for object_id in object_ids]
+        # cache hit
+        key_to_object = cache.get_many(keys)
+
+        # cache miss
+        missed_ids = [
+            object_id
+            for object_id, key in zip(object_ids, keys)
+            if key not in key_to_object
+        ]
+        if missed_ids:
+            missed_objects = {
+                cls.get_key(model_class, obj.id): obj
+                for obj in model_class.objects.filter(id__in=missed_ids)
+            }
+            cache.set_many(missed_objects)
+            key_to_object.update(missed_objects)
+
+        return [key_to_object[key] for key in keys if key in key_to_object]
+
+    @classmethod
+    def prefetch_objects_through_cache(cls, instances, model_class, id_field, cached_field):
+        """
+        load the related objects of a list of instances in batch, and set them
+        to instance.<cached_field> so the cached_xxx properties don't need to
+        go to the cache one by one
+        """
+        object_ids = set(getattr(instance, id_field) for instance in instances)
+        objects = cls.get_objects_through_cache(model_class, list(object_ids))
+        id_to_object = {obj.id: obj for obj in objects}
+        for instance in instances:
+            setattr(instance, cached_field, id_to_object.get(getattr(instance, id_field)))
+        return objects
+
+    @classmethod
+    def is_cached(cls, model_class, object_id):
+        # the cached objects are invalidated when they are deleted, so a cached
+        # object exists without reading the database
+        return cache.get(cls.get_key(model_class, object_id)) is not None
+
     @classmethod
     def invalidate_cached_object(cls, model_class, object_id):
         key = cls.get_key(model_class, object_id)
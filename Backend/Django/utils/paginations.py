@@ -1,5 +1,37 @@
+import base64
+import json
+from datetime import timezone
+from dateutil import parser
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination, BasePagination
 from rest_framework.response import Response
+from utils.redis_helper import RedisHelper
+
+
+def parse_created_at(value):
+    created_at = parser.isoparse(value)
+    # a created_at without timezone is regarded as UTC, the same as the db
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at
+
+
+def encode_cursor(created_at, object_id):
+    cursor = json.dumps({'created_at': created_at.isoformat(), 'id': object_id})
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    return (created_at, id) of the last object of the previous page
+    """
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return parse_created_at(cursor['created_at']), int(cursor['id'])
+    except (ValueError, KeyError, TypeError):
+        raise NotFound('Invalid cursor')
 
 
 class FriendshipPagination(PageNumberPagination):
@@ -10,7 +42,54 @@ class FriendshipPagination(PageNumberPagination):
 
     max_page_size = 20
 
+    # passing cursor (empty for the first page) switches to keyset pagination
+    # on (created_at, id), which needs neither COUNT(*) nor OFFSET
+    cursor_query_param = 'cursor'
+    # with_total=1 adds an approximate total_results to a cursor page, read
+    # from view.get_approximate_total
+    with_total_query_param = 'with_total'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            created_at, object_id = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=object_id)
+            )
+        objects = list(queryset[:page_size + 1])
+        self.has_next_page = len(objects) > page_size
+        objects = objects[:page_size]
+        self.next_cursor = None
+        if self.has_next_page:
+            self.next_cursor = encode_cursor(objects[-1].created_at, objects[-1].id)
+
+        self.approximate_total = None
+        with_total = request.query_params.get(self.with_total_query_param, '')
+        if with_total.lower() in ('1', 'true') and \
+                hasattr(view, 'get_approximate_total'):
+            self.approximate_total = view.get_approximate_total()
+        return objects
+
     def get_paginated_response(self, data):
+        if self.cursor_mode:
+            response = {
+                'has_next_page': self.has_next_page,
+                'next_cursor': self.next_cursor,
+                'results': data,
+                'followers': data,
+                'followings': data,
+            }
+            if self.approximate_total is not None:
+                response['total_results'] = self.approximate_total
+            return Response(response)
+
         return Response({
             'total_results': self.page.paginator.count,
             'total_pages': self.page.paginator.num_pages,
@@ -22,29 +101,215 @@ class FriendshipPagination(PageNumberPagination):
         })
 
 class EndlessPagination(BasePagination):
+    """
+    pages are ordered by (created_at, tiebreak_field) desc:
+    - cursor: the next_cursor of the previous page, objects older than it
+    - created_at__lt: the same without the tie-break, kept for old clients
+    - created_at__gt: the newest page_size objects newer than it, for
+      refreshing. has_next_page means there are even more new objects.
+    """
     page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 20
+    # objects with the same created_at (e.g. the newsfeeds bulk created by a
+    # fanout) are ordered by this field, so no one is skipped or repeated
+    tiebreak_field = 'id'
 
     def __init__(self):
         super(EndlessPagination, self).__init__()
         self.has_next_page = False
-    
-    def paginate_queryset(self, queryset, request, view=None):
+        self.next_cursor = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def _get_sort_key(self, obj):
+        return obj.created_at, getattr(obj, self.tiebreak_field)
+
+    def _has_sort_key(self, obj):
+        # e.g. a newsfeed whose tweet was deleted, it can be neither ordered
+        # nor pointed to by a cursor
+        return getattr(obj, self.tiebreak_field) is not None
+
+    def _filter_objects(self, objects, request):
+        """
+        the in-memory version of the cursor filters in slice_queryset
+        """
         if 'created_at__gt' in request.query_params:
-            created_at__gt = request.query_params['created_at__gt']
+            created_at__gt = parse_created_at(request.query_params['created_at__gt'])
+            return [obj for obj in objects if obj.created_at > created_at__gt]
+        if request.query_params.get('cursor'):
+            cursor = decode_cursor(request.query_params['cursor'])
+            return [obj for obj in objects if self._get_sort_key(obj) < cursor]
+        if 'created_at__lt' in request.query_params:
+            created_at__lt = parse_created_at(request.query_params['created_at__lt'])
+            return [obj for obj in objects if obj.created_at < created_at__lt]
+        return objects
+
+    def slice_queryset(self, queryset, request, tiebreak_field=None):
+        """
+        apply the cursor of the request and order the queryset, return a list
+        of page_size + 1 objects so that we can tell if there is a next page.
+        tiebreak_field is the field of the queryset's model holding the value
+        of self.tiebreak_field, e.g. Tweet.id for NewsFeed.tweet_id.
+        """
+        tiebreak_field = tiebreak_field or self.tiebreak_field
+        if 'created_at__gt' in request.query_params:
+            created_at__gt = parse_created_at(request.query_params['created_at__gt'])
             queryset = queryset.filter(created_at__gt=created_at__gt)
-            self.has_next_page = False
-            return queryset.order_by('-created_at')
+        elif request.query_params.get('cursor'):
+            created_at, tiebreak = decode_cursor(request.query_params['cursor'])
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, **{tiebreak_field + '__lt': tiebreak})
+            )
+        elif 'created_at__lt' in request.query_params:
+            created_at__lt = parse_created_at(request.query_params['created_at__lt'])
+            queryset = queryset.filter(created_at__lt=created_at__lt)
 
+        queryset = queryset.order_by('-created_at', '-' + tiebreak_field)
+        return list(queryset[:self.get_page_size(request) + 1])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_ordered_list(self.slice_queryset(queryset, request), request)
+
+    def _get_score_range(self, request):
+        """
+        the (max_score, min_score) of the cached sorted set which covers the
+        objects asked for, see RedisHelper.get_score
+        """
+        if 'created_at__gt' in request.query_params:
+            created_at__gt = parse_created_at(request.query_params['created_at__gt'])
+            return '+inf', '({}'.format(RedisHelper.datetime_to_score(created_at__gt))
+        if request.query_params.get('cursor'):
+            # the objects with the same created_at as the cursor are filtered
+            # by the tie-break in memory
+            created_at, _ = decode_cursor(request.query_params['cursor'])
+            return RedisHelper.datetime_to_score(created_at), '-inf'
         if 'created_at__lt' in request.query_params:
-            created_at__lt = request.query_params['created_at__lt']
-            queryset = queryset.filter(created_at__lt=created_at__lt)
+            created_at__lt = parse_created_at(request.query_params['created_at__lt'])
+            return '({}'.format(RedisHelper.datetime_to_score(created_at__lt)), '-inf'
+        return '+inf', '-inf'
+
+    def slice_cached_list(self, load_cached_slice, request):
+        """
+        the in-memory version of slice_queryset for a cached list ordered by
+        created_at desc. only the slice of the list covering the page is read
+        through load_cached_slice(max_score, min_score, offset, count), which
+        returns a CachedSlice, e.g. RedisHelper.load_objects_slice.
+        return None if the page goes beyond the cached window and has to be
+        read from the database.
+        """
+        page_size = self.get_page_size(request)
+        max_score, min_score = self._get_score_range(request)
+        cached_objects = []
+        offset = 0
+        count = page_size + 1
+        while True:
+            cached_slice = load_cached_slice(
+                max_score=max_score,
+                min_score=min_score,
+                offset=offset,
+                count=count,
+            )
+            offset += len(cached_slice.objects)
+            cached_objects.extend(
+                obj for obj in cached_slice.objects if self._has_sort_key(obj)
+            )
+            # the cached lists are ordered by created_at only
+            objects = sorted(cached_objects, key=self._get_sort_key, reverse=True)
+            objects = self._filter_objects(objects, request)
+            # the end of the cached list is reached
+            if len(cached_slice.objects) < count:
+                break
+            # the objects with the same created_at as the last one of the page
+            # might be in the rest of the list and sort before it
+            if len(objects) > page_size and \
+                    cached_slice.objects[-1].created_at < objects[page_size].created_at:
+                break
+            count = offset
+
+        # the cached list always contains the newest objects, or there are
+        # enough objects in the cache to tell if there is a next page
+        if 'created_at__gt' in request.query_params or len(objects) > page_size:
+            return objects[:page_size + 1]
+        # the cached list is not full, so it contains all the objects
+        if cached_slice.size < settings.REDIS_LIST_LENGTH_LIMIT:
+            return objects
+        return None
+
+    def paginate_ordered_list(self, reverse_ordered_list, request):
+        """
+        same as paginate_queryset but for a list which is already ordered by
+        (created_at, tiebreak_field) desc in memory
+        """
+        page_size = self.get_page_size(request)
+        objects = self._filter_objects(
+            [obj for obj in reverse_ordered_list if self._has_sort_key(obj)],
+            request,
+        )
+        self.has_next_page = len(objects) > page_size
+        objects = objects[:page_size]
+        self.next_cursor = None
+        if self.has_next_page:
+            last = objects[-1]
+            self.next_cursor = encode_cursor(last.created_at, getattr(last, self.tiebreak_field))
+        return objects
 
-        queryset = queryset.order_by('-created_at')[:self.page_size + 1]
-        self.has_next_page = len(queryset) > self.page_size
-        return queryset[:self.page_size]
-    
     def get_paginated_response(self, data):
         return Response({
             'has_next_page': self.has_next_page,
+            'next_cursor': self.next_cursor,
             'results': data,
-        })
\ No newline at end of file
+        })
+
+
+class NewsFeedPagination(EndlessPagination):
+    # the tweets pulled from celebrities are merged into the newsfeeds as
+    # unsaved NewsFeed objects, tweet_id is unique in a user's newsfeeds
+    tiebreak_field = 'tweet_id'
+
+
+class CommentPagination(EndlessPagination):
+    """
+    the comments of a tweet are read oldest first, pages are ordered by
+    (created_at, id) asc over the (tweet, created_at) index. cursor is the
+    next_cursor of the previous page.
+    """
+    page_size = 20
+    max_page_size = 50
+
+    def _filter_objects(self, objects, request):
+        if request.query_params.get('cursor'):
+            cursor = decode_cursor(request.query_params['cursor'])
+            return [obj for obj in objects if self._get_sort_key(obj) > cursor]
+        return objects
+
+    def slice_queryset(self, queryset, request, tiebreak_field=None):
+        tiebreak_field = tiebreak_field or self.tiebreak_field
+        if request.query_params.get('cursor'):
+            created_at, tiebreak = decode_cursor(request.query_params['cursor'])
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) |
+                Q(created_at=created_at, **{tiebreak_field + '__gt': tiebreak})
+            )
+        queryset = queryset.order_by('created_at', tiebreak_field)
+        return list(queryset[:self.get_page_size(request) + 1])
+
+    def is_first_page(self, request):
+        # the first page with the default page size can be served from cache
+        return not request.query_params.get('cursor') and \
+            self.get_page_size(request) == self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'has_next_page': self.has_next_page,
+            'next_cursor': self.next_cursor,
+            'comments': data,
+        })
@@ -26,6 +26,7 @@ def send_push_notification(user_profile, token, title, body):
         # Check if the token is invalid and update if necessary
         if response_data.get('data') and response_data['data']['status'] == 'error':
             user_profile.expo_push_token = None
-            user_profile.save()
+            # the profile was loaded before the request, only the token is saved
+            user_profile.save(update_fields=['expo_push_token', 'updated_at'])
     except requests.RequestException as e:
         logger.error(f"Network error occurred: {e}")
@@ -0,0 +1,465 @@
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from utils.redis_client import RedisClient
+from utils.redis_serializers import DjangoModelSerializer
+
+
+# add the object to the sorted set only if the set is already cached, and
+# drop the oldest members which exceed the length limit. it has to be atomic,
+# otherwise a set which expired in between would be recreated with only one
+# object in it and regarded as the whole list.
+PUSH_IF_EXISTS_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('zadd', KEYS[1], ARGV[1], ARGV[2])
+redis.call('zremrangebyrank', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+return 1
+"""
+
+# record the change in the pending deltas which are flushed to the database
+# later, and apply it to the cached counters only if they are cached, for the
+# same reason as PUSH_IF_EXISTS_SCRIPT
+INCR_COUNTER_SCRIPT = """
+redis.call('hincrby', KEYS[2], ARGV[3], ARGV[2])
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('hincrby', KEYS[1], ARGV[1], ARGV[2])
+end
+return 1
+"""
+
+# cache the counters as the counts in the database plus the pending deltas,
+# reading the deltas at the same time as the counters are created, otherwise
+# a delta recorded in between by INCR_COUNTER_SCRIPT would be lost. KEYS are
+# the pending hash, the flushing hash and then the counters, ARGV are the
+# number of fields, whether to add the flushing deltas, the expire time and
+# then (field, count, pending field) of each counter.
+INIT_COUNTERS_SCRIPT = """
+local num_fields = tonumber(ARGV[1])
+local results = {}
+local index = 4
+for i = 3, #KEYS do
+    local counts = {}
+    for j = 1, num_fields do
+        local count = tonumber(ARGV[index + 1])
+        count = count + tonumber(redis.call('hget', KEYS[1], ARGV[index + 2]) or 0)
+        if ARGV[2] == '1' then
+            count = count + tonumber(redis.call('hget', KEYS[2], ARGV[index + 2]) or 0)
+        end
+        table.insert(counts, ARGV[index])
+        table.insert(counts, count)
+        table.insert(results, count)
+        index = index + 3
+    end
+    redis.call('hset', KEYS[i], unpack(counts))
+    redis.call('expire', KEYS[i], ARGV[3])
+end
+return results
+"""
+
+# move the pending deltas into the flushing hash tagged with a new
+# generation, and return the generation and the deltas. an unacknowledged
+# flushing hash is returned as it is, so a failed flush is retried with
+# exactly the same deltas and the generation tells if they were applied.
+POP_PENDING_COUNTS_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 then
+    if redis.call('exists', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('rename', KEYS[1], KEYS[2])
+    redis.call('set', KEYS[3], ARGV[1])
+end
+return {redis.call('get', KEYS[3]), redis.call('hgetall', KEYS[2])}
+"""
+
+# delete the flushing hash only if it is still the acknowledged generation
+ACK_PENDING_COUNTS_SCRIPT = """
+if redis.call('get', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1], KEYS[2])
+return 1
+"""
+
+# release the lock only if it is still held by the caller, it might have
+# expired and been acquired by someone else
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('del', KEYS[1])
+"""
+
+# seconds between the attempts of a blocking acquire_lock
+LOCK_RETRY_INTERVAL = 0.1
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# an object id in a cached id list together with its created_at, enough for
+# EndlessPagination to find the ids of a page before loading the objects
+ScoredId = namedtuple('ScoredId', ['id', 'created_at'])
+
+# a part of a cached list, size is the length of the whole cached list
+CachedSlice = namedtuple('CachedSlice', ['objects', 'size'])
+
+# the only member of a cached empty list. it has the lowest score, so it is
+# the first one dropped once the list grows over the length limit.
+EMPTY_LIST_MEMBER = ''
+
+
+class RedisHelper:
+    """
+    the cached lists are redis sorted sets scored by created_at, so they stay
+    ordered even if objects are pushed out of order (e.g. asynchronous fanout)
+    """
+
+    @classmethod
+    def get_score(cls, obj):
+        return cls.datetime_to_score(obj.created_at)
+
+    @classmethod
+    def datetime_to_score(cls, created_at):
+        # integer microseconds are exact in a double, so the created_at can be
+        # converted back from the score without losing precision
+        return (created_at - EPOCH) // timedelta(microseconds=1)
+
+    @classmethod
+    def score_to_datetime(cls, score):
+        return EPOCH + timedelta(microseconds=int(score))
+
+    @classmethod
+    def _read_slice(cls, conn, key, max_score, min_score, offset, count):
+        pipe = conn.pipeline()
+        pipe.zcard(key)
+        pipe.zscore(key, EMPTY_LIST_MEMBER)
+        pipe.zrevrangebyscore(
+            key,
+            max_score,
+            min_score,
+            start=offset,
+            num=-1 if count is None else count,
+            withscores=True,
+        )
+        size, empty_score, members = pipe.execute()
+        if not size:
+            return None
+        return CachedSlice(
+            [
+                (member, score)
+                for member, score in members
+                if member != EMPTY_LIST_MEMBER.encode()
+            ],
+            size if empty_score is None else size - 1,
+        )
+
+    @classmethod
+    def _load_slice(cls, key, load_members, max_score, min_score, offset, count):
+        conn = RedisClient.get_connection()
+
+        # cache hit
+        cached_slice = cls._read_slice(conn, key, max_score, min_score, offset, count)
+        if cached_slice is not None:
+            return cached_slice
+
+        # cache miss, an empty list is cached as well, otherwise every read of
+        # it would hit the database
+        mapping = load_members() or {EMPTY_LIST_MEMBER: float('-inf')}
+        pipe = conn.pipeline()
+        pipe.delete(key)
+        pipe.zadd(key, mapping)
+        pipe.expire(key, settings.REDIS_KEY_EXPIRE_TIME)
+        pipe.execute()
+        return cls._read_slice(conn, key, max_score, min_score, offset, count)
+
+    @classmethod
+    def load_objects_slice(
+        cls,
+        key,
+        queryset,
+        max_score='+inf',
+        min_score='-inf',
+        offset=0,
+        count=None,
+    ):
+        """
+        the cached list holds the newest REDIS_LIST_LENGTH_LIMIT objects, the
+        queryset has to be ordered by created_at desc. only the objects with a
+        score in [min_score, max_score] (see ZREVRANGEBYSCORE) starting from
+        offset are read, at most count of them, ordered by created_at desc.
+        return a CachedSlice.
+        """
+        cached_slice = cls._load_slice(
+            key,
+            lambda: {
+                DjangoModelSerializer.serialize(obj): cls.get_score(obj)
+                for obj in queryset[:settings.REDIS_LIST_LENGTH_LIMIT]
+            },
+            max_score,
+            min_score,
+            offset,
+            count,
+        )
+        return CachedSlice(
+            [
+                DjangoModelSerializer.deserialize(serialized_data)
+                for serialized_data, _ in cached_slice.objects
+            ],
+            cached_slice.size,
+        )
+
+    @classmethod
+    def load_objects(cls, key, queryset):
+        """
+        return the whole cached list ordered by created_at desc
+        """
+        return cls.load_objects_slice(key, queryset).objects
+
+    @classmethod
+    def load_ids_slice(
+        cls,
+        key,
+        queryset,
+        max_score='+inf',
+        min_score='-inf',
+        offset=0,
+        count=None,
+    ):
+        """
+        same as load_objects_slice but only the ids are cached, the objects
+        of the slice are ScoredId
+        """
+        cached_slice = cls._load_slice(
+            key,
+            lambda: {
+                object_id: cls.datetime_to_score(created_at)
+                for object_id, created_at in queryset.values_list(
+                    'id',
+                    'created_at',
+                )[:settings.REDIS_LIST_LENGTH_LIMIT]
+            },
+            max_score,
+            min_score,
+            offset,
+            count,
+        )
+        return CachedSlice(
+            [
+                ScoredId(int(member), cls.score_to_datetime(score))
+                for member, score in cached_slice.objects
+            ],
+            cached_slice.size,
+        )
+
+    @classmethod
+    def load_ids(cls, key, queryset):
+        """
+        return the whole cached id list as ScoredId ordered by created_at desc
+        """
+        return cls.load_ids_slice(key, queryset).objects
+
+    @classmethod
+    def push_object(cls, key, obj):
+        cls.push_objects([(key, obj)])
+
+    @classmethod
+    def push_objects(cls, key_object_pairs):
+        cls._push_members([
+            (key, obj, DjangoModelSerializer.serialize(obj))
+            for key, obj in key_object_pairs
+        ])
+
+    @classmethod
+    def push_id(cls, key, obj):
+        cls._push_members([(key, obj, obj.id)])
+
+    @classmethod
+    def _push_members(cls, key_object_member_list):
+        # if the list is not cached yet, it will be loaded from the database
+        # the next time it is read, so there is nothing to do
+        conn = RedisClient.get_connection()
+        script = conn.register_script(PUSH_IF_EXISTS_SCRIPT)
+        pipe = conn.pipeline(transaction=False)
+        for key, obj, member in key_object_member_list:
+            script(
+                keys=[key],
+                args=[
+                    cls.get_score(obj),
+                    member,
+                    settings.REDIS_LIST_LENGTH_LIMIT,
+                ],
+                client=pipe,
+            )
+        pipe.execute()
+
+    @classmethod
+    def invalidate_list(cls, *keys):
+        conn = RedisClient.get_connection()
+        conn.delete(*keys)
+
+    @classmethod
+    def get_flushing_key(cls, pending_key):
+        return '{}:flushing'.format(pending_key)
+
+    @classmethod
+    def incr_counter(cls, key, field, delta, pending_key, pending_field):
+        conn = RedisClient.get_connection()
+        script = conn.register_script(INCR_COUNTER_SCRIPT)
+        script(keys=[key, pending_key], args=[field, delta, pending_field])
+
+    @classmethod
+    def get_counters(cls, keys, fields):
+        """
+        return {field: count} for each key, or None if the key is not cached
+        """
+        conn = RedisClient.get_connection()
+        pipe = conn.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, fields)
+        results = []
+        for values in pipe.execute():
+            if any(value is None for value in values):
+                results.append(None)
+                continue
+            results.append({
+                field: int(value)
+                for field, value in zip(fields, values)
+            })
+        return results
+
+    @classmethod
+    def init_counters(cls, key_to_counts, pending_key, include_flushing=True):
+        """
+        key_to_counts is {key: {field: (count, pending_field)}}, cache each
+        count plus the pending delta of its pending_field and return
+        {key: {field: cached count}}. include_flushing is False if the deltas
+        being flushed are in the counts already.
+        """
+        if not key_to_counts:
+            return {}
+        keys = list(key_to_counts)
+        fields = list(key_to_counts[keys[0]])
+        args = [len(fields), int(include_flushing), settings.REDIS_KEY_EXPIRE_TIME]
+        for key in keys:
+            for field in fields:
+                count, pending_field = key_to_counts[key][field]
+                args.extend([field, count, pending_field])
+
+        conn = RedisClient.get_connection()
+        script = conn.register_script(INIT_COUNTERS_SCRIPT)
+        values = iter(script(
+            keys=[pending_key, cls.get_flushing_key(pending_key)] + keys,
+            args=args,
+        ))
+        return {
+            key: {field: int(next(values)) for field in fields}
+            for key in keys
+        }
+
+    @classmethod
+    def get_pending_counts(cls, pending_key, pending_fields):
+        """
+        the deltas not in the database yet, including the ones being flushed
+        """
+        conn = RedisClient.get_connection()
+        pipe = conn.pipeline(transaction=False)
+        pipe.hmget(pending_key, pending_fields)
+        pipe.hmget(cls.get_flushing_key(pending_key), pending_fields)
+        pending_values, flushing_values = pipe.execute()
+        return [
+            int(pending or 0) + int(flushing or 0)
+            for pending, flushing in zip(pending_values, flushing_values)
+        ]
+
+    @classmethod
+    def get_generation_key(cls, pending_key):
+        return '{}:generation'.format(pending_key)
+
+    @classmethod
+    def get_flushing_generation(cls, pending_key):
+        """
+        the generation of the deltas being flushed, None if there is none
+        """
+        conn = RedisClient.get_connection()
+        generation = conn.get(cls.get_generation_key(pending_key))
+        return generation.decode() if generation is not None else None
+
+    @classmethod
+    def pop_pending_counts(cls, pending_key):
+        """
+        return (generation, {pending_field: delta}), generation is None if
+        there is nothing to flush. call ack_pending_counts with the
+        generation once the deltas are saved to the database.
+        """
+        conn = RedisClient.get_connection()
+        script = conn.register_script(POP_PENDING_COUNTS_SCRIPT)
+        result = script(
+            keys=[
+                pending_key,
+                cls.get_flushing_key(pending_key),
+                cls.get_generation_key(pending_key),
+            ],
+            args=[uuid.uuid4().hex],
+        )
+        if not result:
+            return None, {}
+        generation, values = result
+        return generation.decode(), {
+            values[i].decode(): int(values[i + 1])
+            for i in range(0, len(values), 2)
+        }
+
+    @classmethod
+    def ack_pending_counts(cls, pending_key, generation):
+        conn = RedisClient.get_connection()
+        script = conn.register_script(ACK_PENDING_COUNTS_SCRIPT)
+        script(
+            keys=[cls.get_flushing_key(pending_key), cls.get_generation_key(pending_key)],
+            args=[generation],
+        )
+
+    @classmethod
+    def acquire_lock(cls, key, timeout, blocking_timeout=0):
+        """
+        return the token to release the lock with, or None if the lock is
+        still held by someone else after waiting blocking_timeout seconds
+        """
+        conn = RedisClient.get_connection()
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + blocking_timeout
+        while not conn.set(key, token, nx=True, ex=timeout):
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(LOCK_RETRY_INTERVAL)
+        return token
+
+    @classmethod
+    def release_lock(cls, key, token):
+        conn = RedisClient.get_connection()
+        script = conn.register_script(RELEASE_LOCK_SCRIPT)
+        script(keys=[key], args=[token])
+
+    @classmethod
+    def add_value(cls, key, value, timeout):
+        """
+        set the value only if the key doesn't exist, return if it was set
+        """
+        conn = RedisClient.get_connection()
+        return bool(conn.set(key, value, nx=True, ex=timeout))
+
+    @classmethod
+    def replace_value(cls, key, value, timeout):
+        """
+        set the value and return the previous one at once, so the first of
+        several rapid writes can tell it is the first
+        """
+        conn = RedisClient.get_connection()
+        return conn.set(key, value, ex=timeout, get=True)
+
+    @classmethod
+    def pop_value(cls, key):
+        # a write in between is never lost
+        conn = RedisClient.get_connection()
+        return conn.getdel(key)
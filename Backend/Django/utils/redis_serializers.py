@@ -0,0 +1,14 @@
+from django.core import serializers
+from utils.json_encoder import JSONEncoder
+
+
+class DjangoModelSerializer:
+
+    @classmethod
+    def serialize(cls, instance):
+        # django serializers only accept a queryset or a list
+        return serializers.serialize('json', [instance], cls=JSONEncoder)
+
+    @classmethod
+    def deserialize(cls, serialized_data):
+        return list(serializers.deserialize('json', serialized_data))[0].object
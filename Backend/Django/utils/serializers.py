@@ -0,0 +1,15 @@
+from django.db import models
+from rest_framework import serializers
+
+
+class PrefetchListSerializer(serializers.ListSerializer):
+    """
+    give the child serializer a chance to load what the whole page needs in
+    batch (child.prefetch) before the instances are serialized one by one
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        instances = list(iterable)
+        self.child.prefetch(instances)
+        return [self.child.to_representation(item) for item in instances]